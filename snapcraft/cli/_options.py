@@ -96,6 +96,14 @@ _PROVIDER_OPTIONS: List[Dict[str, Any]] = [
         envvar="SNAPCRAFT_OFFLINE",
         supported_providers=["host", "lxd", "managed-host", "multipass"],
     ),
+    dict(
+        param_decls="--parallel-parts",
+        metavar="<count>",
+        type=click.IntRange(min=1),
+        help="Maximum number of parts to pull and build at the same time.",
+        envvar="SNAPCRAFT_PARALLEL_PARTS",
+        supported_providers=["host", "lxd", "managed-host", "multipass"],
+    ),
     dict(
         param_decls="--shell-after",
         is_flag=True,
@@ -417,3 +425,6 @@ def issue_build_provider_warnings(build_provider_flags: Dict[str, str]) -> None:
 
     if build_provider_flags.get("SNAPCRAFT_OFFLINE"):
         warning("*EXPERIMENTAL* --offline enabled.")
+
+    if build_provider_flags.get("SNAPCRAFT_PARALLEL_PARTS"):
+        warning("*EXPERIMENTAL* --parallel-parts enabled.")
@@ -67,12 +67,19 @@ def _execute(  # noqa: C901
     shell_after: bool = False,
     setup_prime_try: bool = False,
     ua_token: Optional[str] = None,
+    watch: bool = False,
     **kwargs,
 ) -> "Project":
     # Cleanup any previous errors.
     _clean_provider_error()
 
     build_provider = get_build_provider(**kwargs)
+    # Changes to sources cannot be watched for from within the build
+    # environment.
+    if watch and build_provider not in ["host", "managed-host"]:
+        raise click.BadOptionUsage(
+            "--watch", "--watch can only be used with --destructive-mode"
+        )
     build_provider_flags = get_build_provider_flags(
         build_provider, ua_token=ua_token, **kwargs
     )
@@ -98,6 +105,16 @@ def _execute(  # noqa: C901
 
     if build_provider in ["host", "managed-host"]:
         with ua_manager.ua_manager(ua_token):
+            if watch:
+                lifecycle.watch(
+                    step,
+                    lambda: project_loader.load_config(
+                        get_project(is_managed_host=is_managed_host, **kwargs)
+                    ),
+                    parts,
+                )
+                return project
+
             project_config = project_loader.load_config(project)
             lifecycle.execute(step, project_config, parts)
             if pack_project:
@@ -269,6 +286,13 @@ def _retrieve_provider_error(instance) -> None:
         logger.debug("can't retrieve error file: {}", str(e))
 
 
+_watch_option = click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running, updating parts whenever their local sources change.",
+)
+
+
 @click.group()
 @add_provider_options()
 @click.pass_context
@@ -290,6 +314,7 @@ def init():
 @lifecyclecli.command()
 @click.pass_context
 @add_provider_options()
+@_watch_option
 @click.argument("parts", nargs=-1, metavar="<part>...", required=False)
 def pull(ctx, parts, **kwargs):
     """Download or retrieve artifacts defined for a part.
@@ -305,6 +330,7 @@ def pull(ctx, parts, **kwargs):
 
 @lifecyclecli.command()
 @add_provider_options()
+@_watch_option
 @click.argument("parts", nargs=-1, metavar="<part>...", required=False)
 def build(parts, **kwargs):
     """Build artifacts defined for a part.
@@ -320,6 +346,7 @@ def build(parts, **kwargs):
 
 @lifecyclecli.command()
 @add_provider_options()
+@_watch_option
 @click.argument("parts", nargs=-1, metavar="<part>...", required=False)
 def stage(parts, **kwargs):
     """Stage the part's built artifacts into the common staging area.
@@ -335,6 +362,7 @@ def stage(parts, **kwargs):
 
 @lifecyclecli.command()
 @add_provider_options()
+@_watch_option
 @click.argument("parts", nargs=-1, metavar="<part>...", required=False)
 def prime(parts, **kwargs):
     """Final copy and preparation for the snap.
@@ -14,7 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import errno
+import fcntl
 import hashlib
 import logging
 import os
@@ -24,14 +26,31 @@ import shutil
 import stat
 import subprocess
 import sys
+import tempfile
+import threading
 from contextlib import contextmanager, suppress
-from typing import Callable, Generator, List, Optional, Pattern, Set
+from typing import Callable, Dict, Generator, List, Optional, Pattern, Set, Tuple
 
 from snapcraft.internal import common, errors
 
 
 logger = logging.getLogger(__name__)
 
+# From <linux/fs.h>.
+_FICLONE = 0x40049409
+
+# Errors meaning a copy method is not supported between two filesystems,
+# as opposed to the copy itself failing.
+_UNSUPPORTED_COPY_ERRNOS = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+}
+
 
 def replace_in_file(
     directory: str, file_pattern: Pattern, search_pattern: Pattern, replacement: str
@@ -110,6 +129,32 @@ def link_or_copy(source: str, destination: str, follow_symlinks: bool = False) -
             copy(source, destination, follow_symlinks=follow_symlinks)
 
 
+def break_hard_link(path: str) -> None:
+    """Give the file at path its own copy of its contents, if hard-linked.
+
+    Files are hard-linked across the steps of parts, so they must be
+    unlinked from the others before being changed in place.
+
+    Only regular files are copied, anything else is left as is.
+
+    :param str path: The file to be changed in place.
+    """
+    path_stat = os.stat(path, follow_symlinks=False)
+    if not stat.S_ISREG(path_stat.st_mode) or path_stat.st_nlink <= 1:
+        return
+
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), prefix=".", delete=False
+    ) as temp_file:
+        temp_path = temp_file.name
+    try:
+        shutil.copy2(path, temp_path)
+        os.replace(temp_path, path)
+    except OSError:
+        os.unlink(temp_path)
+        raise
+
+
 def link(source: str, destination: str, *, follow_symlinks: bool = False) -> None:
     """Hard-link source and destination files.
 
@@ -155,8 +200,18 @@ def copy(source: str, destination: str, *, follow_symlinks: bool = False) -> Non
     with suppress(OSError):
         os.unlink(destination)
 
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+
     try:
-        shutil.copy2(source, destination, follow_symlinks=follow_symlinks)
+        # Symlinks and special files are better left to shutil.
+        if (not follow_symlinks and os.path.islink(source)) or not os.path.isfile(
+            source
+        ):
+            shutil.copy2(source, destination, follow_symlinks=follow_symlinks)
+        else:
+            copy_file_data(source, destination)
+            shutil.copystat(source, destination)
     except FileNotFoundError:
         raise errors.SnapcraftCopyFileNotFoundError(source)
     uid = os.stat(source, follow_symlinks=follow_symlinks).st_uid
@@ -171,6 +226,124 @@ def copy(source: str, destination: str, *, follow_symlinks: bool = False) -> Non
         )
 
 
+def copy_file_data(source: str, destination: str) -> None:
+    """Copy the contents of file source into destination.
+
+    The fastest method supported between the filesystems involved is used,
+    trying in order:
+
+    - reflink: share the data of source (copy-on-write), e.g. on btrfs
+      or XFS.
+    - copy_file_range: copy the data in the kernel, which some filesystems
+      (e.g. NFS) can offload to the server.
+    - sendfile: copy the data in the kernel.
+    - buffered: copy the data by reading and writing it.
+
+    The methods that fail to work between two filesystems are remembered,
+    so they are not tried again. Setting SNAPCRAFT_COPY_METHOD to one of
+    the methods above makes it the only one tried before falling back to a
+    buffered copy.
+
+    :param str source: The file to copy.
+    :param str destination: The file to create or overwrite.
+    """
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        source_fd = source_file.fileno()
+        dest_fd = dest_file.fileno()
+        source_stat = os.fstat(source_fd)
+        devices = (source_stat.st_dev, os.fstat(dest_fd).st_dev)
+
+        # Files in pseudo filesystems (e.g. /proc) report a size of 0, but
+        # still have contents.
+        methods = ["buffered"]
+        if source_stat.st_size > 0:
+            methods = _get_copy_methods(devices)
+
+        for method in methods:
+            try:
+                _COPY_METHODS[method](source_fd, dest_fd)
+                return
+            except OSError as error:
+                if error.errno not in _UNSUPPORTED_COPY_ERRNOS:
+                    raise
+                logger.debug(
+                    f"Copy method {method!r} not supported copying {source!r} "
+                    f"to {destination!r}: {error!s}"
+                )
+                _drop_copy_method(devices, method)
+                os.lseek(source_fd, 0, os.SEEK_SET)
+                os.lseek(dest_fd, 0, os.SEEK_SET)
+                os.ftruncate(dest_fd, 0)
+
+
+def _copy_reflink(source_fd: int, dest_fd: int) -> None:
+    fcntl.ioctl(dest_fd, _FICLONE, source_fd)
+
+
+def _copy_file_range(source_fd: int, dest_fd: int) -> None:
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+
+    _copy_in_kernel(lambda: copy_file_range(source_fd, dest_fd, 2 ** 30))
+
+
+def _copy_sendfile(source_fd: int, dest_fd: int) -> None:
+    _copy_in_kernel(lambda: os.sendfile(dest_fd, source_fd, None, 2 ** 30))
+
+
+def _copy_in_kernel(copy_chunk: Callable[[], int]) -> None:
+    copied = copy_chunk()
+    # Some filesystems report success without copying anything.
+    if copied == 0:
+        raise OSError(errno.ENOSYS, "no data copied")
+    while copied > 0:
+        copied = copy_chunk()
+
+
+def _copy_buffered(source_fd: int, dest_fd: int) -> None:
+    with open(source_fd, "rb", closefd=False) as source_file, open(
+        dest_fd, "wb", closefd=False
+    ) as dest_file:
+        shutil.copyfileobj(source_file, dest_file, 2 ** 20)
+
+
+_COPY_METHODS: Dict[str, Callable[[int, int], None]] = {
+    "reflink": _copy_reflink,
+    "copy_file_range": _copy_file_range,
+    "sendfile": _copy_sendfile,
+    "buffered": _copy_buffered,
+}
+_supported_copy_methods: Dict[Tuple[int, int], List[str]] = dict()
+_supported_copy_methods_lock = threading.Lock()
+
+
+def _get_copy_methods(devices: Tuple[int, int]) -> List[str]:
+    with _supported_copy_methods_lock:
+        if devices not in _supported_copy_methods:
+            selected_method = os.getenv("SNAPCRAFT_COPY_METHOD")
+            if not selected_method:
+                methods = list(_COPY_METHODS)
+            elif selected_method in _COPY_METHODS:
+                methods = [selected_method, "buffered"]
+            else:
+                raise errors.SnapcraftEnvironmentError(
+                    "SNAPCRAFT_COPY_METHOD must be one of {}, got {!r}".format(
+                        ", ".join(_COPY_METHODS), selected_method
+                    )
+                )
+            _supported_copy_methods[devices] = methods
+        return list(_supported_copy_methods[devices])
+
+
+def _drop_copy_method(devices: Tuple[int, int], method: str) -> None:
+    # A buffered copy always works, so it is never dropped.
+    with _supported_copy_methods_lock:
+        methods = _supported_copy_methods[devices]
+        if method in methods and method != "buffered":
+            methods.remove(method)
+
+
 def link_or_copy_tree(
     source_tree: str,
     destination_tree: str,
@@ -179,6 +352,10 @@ def link_or_copy_tree(
 ) -> None:
     """Copy a source tree into a destination, hard-linking if possible.
 
+    All the directories are created first, while walking the source tree,
+    then files are copied from a pool of threads, so copy_function must be
+    safe to call concurrently for different files.
+
     :param str source_tree: Source directory to be copied.
     :param str destination_tree: Destination directory. If this directory
                                  already exists, the files in `source_tree`
@@ -203,46 +380,132 @@ def link_or_copy_tree(
         )
 
     create_similar_directory(source_tree, destination_tree)
+    files = _create_similar_tree(source_tree, destination_tree, ignore)
 
-    destination_basename = os.path.basename(destination_tree)
-
-    for root, directories, files in os.walk(source_tree, topdown=True):
-        ignored: Set[str] = set()
-        if ignore is not None:
-            ignored = set(ignore(root, directories + files))
-
-        # Don't recurse into destination tree if it's a subdirectory of the
-        # source tree.
-        if os.path.relpath(destination_tree, root) == destination_basename:
-            ignored.add(destination_basename)
-
-        if ignored:
-            # Prune our search appropriately given an ignore list, i.e. don't
-            # walk into directories that are ignored.
-            directories[:] = [d for d in directories if d not in ignored]
-
-        for directory in directories:
-            source = os.path.join(root, directory)
-            # os.walk doesn't by default follow symlinks (which is good), but
-            # it includes symlinks that are pointing to directories in the
-            # directories list. We want to treat it as a file, here.
-            if os.path.islink(source):
-                files.append(directory)
-                continue
-
-            destination = os.path.join(
-                destination_tree, os.path.relpath(source, source_tree)
-            )
+    if copy_function is link_or_copy:
+        _copy_tree_files(files, _link_or_copy_tree_file)
+    else:
+        _copy_tree_files(files, lambda s, d, _: copy_function(s, d))
 
-            create_similar_directory(source, destination)
 
-        for file_name in set(files) - ignored:
-            source = os.path.join(root, file_name)
-            destination = os.path.join(
-                destination_tree, os.path.relpath(source, source_tree)
-            )
+# (source, destination, whether source is a regular file)
+_TreeFile = Tuple[str, str, bool]
+
+# Trees with fewer files are not worth starting threads for.
+_TREE_THREADING_THRESHOLD = 64
+_TREE_CHUNK_SIZE = 256
 
-            copy_function(source, destination)
+
+def _create_similar_tree(
+    source_tree: str,
+    destination_tree: str,
+    ignore: Optional[Callable[[str, List[str]], List[str]]],
+) -> List[_TreeFile]:
+    """Create the directories of source_tree in destination_tree.
+
+    :returns: the files in source_tree to copy.
+    """
+    # Don't recurse into destination tree if it's a subdirectory of the
+    # source tree.
+    destination_parent, destination_basename = os.path.split(
+        os.path.abspath(destination_tree)
+    )
+
+    files: List[_TreeFile] = []
+    pending = [(source_tree, destination_tree)]
+    while pending:
+        source_dir, destination_dir = pending.pop()
+        skip = None
+        if os.path.abspath(source_dir) == destination_parent:
+            skip = destination_basename
+
+        for entry in _scan_tree_directory(source_dir, ignore, skip):
+            destination = os.path.join(destination_dir, entry.name)
+            # Symlinks to directories are copied as they are, like files.
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    os.mkdir(destination)
+                except FileExistsError:
+                    if not os.path.isdir(destination):
+                        raise
+                _copy_directory_metadata(
+                    entry.path, destination, entry.stat(follow_symlinks=False)
+                )
+                pending.append((entry.path, destination))
+            else:
+                files.append(
+                    (entry.path, destination, entry.is_file(follow_symlinks=False))
+                )
+
+    return files
+
+
+def _scan_tree_directory(
+    directory: str,
+    ignore: Optional[Callable[[str, List[str]], List[str]]],
+    skip: Optional[str],
+) -> List[os.DirEntry]:
+    try:
+        with os.scandir(directory) as iterator:
+            entries = list(iterator)
+    except OSError:
+        # Unreadable directories are skipped, as os.walk would.
+        return []
+
+    # Symlinks to directories are listed along with directories, as os.walk
+    # does, as ignore callables may rely on it.
+    directories = []
+    others = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        (directories if is_dir else others).append(entry)
+    entries = directories + others
+
+    ignored: Set[str] = set()
+    if ignore is not None:
+        ignored = set(ignore(directory, [e.name for e in entries]))
+    if skip is not None:
+        ignored.add(skip)
+
+    return [e for e in entries if e.name not in ignored]
+
+
+def _copy_tree_files(
+    files: List[_TreeFile], copy_function: Callable[[str, str, bool], None]
+) -> None:
+    def copy_chunk(chunk: List[_TreeFile]) -> None:
+        for source, destination, is_file in chunk:
+            copy_function(source, destination, is_file)
+
+    if len(files) < _TREE_THREADING_THRESHOLD:
+        copy_chunk(files)
+        return
+
+    # Copying is mostly spent waiting on system calls, which release the GIL.
+    chunks = [
+        files[i : i + _TREE_CHUNK_SIZE] for i in range(0, len(files), _TREE_CHUNK_SIZE)
+    ]
+    max_workers = min(32, (os.cpu_count() or 1) + 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Consume the results to raise the first error found.
+        for _ in executor.map(copy_chunk, chunks):
+            pass
+
+
+def _link_or_copy_tree_file(source: str, destination: str, is_file: bool) -> None:
+    # The destination directory is known to exist and so is the type of
+    # source, so regular files can be linked without checking either first.
+    if is_file:
+        try:
+            os.link(source, destination, follow_symlinks=False)
+            return
+        except OSError:
+            pass
+
+    link_or_copy(source, destination)
 
 
 def create_similar_directory(source: str, destination: str) -> None:
@@ -255,17 +518,22 @@ def create_similar_directory(source: str, destination: str) -> None:
     """
 
     stat = os.stat(source, follow_symlinks=False)
-    uid = stat.st_uid
-    gid = stat.st_gid
     os.makedirs(destination, exist_ok=True)
+    _copy_directory_metadata(source, destination, stat)
+
 
+def _copy_directory_metadata(
+    source: str, destination: str, source_stat: os.stat_result
+) -> None:
     # Windows does not have "os.chown" implementation and copystat
     # is unlikely to be useful, so just bail after creating directory.
     if sys.platform == "win32":
         return
 
     try:
-        os.chown(destination, uid, gid, follow_symlinks=False)
+        os.chown(
+            destination, source_stat.st_uid, source_stat.st_gid, follow_symlinks=False
+        )
     except PermissionError as exception:
         logger.debug("Unable to chown {}: {}".format(destination, exception))
 
@@ -16,5 +16,6 @@
 
 from ._apt import AptStagePackageCache  # noqa
 from ._cache import SnapcraftCache  # noqa
+from ._elf import ElfAttributesCache, SonameIndexCache  # noqa
 from ._file import FileCache  # noqa
 from ._snap import SnapCache  # noqa
@@ -0,0 +1,210 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ._cache import SnapcraftCache
+
+logger = logging.getLogger(__name__)
+
+# Attributes of files modified this recently are not kept, as a rewrite
+# within the timestamp granularity of the filesystem could go unnoticed.
+_RACY_INTERVAL_NS = 2 * 10 ** 9
+
+
+def get_file_signature(file_stat: os.stat_result) -> str:
+    """Return the signature of a file, which changes whenever it does."""
+    return "{}:{}:{}:{}".format(
+        file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns
+    )
+
+
+class ElfAttributesCache(SnapcraftCache):
+    """Cache of the attributes extracted from ELF files.
+
+    The attributes are kept by the signature of the files (device, inode,
+    size and modification time), so they are shared by all the parts and
+    runs reading the same files. Only the most recently used entries are
+    kept.
+    """
+
+    def __init__(self, *, version: int, max_entries: int = 50000) -> None:
+        """Create an ElfAttributesCache.
+
+        :param version: the version of the attributes, entries of other
+                        versions are discarded.
+        :param max_entries: the number of entries to keep.
+        """
+        super().__init__()
+        self.cache_file = os.path.join(self.cache_root, "elf", "attributes.json")
+        self.hits = 0
+        self.misses = 0
+        self._version = version
+        self._max_entries = max_entries
+        self._entries: Optional[Dict[str, Any]] = None
+        self._used: Dict[str, Any] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def has(self, file_stat: os.stat_result) -> bool:
+        """Tell whether the attributes of the file with file_stat are cached."""
+        with self._lock:
+            return get_file_signature(file_stat) in self._load()
+
+    def get(self, file_stat: os.stat_result) -> Optional[Any]:
+        """Return the attributes of the file with file_stat, if cached."""
+        signature = get_file_signature(file_stat)
+        with self._lock:
+            attributes = self._load().get(signature)
+            if attributes is not None:
+                self.hits += 1
+                self._used[signature] = attributes
+        return attributes
+
+    def add(self, file_stat: os.stat_result, attributes: Any) -> None:
+        """Cache the attributes read from the file with file_stat."""
+        signature = get_file_signature(file_stat)
+        with self._lock:
+            self.misses += 1
+            if file_stat.st_mtime_ns >= time.time() * 10 ** 9 - _RACY_INTERVAL_NS:
+                return
+            self._load()[signature] = attributes
+            self._used[signature] = attributes
+
+    def save(self) -> None:
+        """Write the entries used since the last save to the cache."""
+        with self._lock:
+            if not self._used:
+                return
+
+            logger.debug(
+                "ELF attributes cache: {} hits, {} misses".format(
+                    self.hits, self.misses
+                )
+            )
+
+            # Merge with entries saved by others in the meantime, moving
+            # the entries used to the end.
+            entries = self._read()
+            for signature, attributes in self._used.items():
+                entries.pop(signature, None)
+                entries[signature] = attributes
+            while len(entries) > self._max_entries:
+                entries.popitem(last=False)
+
+            try:
+                _write_json(
+                    self.cache_file, {"version": self._version, "entries": entries}
+                )
+            except OSError as error:
+                logger.debug(
+                    "Unable to save the ELF attributes cache: {}".format(error)
+                )
+                return
+
+            self._entries = entries
+            self._used.clear()
+
+    def _load(self) -> Dict[str, Any]:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _read(self) -> "collections.OrderedDict[str, Any]":
+        try:
+            with open(self.cache_file) as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return collections.OrderedDict()
+
+        if not isinstance(data, dict) or data.get("version") != self._version:
+            return collections.OrderedDict()
+        return collections.OrderedDict(data.get("entries", {}))
+
+
+class SonameIndexCache(SnapcraftCache):
+    """Cache of the libraries found in the directories of installed snaps.
+
+    The snaps are read-only, so what is found in a directory only changes
+    with the revision of the snap. Only the index of the latest revision
+    indexed is kept for each snap.
+    """
+
+    def __init__(self, *, version: int) -> None:
+        """Create a SonameIndexCache.
+
+        :param version: the version of the indexes, those of other versions
+                        are discarded.
+        """
+        super().__init__()
+        self.cache_dir = os.path.join(self.cache_root, "elf", "sonames")
+        self._version = version
+
+    def get(self, snap_name: str, revision: str, directory: str) -> Optional[Any]:
+        """Return the index of directory in revision of snap_name, if cached."""
+        return self._read(snap_name, revision).get(directory)
+
+    def add(self, snap_name: str, revision: str, directory: str, index: Any) -> None:
+        """Cache the index of directory in revision of snap_name."""
+        indexes = self._read(snap_name, revision)
+        indexes[directory] = index
+
+        cache_file = self._get_cache_file(snap_name, revision)
+        try:
+            _write_json(cache_file, {"version": self._version, "directories": indexes})
+            # Drop the indexes of the other revisions.
+            for other_file in glob.glob(
+                os.path.join(os.path.dirname(cache_file), "*.json")
+            ):
+                if other_file != cache_file:
+                    os.unlink(other_file)
+        except OSError as error:
+            logger.debug("Unable to save the soname index: {}".format(error))
+
+    def _get_cache_file(self, snap_name: str, revision: str) -> str:
+        return os.path.join(self.cache_dir, snap_name, "{}.json".format(revision))
+
+    def _read(self, snap_name: str, revision: str) -> Dict[str, Any]:
+        try:
+            with open(self._get_cache_file(snap_name, revision)) as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return dict()
+
+        if not isinstance(data, dict) or data.get("version") != self._version:
+            return dict()
+        return data.get("directories", {})
+
+
+def _write_json(path: str, data: Any) -> None:
+    """Write data to path, replacing it all at once."""
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+    try:
+        with open(fd, "w") as temp_file:
+            json.dump(data, temp_file)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
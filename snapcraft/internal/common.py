@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Data/methods shared between plugins and snapcraft
+import distutils.util
 import glob
 import logging
 import math
@@ -171,6 +172,44 @@ def is_offline() -> bool:
     return os.getenv("SNAPCRAFT_OFFLINE") is not None
 
 
+def get_parallel_parts_count() -> int:
+    """Return the maximum number of parts to run at the same time."""
+    return _get_count_from_env("SNAPCRAFT_PARALLEL_PARTS", default=1)
+
+
+def get_elf_workers_count() -> int:
+    """Return the number of workers to find and inspect ELF files with."""
+    return _get_count_from_env("SNAPCRAFT_ELF_WORKERS", default=os.cpu_count() or 1)
+
+
+def get_file_workers_count() -> int:
+    """Return the number of workers to scan and rewrite staged files with."""
+    return _get_count_from_env("SNAPCRAFT_FILE_WORKERS", default=os.cpu_count() or 1)
+
+
+def is_elf_ldd_verification_enabled() -> bool:
+    """Return whether the libraries of ELF files are to be checked with ldd."""
+    return distutils.util.strtobool(os.getenv("SNAPCRAFT_ELF_VERIFY_LDD", "n")) == 1
+
+
+def _get_count_from_env(name: str, *, default: int) -> int:
+    value = os.getenv(name)
+    if not value:
+        return default
+
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+
+    if count < 1:
+        raise errors.SnapcraftEnvironmentError(
+            "{} must be a positive integer, got {!r}".format(name, value)
+        )
+
+    return count
+
+
 def is_snap() -> bool:
     snap_name = os.environ.get("SNAP_NAME", "")
     is_snap = snap_name == "snapcraft"
@@ -13,6 +13,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import concurrent.futures
 import contextlib
 import functools
 import glob
@@ -21,9 +22,22 @@ import os
 import pathlib
 import re
 import shutil
+import stat
 import subprocess
 import tempfile
-from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple, Union
+import threading
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 import elftools.common.exceptions
 import elftools.elf.elffile
@@ -31,9 +45,11 @@ from elftools.construct import ConstructError
 from pkg_resources import parse_version
 
 from snapcraft import file_utils
-from snapcraft.internal import common, errors, repo
+from snapcraft.internal import cache, common, errors, repo
 from snapcraft.project._project_options import ProjectOptions
 
+from . import _reader, _resolver
+
 logger = logging.getLogger(__name__)
 
 
@@ -300,6 +316,16 @@ class Library:
             return self.soname_path
 
         for path in valid_search_paths:
+            # Look up installed snaps in their index, rather than walking
+            # them again.
+            soname_index = _get_soname_index(path)
+            if soname_index is not None:
+                file_path = soname_index.get((self.arch, self.soname))
+                if file_path is not None:
+                    self._update_soname_cache(file_path)
+                    return file_path
+                continue
+
             for root, directories, files in os.walk(path):
                 if self.soname not in files:
                     continue
@@ -314,6 +340,83 @@ class Library:
         return self.soname_path
 
 
+# The version of the indexes kept in the soname index cache, to be bumped
+# whenever what they hold changes.
+_SONAME_INDEX_VERSION = 1
+
+# The directory installed snaps are mounted in.
+_SNAP_MOUNT_DIR = "/snap"
+
+_SonameIndex = Dict[Tuple[ElfArchitectureTuple, str], str]
+_soname_indexes: Dict[Tuple[str, str], _SonameIndex] = dict()
+
+
+def _get_soname_index(path: str) -> Optional[_SonameIndex]:
+    """Return the paths to the libraries in path by architecture and soname.
+
+    Only the directories of installed snaps, which cannot change, are
+    indexed, once for each revision of the snap. None is returned for other
+    directories.
+    """
+    snap_revision = _get_snap_revision(path)
+    if snap_revision is None:
+        return None
+
+    key = (path, snap_revision[1])
+    if key not in _soname_indexes:
+        soname_index_cache = cache.SonameIndexCache(version=_SONAME_INDEX_VERSION)
+        entries = soname_index_cache.get(*snap_revision)
+        if entries is None:
+            logger.debug("Indexing the libraries in {!r}".format(path))
+            entries = _index_sonames(path)
+            soname_index_cache.add(*snap_revision, entries)
+
+        _soname_indexes[key] = {
+            (tuple(arch), soname): os.path.join(path, relative_path)  # type: ignore
+            for arch, soname, relative_path in entries
+        }
+
+    return _soname_indexes[key]
+
+
+def _get_snap_revision(path: str) -> Optional[Tuple[str, str, str]]:
+    """Return the snap name, revision and directory within it of path.
+
+    None is returned if path is not within the current revision of an
+    installed snap.
+    """
+    relative_path = os.path.relpath(path, _SNAP_MOUNT_DIR)
+    parts = relative_path.split(os.sep)
+    if len(parts) < 2 or parts[0] == os.pardir or parts[1] != "current":
+        return None
+
+    try:
+        revision = os.readlink(os.path.join(_SNAP_MOUNT_DIR, parts[0], "current"))
+    except OSError:
+        return None
+    return parts[0], revision, os.path.join(*parts[2:]) if parts[2:] else ""
+
+
+def _index_sonames(path: str) -> List[Tuple[ElfArchitectureTuple, str, str]]:
+    """Return the ELF files in path, as Library would find them walking it."""
+    entries = list()
+    found: Set[Tuple[ElfArchitectureTuple, str]] = set()
+    for root, directories, files in os.walk(path):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            elf_file = _load_library(file_path)
+            if elf_file is None or elf_file.arch is None:
+                continue
+
+            # The first file found with a name is the one used.
+            if (elf_file.arch, file_name) not in found:
+                found.add((elf_file.arch, file_name))
+                entries.append(
+                    (elf_file.arch, file_name, os.path.relpath(file_path, path))
+                )
+    return entries
+
+
 # Old versions of pyelftools return bytes rather than strings for
 # certain APIs.  So we pass those values through this function to get
 # a consistent result.
@@ -324,6 +427,36 @@ def _ensure_str(s):
     return s
 
 
+# The version of the attributes kept in the ELF attributes cache, to be
+# bumped whenever the attributes extracted change.
+_ATTRIBUTES_CACHE_VERSION = 3
+
+_attributes_cache: Optional[Tuple[int, cache.ElfAttributesCache]] = None
+_attributes_cache_lock = threading.Lock()
+
+
+def _get_attributes_cache() -> Optional[cache.ElfAttributesCache]:
+    """Return the cache of ELF attributes of this process.
+
+    Worker processes do not use the cache of the process they were forked
+    from, leaving it to that process to add what they read.
+    """
+    global _attributes_cache
+
+    with _attributes_cache_lock:
+        if _attributes_cache is not None:
+            pid, attributes_cache = _attributes_cache
+            if pid != os.getpid():
+                return None
+            # The cache directory changes in tests.
+            if attributes_cache.cache_root == cache.SnapcraftCache().cache_root:
+                return attributes_cache
+
+        attributes_cache = cache.ElfAttributesCache(version=_ATTRIBUTES_CACHE_VERSION)
+        _attributes_cache = (os.getpid(), attributes_cache)
+        return attributes_cache
+
+
 class ElfFile:
     """ElfFile represents and elf file on a path and its attributes."""
 
@@ -332,8 +465,12 @@ class ElfFile:
         if not os.path.isfile(path):
             # ELF binaries are regular files
             return False
-        with open(path, "rb") as bin_file:
-            return bin_file.read(4) == b"\x7fELF"
+        # Read the magic bytes without the overhead of a buffered file.
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return os.read(fd, 4) == b"\x7fELF"
+        finally:
+            os.close(fd)
 
     def __init__(self, *, path: str) -> None:
         """Initialize an ElfFile instance.
@@ -346,9 +483,14 @@ class ElfFile:
         self.arch: Optional[ElfArchitectureTuple] = None
         self.interp: str = ""
         self.soname: str = ""
+        # The library search paths set in the dynamic section.
+        self.rpath: str = ""
+        self.runpath: str = ""
         self.versions: Set[str] = set()
         self.needed: Dict[str, NeededLibrary] = dict()
         self.execstack_set: bool = False
+        # The offset of the program header making the stack executable.
+        self.execstack_offset: Optional[int] = None
         self.is_dynamic: bool = True
         self.build_id: str = ""
         self.has_debug_info: bool = False
@@ -363,7 +505,78 @@ class ElfFile:
             logger.debug(f"Extracting ELF attributes exception: {str(exception)}")
             raise errors.CorruptedElfFileError(path, exception)
 
-    def _extract_attributes(self) -> None:  # noqa: C901
+    def _extract_attributes(self) -> None:
+        attributes_cache = _get_attributes_cache()
+        if attributes_cache is None:
+            self._read_attributes()
+            return
+
+        file_stat = os.stat(self.path)
+        cached_attributes = attributes_cache.get(file_stat)
+        if cached_attributes is not None:
+            self._set_cached_attributes(cached_attributes)
+        else:
+            self._read_attributes()
+            attributes_cache.add(file_stat, self._get_cached_attributes())
+
+    def _get_cached_attributes(self) -> Dict[str, Any]:
+        return {
+            "arch": self.arch,
+            "interp": self.interp,
+            "soname": self.soname,
+            "rpath": self.rpath,
+            "runpath": self.runpath,
+            "versions": sorted(self.versions),
+            "needed": {
+                name: sorted(library.versions) for name, library in self.needed.items()
+            },
+            "execstack_set": self.execstack_set,
+            "execstack_offset": self.execstack_offset,
+            "build_id": self.build_id,
+            "has_debug_info": self.has_debug_info,
+            "elf_type": self.elf_type,
+        }
+
+    def _set_cached_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.arch = tuple(attributes["arch"])  # type: ignore
+        self.interp = attributes["interp"]
+        self.soname = attributes["soname"]
+        self.rpath = attributes["rpath"]
+        self.runpath = attributes["runpath"]
+        self.versions = set(attributes["versions"])
+        for name, versions in attributes["needed"].items():
+            self.needed[name] = NeededLibrary(name=name)
+            self.needed[name].versions = set(versions)
+        self.execstack_set = attributes["execstack_set"]
+        self.execstack_offset = attributes["execstack_offset"]
+        self.build_id = attributes["build_id"]
+        self.has_debug_info = attributes["has_debug_info"]
+        self.elf_type = attributes["elf_type"]
+
+    def _read_attributes(self) -> None:
+        try:
+            attributes = _reader.read_attributes(self.path)
+        except _reader.UnsupportedLayout:
+            logger.debug(f"Extracting ELF attributes with pyelftools: {self.path}")
+            self._extract_attributes_with_pyelftools()
+            return
+
+        self.arch = attributes.arch  # type: ignore
+        self.interp = attributes.interp
+        self.soname = attributes.soname
+        self.rpath = attributes.rpath
+        self.runpath = attributes.runpath
+        self.versions = attributes.versions
+        for name, versions in attributes.needed.items():
+            self.needed[name] = NeededLibrary(name=name)
+            self.needed[name].versions = versions
+        self.execstack_set = attributes.execstack_set
+        self.execstack_offset = attributes.execstack_offset
+        self.build_id = attributes.build_id
+        self.has_debug_info = attributes.has_debug_info
+        self.elf_type = attributes.elf_type  # type: ignore
+
+    def _extract_attributes_with_pyelftools(self) -> None:  # noqa: C901
         with open(self.path, "rb") as fp:
             elf = elftools.elf.elffile.ELFFile(fp)
 
@@ -393,14 +606,24 @@ class ElfFile:
                         self.needed[needed] = NeededLibrary(name=needed)
                     elif tag.entry.d_tag == "DT_SONAME":
                         self.soname = _ensure_str(tag.soname)
+                    elif tag.entry.d_tag == "DT_RPATH":
+                        self.rpath = _ensure_str(tag.rpath)
+                    elif tag.entry.d_tag == "DT_RUNPATH":
+                        self.runpath = _ensure_str(tag.runpath)
 
-            for segment in elf.iter_segments():
+            for index, segment in enumerate(elf.iter_segments()):
                 if segment["p_type"] == "PT_GNU_STACK":
                     # p_flags holds the bit mask for this segment.
                     # See `man 5 elf`.
                     mode = segment["p_flags"]
-                    if mode & elftools.elf.constants.P_FLAGS.PF_X:
+                    if (
+                        mode & elftools.elf.constants.P_FLAGS.PF_X
+                        and not self.execstack_set
+                    ):
                         self.execstack_set = True
+                        self.execstack_offset = (
+                            elf.header.e_phoff + index * elf.header.e_phentsize
+                        )
                 elif isinstance(segment, elftools.elf.segments.InterpSegment):
                     self.interp = segment.get_interp_name()
 
@@ -443,6 +666,36 @@ class ElfFile:
 
             self.elf_type = elf.header["e_type"]
 
+    def clear_execstack(self) -> None:
+        """Clear the flag making the stack of the ELF file executable.
+
+        The flag is cleared in place, after breaking any hard link to the
+        file so that the files it was migrated from are left alone.
+
+        :raises errors.CorruptedElfFileError: if the flag cannot be cleared.
+        """
+        if not self.execstack_set:
+            return
+
+        try:
+            if self.execstack_offset is None:
+                raise _reader.UnsupportedLayout("PT_GNU_STACK not found")
+            file_utils.break_hard_link(self.path)
+            file_stat = os.stat(self.path)
+            if file_stat.st_mode & stat.S_IWUSR:
+                _reader.clear_execstack(self.path, self.execstack_offset)
+            else:
+                os.chmod(self.path, file_stat.st_mode | stat.S_IWUSR)
+                try:
+                    _reader.clear_execstack(self.path, self.execstack_offset)
+                finally:
+                    os.chmod(self.path, file_stat.st_mode)
+        except (OSError, _reader.UnsupportedLayout) as error:
+            raise errors.CorruptedElfFileError(self.path, error)
+
+        self.execstack_set = False
+        self.execstack_offset = None
+
     def is_linker_compatible(self, *, linker_version: str) -> bool:
         """Determines if linker will work given the required glibc version."""
         version_required = self.get_required_glibc()
@@ -479,6 +732,8 @@ class ElfFile:
         content_dirs: Set[str],
         arch_triplet: str,
         soname_cache: SonameCache = None,
+        *,
+        libraries: Optional[Dict[str, str]] = None,
     ) -> Set[str]:
         """Load the set of libraries that are needed to satisfy elf's runtime.
 
@@ -490,6 +745,8 @@ class ElfFile:
                                    dependencies.
         :param SonameCache soname_cache: a cache of previously search
                                          dependencies.
+        :param libraries: the paths to the libraries elf loads by soname,
+                          if already known.
         :returns: a set of string with paths to the library dependencies of
                   elf.
         """
@@ -498,17 +755,13 @@ class ElfFile:
 
         logger.debug("Getting dependencies for {!r}".format(self.path))
 
-        search_paths = [root_path, *content_dirs]
-        if core_base_path is not None:
-            search_paths.append(core_base_path)
-
-        ld_library_paths: List[str] = list()
-        for path in search_paths:
-            ld_library_paths.extend(common.get_library_paths(path, arch_triplet))
-
-        libraries = _determine_libraries(
-            path=self.path, ld_library_paths=ld_library_paths
-        )
+        search_paths = _get_search_paths(root_path, core_base_path, content_dirs)
+        if libraries is None:
+            (libraries,) = _find_libraries(
+                [self],
+                ld_library_paths=_get_ld_library_paths(search_paths, arch_triplet),
+                arch_triplet=arch_triplet,
+            )
         for soname, soname_path in libraries.items():
             if self.arch is None:
                 raise RuntimeError("failed to parse architecture")
@@ -532,6 +785,136 @@ class ElfFile:
         return dependencies
 
 
+def _get_search_paths(
+    root_path: str, core_base_path: Optional[str], content_dirs: Set[str]
+) -> List[str]:
+    search_paths = [root_path, *content_dirs]
+    if core_base_path is not None:
+        search_paths.append(core_base_path)
+    return search_paths
+
+
+def _get_ld_library_paths(search_paths: List[str], arch_triplet: str) -> List[str]:
+    ld_library_paths: List[str] = list()
+    for path in search_paths:
+        ld_library_paths.extend(common.get_library_paths(path, arch_triplet))
+    return ld_library_paths
+
+
+def load_dependencies(
+    elf_files: Iterable[ElfFile],
+    *,
+    root_path: str,
+    core_base_path: Optional[str],
+    content_dirs: Set[str],
+    arch_triplet: str,
+    soname_cache: SonameCache,
+    workers: Optional[int] = None,
+) -> Set[str]:
+    """Load the dependencies of all of elf_files.
+
+    The libraries are resolved one ELF file after the other, ordered by
+    path, so that soname_cache is filled the same way on every run.
+
+    :param workers: the number of ldd processes to run at the same time
+                    when verifying the libraries found, from the
+                    environment if None.
+    :returns: the paths to the library dependencies of all of elf_files.
+    """
+    ordered_elf_files = sorted(elf_files, key=lambda e: e.path)
+    all_libraries = _find_libraries(
+        ordered_elf_files,
+        ld_library_paths=_get_ld_library_paths(
+            _get_search_paths(root_path, core_base_path, content_dirs), arch_triplet
+        ),
+        arch_triplet=arch_triplet,
+        workers=workers,
+    )
+
+    dependencies: Set[str] = set()
+    for elf_file, libraries in zip(ordered_elf_files, all_libraries):
+        dependencies.update(
+            elf_file.load_dependencies(
+                root_path=root_path,
+                core_base_path=core_base_path,
+                content_dirs=content_dirs,
+                arch_triplet=arch_triplet,
+                soname_cache=soname_cache,
+                libraries=libraries,
+            )
+        )
+
+    # Save what was read while looking for the libraries.
+    attributes_cache = _get_attributes_cache()
+    if attributes_cache is not None:
+        attributes_cache.save()
+
+    return dependencies
+
+
+def _find_libraries(
+    elf_files: List[ElfFile],
+    *,
+    ld_library_paths: List[str],
+    arch_triplet: str,
+    workers: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """Return the paths to the libraries each of elf_files loads, by soname.
+
+    The libraries are searched for the way the dynamic linker does, without
+    running it. With SNAPCRAFT_ELF_VERIFY_LDD set, they are also determined
+    with ldd, which has the last word, and any difference is logged.
+    """
+    resolver = _resolver.LibraryResolver(
+        ld_library_paths=ld_library_paths,
+        arch_triplet=arch_triplet,
+        load=_load_library,
+    )
+    all_libraries = [resolver.resolve(e) for e in elf_files]
+    if not common.is_elf_ldd_verification_enabled():
+        return all_libraries
+
+    if workers is None:
+        workers = common.get_elf_workers_count()
+
+    def determine_libraries(elf_file: ElfFile) -> Dict[str, str]:
+        return _determine_libraries(
+            path=elf_file.path, ld_library_paths=ld_library_paths
+        )
+
+    if workers > 1 and len(elf_files) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            ldd_libraries = list(executor.map(determine_libraries, elf_files))
+    else:
+        ldd_libraries = [determine_libraries(e) for e in elf_files]
+
+    for elf_file, libraries, expected in zip(elf_files, all_libraries, ldd_libraries):
+        differences = [
+            "{}: {!r} instead of {!r}".format(
+                soname, libraries.get(soname), expected.get(soname)
+            )
+            for soname in sorted(libraries.keys() | expected.keys())
+            if libraries.get(soname) != expected.get(soname)
+        ]
+        if differences:
+            logger.warning(
+                "Libraries found for {!r} differ from ldd: {}".format(
+                    elf_file.path, ", ".join(differences)
+                )
+            )
+    return ldd_libraries
+
+
+def _load_library(path: str) -> Optional[ElfFile]:
+    if not ElfFile.is_elf(path):
+        return None
+
+    try:
+        return ElfFile(path=path)
+    except (elftools.common.exceptions.ELFError, errors.CorruptedElfFileError):
+        return None
+
+
 class Patcher:
     """Patcher holds the necessary logic to patch elf files."""
 
@@ -557,7 +940,7 @@ class Patcher:
 
         self._strip_cmd = file_utils.get_snap_tool_path("strip")
 
-    def patch(self, *, elf_file: ElfFile) -> None:
+    def patch(self, *, elf_file: ElfFile) -> bool:
         """Patch elf_file with the Patcher instance configuration.
 
         If the ELF is executable, patch it to use the configured linker.
@@ -565,34 +948,59 @@ class Patcher:
 
         :param ElfFile elf: a data object representing an elf file and its
                             relevant attributes.
+        :returns: False if elf_file was already patched, True otherwise.
         :raises snapcraft.internal.errors.PatcherError:
             raised when the elf_file cannot be patched.
         """
-        patchelf_args = []
-        if elf_file.interp:
+        patchelf_calls = self.get_patchelf_calls(elf_file=elf_file)
+
+        # no patchelf_calls means there is nothing to do.
+        if not patchelf_calls:
+            return False
+
+        self._run_patchelf(patchelf_calls=patchelf_calls, elf_file_path=elf_file.path)
+
+        # Keep elf_file up to date with what was patched.
+        for patchelf_args in patchelf_calls:
+            if "--set-interpreter" in patchelf_args:
+                elf_file.interp = self._dynamic_linker
+            if "--set-rpath" in patchelf_args:
+                elf_file.rpath = patchelf_args[-1]
+                elf_file.runpath = ""
+        return True
+
+    def get_patchelf_calls(self, *, elf_file: ElfFile) -> List[List[str]]:
+        """Return the arguments of the patchelf calls elf_file needs.
+
+        What is already set in elf_file is left alone, so that there are
+        no calls for files that are already patched.
+        """
+        patchelf_calls: List[List[str]] = list()
+        patchelf_args: List[str] = list()
+        if elf_file.interp and elf_file.interp != self._dynamic_linker:
             patchelf_args.extend(["--set-interpreter", self._dynamic_linker])
         if elf_file.dependencies:
             rpath = self._get_rpath(elf_file)
-            # Due to https://github.com/NixOS/patchelf/issues/94 we need
-            # to first clear the current rpath
-            self._run_patchelf(
-                patchelf_args=["--remove-rpath"], elf_file_path=elf_file.path
-            )
-            # Parameters:
-            # --force-rpath: use RPATH instead of RUNPATH.
-            # --shrink-rpath: will remove unneeded entries, with the
-            #                 side effect of preferring host libraries
-            #                 so we simply do not use it.
-            # --set-rpath: set the RPATH to the colon separated argument.
-            patchelf_args.extend(["--force-rpath", "--set-rpath", rpath])
-
-        # no patchelf_args means there is nothing to do.
-        if not patchelf_args:
-            return
-
-        self._run_patchelf(patchelf_args=patchelf_args, elf_file_path=elf_file.path)
-
-    def _run_patchelf(self, *, patchelf_args: List[str], elf_file_path: str) -> None:
+            if elf_file.runpath or elf_file.rpath != rpath:
+                # Due to https://github.com/NixOS/patchelf/issues/94 we need
+                # to first clear the current rpath
+                if elf_file.runpath or elf_file.rpath:
+                    patchelf_calls.append(["--remove-rpath"])
+                # Parameters:
+                # --force-rpath: use RPATH instead of RUNPATH.
+                # --shrink-rpath: will remove unneeded entries, with the
+                #                 side effect of preferring host libraries
+                #                 so we simply do not use it.
+                # --set-rpath: set the RPATH to the colon separated argument.
+                patchelf_args.extend(["--force-rpath", "--set-rpath", rpath])
+
+        if patchelf_args:
+            patchelf_calls.append(patchelf_args)
+        return patchelf_calls
+
+    def _run_patchelf(
+        self, *, patchelf_calls: List[List[str]], elf_file_path: str
+    ) -> None:
         # Run patchelf on a copy of the primed file and replace it
         # after it is successful. This allows us to break the potential
         # hard link created when migrating the file across the steps of
@@ -600,32 +1008,31 @@ class Patcher:
         with tempfile.NamedTemporaryFile() as temp_file:
             shutil.copy2(elf_file_path, temp_file.name)
 
-            cmd = [self._patchelf_cmd] + patchelf_args + [temp_file.name]
-            try:
-                logger.debug("executing: %s", " ".join(cmd))
-                subprocess.check_call(cmd)
-            # There is no need to catch FileNotFoundError as patchelf should be
-            # bundled with snapcraft which means its lack of existence is a
-            # "packager" error.
-            except subprocess.CalledProcessError as call_error:
-                raise errors.PatcherGenericError(
-                    elf_file=elf_file_path, process_exception=call_error
-                )
+            for patchelf_args in patchelf_calls:
+                cmd = [self._patchelf_cmd] + patchelf_args + [temp_file.name]
+                try:
+                    logger.debug("executing: %s", " ".join(cmd))
+                    subprocess.check_call(cmd)
+                # There is no need to catch FileNotFoundError as patchelf
+                # should be bundled with snapcraft which means its lack of
+                # existence is a "packager" error.
+                except subprocess.CalledProcessError as call_error:
+                    raise errors.PatcherGenericError(
+                        elf_file=elf_file_path, process_exception=call_error
+                    )
 
             # We unlink to break the potential hard link
             os.unlink(elf_file_path)
             shutil.copy2(temp_file.name, elf_file_path)
 
-    def _get_existing_rpath(self, elf_file_path):
-        output = subprocess.check_output(
-            [self._patchelf_cmd, "--print-rpath", elf_file_path]
-        )
-        return output.decode().strip().split(":")
+    def _get_existing_rpath(self, elf_file: ElfFile) -> List[str]:
+        # As patchelf --print-rpath, prefer DT_RUNPATH to DT_RPATH.
+        return (elf_file.runpath or elf_file.rpath).split(":")
 
     def _get_rpath(self, elf_file) -> str:
         origin_rpaths = list()  # type: List[str]
         base_rpaths = set()  # type: Set[str]
-        existing_rpaths = self._get_existing_rpath(elf_file.path)
+        existing_rpaths = self._get_existing_rpath(elf_file)
 
         for dependency in elf_file.dependencies:
             if dependency.path:
@@ -703,16 +1110,68 @@ def _extract_ld_library_paths(ld_conf_file: str) -> List[str]:
 _libraries = None
 
 
-def get_elf_files(root: str, file_list: Sequence[str]) -> FrozenSet[ElfFile]:
+# Below this many candidate files, starting worker processes takes longer
+# than inspecting the files.
+_ELF_PROCESSES_THRESHOLD = 32
+
+# An ElfFile or the warning to log about it.
+_InspectResult = Tuple[Optional[ElfFile], Optional[str]]
+
+
+def get_elf_files(
+    root: str, file_list: Sequence[str], *, workers: Optional[int] = None
+) -> FrozenSet[ElfFile]:
     """Return a frozenset of elf files from file_list prepended with root.
 
+    The files are inspected by a pool of worker processes when there are
+    many of them.
+
     :param str root: the root directory from where the file_list is generated.
     :param file_list: a list of file in root.
+    :param workers: the number of worker processes to inspect the files
+                    with, from the environment if None.
     :returns: a frozentset of ElfFile objects.
     """
+    paths = _get_elf_file_candidates(root, file_list)
+
+    # The worker processes do not use the attributes cache, so the files
+    # found in it are left out from what they inspect.
+    attributes_cache = _get_attributes_cache()
+    uncached_paths = [p for p in paths if not _is_cached(attributes_cache, p)]
+
+    if workers is None:
+        workers = common.get_elf_workers_count()
+    workers = min(workers, len(uncached_paths) // _ELF_PROCESSES_THRESHOLD)
+
+    results: Dict[str, _InspectResult] = dict()
+    if workers > 1:
+        results = _inspect_elf_files_in_workers(uncached_paths, workers)
+        if attributes_cache is not None:
+            _add_to_cache(attributes_cache, results.values())
+
     elf_files = set()  # type: Set[ElfFile]
+    for path in paths:
+        if path not in results:
+            results[path] = _inspect_elf_file(path)
+        elf_file, warning = results[path]
+
+        # Warnings are logged here, in the order of the files, rather than
+        # by the worker processes.
+        if warning is not None:
+            logger.warning(warning)
+        # If ELF has dynamic symbols, add it.
+        elif elf_file is not None and elf_file.needed:
+            elf_files.add(elf_file)
+
+    if attributes_cache is not None:
+        attributes_cache.save()
+
+    return frozenset(elf_files)
 
-    for part_file in file_list:
+
+def _get_elf_file_candidates(root: str, file_list: Sequence[str]) -> List[str]:
+    paths: List[str] = list()
+    for part_file in sorted(file_list):
         # Filter out object (*.o) files-- we only care about binaries.
         if part_file.endswith(".o"):
             continue
@@ -723,25 +1182,62 @@ def get_elf_files(root: str, file_list: Sequence[str]) -> FrozenSet[ElfFile]:
             logger.debug("Skipped link {!r} while finding dependencies".format(path))
             continue
 
-        # Ignore if file does not have ELF header.
-        if not ElfFile.is_elf(path):
-            continue
+        paths.append(path)
+    return paths
 
-        try:
-            elf_file = ElfFile(path=path)
-        except elftools.common.exceptions.ELFError:
-            # Ignore invalid ELF files.
-            continue
-        except errors.CorruptedElfFileError as exception:
-            # Log if the ELF file seems corrupted
-            logger.warning(exception.get_brief())
-            continue
 
-        # If ELF has dynamic symbols, add it.
-        if elf_file.needed:
-            elf_files.add(elf_file)
+def _inspect_elf_files_in_workers(
+    paths: List[str], workers: int
+) -> Dict[str, _InspectResult]:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(
+            zip(
+                paths,
+                executor.map(
+                    _inspect_elf_file,
+                    paths,
+                    chunksize=max(1, len(paths) // (workers * 4)),
+                ),
+            )
+        )
 
-    return frozenset(elf_files)
+
+def _inspect_elf_file(path: str) -> _InspectResult:
+    """Return the ElfFile for path if it is a valid one, or a warning."""
+    # Ignore if file does not have ELF header.
+    if not ElfFile.is_elf(path):
+        return None, None
+
+    try:
+        return ElfFile(path=path), None
+    except elftools.common.exceptions.ELFError:
+        # Ignore invalid ELF files.
+        return None, None
+    except errors.CorruptedElfFileError as exception:
+        # Log if the ELF file seems corrupted
+        return None, exception.get_brief()
+
+
+def _is_cached(attributes_cache: Optional[cache.ElfAttributesCache], path: str) -> bool:
+    if attributes_cache is None:
+        return False
+    try:
+        return attributes_cache.has(os.stat(path))
+    except OSError:
+        return False
+
+
+def _add_to_cache(
+    attributes_cache: cache.ElfAttributesCache,
+    results: Iterable[_InspectResult],
+) -> None:
+    for elf_file, _ in results:
+        if elf_file is None:
+            continue
+        with contextlib.suppress(OSError):
+            attributes_cache.add(
+                os.stat(elf_file.path), elf_file._get_cached_attributes()
+            )
 
 
 def _get_dynamic_linker(library_list: List[str]) -> str:
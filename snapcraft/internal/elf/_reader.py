@@ -0,0 +1,433 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A reader for the few parts of ELF files snapcraft is interested in.
+
+Only the ELF header, the program headers and the dynamic, version, build-id
+and debug info sections are read, straight from a memory map of the file.
+The attributes are the same pyelftools would give, and files laid out in
+ways this reader does not handle are left for pyelftools to read.
+
+The one thing written is the flag of PT_GNU_STACK making the stack
+executable, which is cleared in place.
+"""
+
+import mmap
+import struct
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from elftools.elf.enums import ENUM_E_MACHINE, ENUM_E_TYPE
+
+_ELFCLASS = {1: "ELFCLASS32", 2: "ELFCLASS64"}
+_ELFDATA = {1: "ELFDATA2LSB", 2: "ELFDATA2MSB"}
+# Decoded the way pyelftools does, with unknown values left as integers.
+_E_MACHINE = {v: k for k, v in ENUM_E_MACHINE.items() if k != "_default_"}
+_E_TYPE = {v: k for k, v in ENUM_E_TYPE.items() if k != "_default_"}
+_ET_CORE = 4
+
+_PT_INTERP = 3
+_PT_GNU_STACK = 0x6474E551
+_PF_X = 0x1
+
+_SHT_STRTAB = 3
+_SHT_DYNAMIC = 6
+_SHT_NOTE = 7
+_SHT_NOBITS = 8
+_SHT_GNU_VERDEF = 0x6FFFFFFD
+_SHT_GNU_VERNEED = 0x6FFFFFFE
+
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_SONAME = 14
+_DT_RPATH = 15
+_DT_RUNPATH = 29
+
+_NT_GNU_BUILD_ID = 3
+
+
+class UnsupportedLayout(Exception):
+    """The file is not laid out in a way the reader handles."""
+
+
+class ElfAttributes:
+    """The attributes of an ELF file, as ElfFile holds them."""
+
+    def __init__(self) -> None:
+        self.arch: Tuple[str, str, Union[str, int]] = ("", "", "")
+        self.interp = ""
+        self.soname = ""
+        self.rpath = ""
+        self.runpath = ""
+        self.versions: Set[str] = set()
+        # The versions needed from each library, by library name.
+        self.needed: Dict[str, Set[str]] = dict()
+        self.execstack_set = False
+        # The offset of the PT_GNU_STACK program header making the stack
+        # executable.
+        self.execstack_offset: Optional[int] = None
+        self.build_id = ""
+        self.has_debug_info = False
+        self.elf_type: Union[str, int] = "ET_NONE"
+
+
+class _Section:
+    def __init__(self, header: Tuple[int, ...]) -> None:
+        (
+            self.name_offset,
+            self.type,
+            _,  # sh_flags
+            _,  # sh_addr
+            self.offset,
+            self.size,
+            self.link,
+            self.info,
+            _,  # sh_addralign
+            _,  # sh_entsize
+        ) = header
+        self.name = b""
+
+
+class _Structs:
+    def __init__(self, elfclass: int, byte_order: str) -> None:
+        if elfclass == 1:
+            self.header = struct.Struct(byte_order + "HHIIIIIHHHHHH")
+            self.program_header = struct.Struct(byte_order + "IIIIIIII")
+            self.section_header = struct.Struct(byte_order + "IIIIIIIIII")
+            self.dyn = struct.Struct(byte_order + "iI")
+        else:
+            self.header = struct.Struct(byte_order + "HHIQQQIHHHHHH")
+            self.program_header = struct.Struct(byte_order + "IIQQQQQQ")
+            self.section_header = struct.Struct(byte_order + "IIQQQQIIQQ")
+            self.dyn = struct.Struct(byte_order + "qQ")
+        self.elfclass = elfclass
+        self.verneed = struct.Struct(byte_order + "HHIII")
+        self.vernaux = struct.Struct(byte_order + "IHHII")
+        self.verdef = struct.Struct(byte_order + "HHHHIII")
+        self.verdaux = struct.Struct(byte_order + "II")
+        self.nhdr = struct.Struct(byte_order + "III")
+
+
+_STRUCTS = {
+    (elfclass, data): _Structs(elfclass, byte_order)
+    for elfclass in _ELFCLASS
+    for data, byte_order in ((1, "<"), (2, ">"))
+}
+
+
+def read_attributes(path: str) -> ElfAttributes:
+    """Read the attributes of the ELF file at path.
+
+    :raises UnsupportedLayout: if the file is not laid out in a way the
+                               reader handles.
+    """
+    with open(path, "rb") as elf_file:
+        try:
+            data = mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            raise UnsupportedLayout()
+
+    try:
+        return _Reader(data).read()
+    except (struct.error, IndexError, OverflowError, UnicodeDecodeError) as error:
+        raise UnsupportedLayout() from error
+    finally:
+        data.close()
+
+
+def clear_execstack(path: str, offset: int) -> None:
+    """Clear PF_X in the PT_GNU_STACK program header at offset, in place.
+
+    :raises UnsupportedLayout: if there is no PT_GNU_STACK program header
+                               at offset in the ELF file at path.
+    """
+    with open(path, "r+b") as elf_file:
+        try:
+            data = mmap.mmap(elf_file.fileno(), 0)
+        except ValueError:
+            # Empty files cannot be mapped.
+            raise UnsupportedLayout()
+
+    try:
+        _clear_execstack(data, offset)
+        data.flush()
+    except (struct.error, OverflowError) as error:
+        raise UnsupportedLayout() from error
+    finally:
+        data.close()
+
+
+def _clear_execstack(data: mmap.mmap, offset: int) -> None:
+    structs = _STRUCTS.get((data[4], data[5]))
+    if data[:4] != b"\x7fELF" or structs is None:
+        raise UnsupportedLayout()
+
+    header = list(structs.program_header.unpack_from(data, offset))
+    # p_flags comes after p_offset and the addresses in 32-bit files.
+    flags_index = 6 if structs.elfclass == 1 else 1
+    if header[0] != _PT_GNU_STACK:
+        raise UnsupportedLayout()
+
+    header[flags_index] &= ~_PF_X
+    structs.program_header.pack_into(data, offset, *header)
+
+
+class _Reader:
+    def __init__(self, data: mmap.mmap) -> None:
+        self._data = data
+
+        if data[:4] != b"\x7fELF":
+            raise UnsupportedLayout()
+        structs = _STRUCTS.get((data[4], data[5]))
+        if structs is None:
+            raise UnsupportedLayout()
+        self._structs = structs
+        self._elfclass = _ELFCLASS[data[4]]
+        self._elfdata = _ELFDATA[data[5]]
+
+        (
+            self._e_type,
+            self._e_machine,
+            _,  # e_version
+            _,  # e_entry
+            self._e_phoff,
+            self._e_shoff,
+            _,  # e_flags
+            _,  # e_ehsize
+            self._e_phentsize,
+            self._e_phnum,
+            self._e_shentsize,
+            self._e_shnum,
+            self._e_shstrndx,
+        ) = structs.header.unpack_from(data, 16)
+
+        # Notes of core files are typed differently, and extended section
+        # and segment numbering is unusual enough to leave to pyelftools.
+        if (
+            self._e_type == _ET_CORE
+            or self._e_phnum == 0xFFFF
+            or (self._e_shoff != 0 and self._e_shnum == 0)
+            or self._e_shstrndx >= 0xFF00
+        ):
+            raise UnsupportedLayout()
+
+    def read(self) -> ElfAttributes:
+        attributes = ElfAttributes()
+        attributes.arch = (
+            self._elfclass,
+            self._elfdata,
+            _E_MACHINE.get(self._e_machine, self._e_machine),
+        )
+        attributes.elf_type = _E_TYPE.get(self._e_type, self._e_type)
+
+        self._read_segments(attributes)
+
+        sections = self._get_sections()
+        for section in sections:
+            if section.type == _SHT_DYNAMIC:
+                self._read_dynamic(sections, section, attributes)
+
+        # Like pyelftools, the last section of a given name is the one used.
+        by_name = {section.name: section for section in sections}
+
+        build_id_section = by_name.get(b".note.gnu.build-id")
+        if build_id_section is not None and build_id_section.type == _SHT_NOTE:
+            for name, note_type, desc in self._iter_notes(build_id_section):
+                if name == b"GNU" and note_type == _NT_GNU_BUILD_ID:
+                    attributes.build_id = desc.hex()
+
+        verneed_section = by_name.get(b".gnu.version_r")
+        if verneed_section is not None and verneed_section.type == _SHT_GNU_VERNEED:
+            self._read_verneed(sections, verneed_section, attributes)
+
+        verdef_section = by_name.get(b".gnu.version_d")
+        if verdef_section is not None and verdef_section.type == _SHT_GNU_VERDEF:
+            self._read_verdef(sections, verdef_section, attributes)
+
+        debug_info_section = by_name.get(b".debug_info")
+        attributes.has_debug_info = (
+            debug_info_section is not None and debug_info_section.type != _SHT_NOBITS
+        )
+
+        return attributes
+
+    def _read_segments(self, attributes: ElfAttributes) -> None:
+        program_header = self._structs.program_header
+        if self._e_phnum and self._e_phentsize < program_header.size:
+            raise UnsupportedLayout()
+
+        for index in range(self._e_phnum):
+            header = program_header.unpack_from(
+                self._data, self._e_phoff + index * self._e_phentsize
+            )
+            if self._structs.elfclass == 1:
+                p_type, p_offset, p_flags = header[0], header[1], header[6]
+            else:
+                p_type, p_flags, p_offset = header[0], header[1], header[2]
+
+            if p_type == _PT_GNU_STACK:
+                if p_flags & _PF_X and not attributes.execstack_set:
+                    attributes.execstack_set = True
+                    attributes.execstack_offset = (
+                        self._e_phoff + index * self._e_phentsize
+                    )
+            elif p_type == _PT_INTERP:
+                attributes.interp = self._get_cstring(p_offset).decode()
+
+    def _get_sections(self) -> List[_Section]:
+        if self._e_shoff == 0:
+            return []
+
+        section_header = self._structs.section_header
+        if self._e_shentsize < section_header.size:
+            raise UnsupportedLayout()
+
+        sections = [
+            _Section(
+                section_header.unpack_from(
+                    self._data, self._e_shoff + index * self._e_shentsize
+                )
+            )
+            for index in range(self._e_shnum)
+        ]
+        # Truncated files are left for pyelftools to report.
+        for section in sections:
+            if section.type != _SHT_NOBITS and section.offset + section.size > len(
+                self._data
+            ):
+                raise UnsupportedLayout()
+
+        string_table = sections[self._e_shstrndx]
+        for section in sections:
+            section.name = self._get_cstring(string_table.offset + section.name_offset)
+        return sections
+
+    def _read_dynamic(
+        self, sections: List[_Section], section: _Section, attributes: ElfAttributes
+    ) -> None:
+        string_table = self._get_string_table(sections, section)
+        dyn = self._structs.dyn
+        for offset in range(section.offset, section.offset + section.size, dyn.size):
+            d_tag, d_val = dyn.unpack_from(self._data, offset)
+            if d_tag == _DT_NULL:
+                return
+            elif d_tag == _DT_NEEDED:
+                needed = self._get_string(string_table, d_val)
+                attributes.needed[needed] = set()
+            elif d_tag == _DT_SONAME:
+                attributes.soname = self._get_string(string_table, d_val)
+            elif d_tag == _DT_RPATH:
+                attributes.rpath = self._get_string(string_table, d_val)
+            elif d_tag == _DT_RUNPATH:
+                attributes.runpath = self._get_string(string_table, d_val)
+
+        # pyelftools reads on until it finds DT_NULL.
+        raise UnsupportedLayout()
+
+    def _read_verneed(
+        self, sections: List[_Section], section: _Section, attributes: ElfAttributes
+    ) -> None:
+        string_table = self._get_string_table(sections, section)
+        verneed = self._structs.verneed
+        vernaux = self._structs.vernaux
+
+        offset = section.offset
+        for _ in range(section.info):
+            _, vn_cnt, vn_file, vn_aux, vn_next = verneed.unpack_from(
+                self._data, offset
+            )
+            if vn_cnt == 0:
+                raise UnsupportedLayout()
+
+            # If the ELF file only references weak symbols from a library,
+            # it may be absent from DT_NEEDED but still have an entry for
+            # symbol versions.
+            versions = attributes.needed.get(self._get_string(string_table, vn_file))
+            aux_offset = offset + vn_aux
+            for _ in range(vn_cnt):
+                _, _, _, vna_name, vna_next = vernaux.unpack_from(
+                    self._data, aux_offset
+                )
+                if versions is not None:
+                    versions.add(self._get_string(string_table, vna_name))
+                aux_offset += vna_next
+            offset += vn_next
+
+    def _read_verdef(
+        self, sections: List[_Section], section: _Section, attributes: ElfAttributes
+    ) -> None:
+        string_table = self._get_string_table(sections, section)
+        verdef = self._structs.verdef
+        verdaux = self._structs.verdaux
+
+        offset = section.offset
+        for _ in range(section.info):
+            _, _, _, vd_cnt, _, vd_aux, vd_next = verdef.unpack_from(self._data, offset)
+            if vd_cnt == 0:
+                raise UnsupportedLayout()
+
+            aux_offset = offset + vd_aux
+            for _ in range(vd_cnt):
+                vda_name, vda_next = verdaux.unpack_from(self._data, aux_offset)
+                attributes.versions.add(self._get_string(string_table, vda_name))
+                aux_offset += vda_next
+            offset += vd_next
+
+    def _iter_notes(self, section: _Section) -> Iterator[Tuple[bytes, int, bytes]]:
+        nhdr = self._structs.nhdr
+        offset = section.offset
+        end = section.offset + section.size
+        while offset < end:
+            n_namesz, n_descsz, n_type = nhdr.unpack_from(self._data, offset)
+            offset += nhdr.size
+            name = self._get_cstring(offset, offset + n_namesz)
+            offset += _align4(n_namesz)
+            desc = self._data[offset : offset + n_descsz]
+            if len(desc) != n_descsz:
+                raise UnsupportedLayout()
+            offset += _align4(n_descsz)
+            yield name, n_type, desc
+
+    def _get_string_table(
+        self, sections: List[_Section], section: _Section
+    ) -> _Section:
+        # Tables without a linked string table are unusual enough to be
+        # left to pyelftools, which looks for one in other places.
+        if section.link == 0 or sections[section.link].type != _SHT_STRTAB:
+            raise UnsupportedLayout()
+        return sections[section.link]
+
+    def _get_string(self, string_table: _Section, offset: int) -> str:
+        return self._get_cstring(string_table.offset + offset).decode(
+            "utf-8", errors="replace"
+        )
+
+    def _get_cstring(self, offset: int, end: Optional[int] = None) -> bytes:
+        if offset >= len(self._data):
+            raise UnsupportedLayout()
+        if end is None:
+            end = self._data.find(b"\0", offset)
+            if end == -1:
+                raise UnsupportedLayout()
+        else:
+            nul = self._data.find(b"\0", offset, end)
+            if nul != -1:
+                end = nul
+        return self._data[offset:end]
+
+
+def _align4(size: int) -> int:
+    return (size + 3) & ~3
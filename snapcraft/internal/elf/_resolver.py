@@ -0,0 +1,219 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Find the libraries ELF files load the way the dynamic linker does."""
+
+import collections
+import glob
+import logging
+import os
+import re
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from . import ElfFile  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# The dynamic linker is loaded before anything else, and ldd does not list
+# it as a library.
+_DYNAMIC_LINKER_PATTERN = re.compile(r"ld(64)?[-.]")
+
+_ORIGIN_PATTERN = re.compile(r"\$(ORIGIN|{ORIGIN})")
+_LIB_PATTERN = re.compile(r"\$(LIB|{LIB})")
+
+
+def read_ld_so_conf(path: str) -> List[str]:
+    """Return the library directories configured in the ld.so.conf at path.
+
+    Files included from path are read too, as ldconfig does.
+    """
+    return _read_ld_so_conf(path, set())
+
+
+def _read_ld_so_conf(path: str, seen: Set[str]) -> List[str]:
+    if path in seen:
+        return []
+    seen.add(path)
+
+    try:
+        with open(path) as ld_so_conf:
+            lines = ld_so_conf.readlines()
+    except OSError:
+        return []
+
+    directories: List[str] = list()
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line.startswith("include") and line[7:8].isspace():
+            for pattern in line[8:].split():
+                if not os.path.isabs(pattern):
+                    pattern = os.path.join(os.path.dirname(path), pattern)
+                for included_path in sorted(glob.glob(pattern)):
+                    directories.extend(_read_ld_so_conf(included_path, seen))
+        elif line and not line.startswith("hwcap"):
+            # Directories can be colon, space, tab or comma separated.
+            directories.extend(d for d in re.split(r"[:\s,]", line) if d)
+    return directories
+
+
+class LibraryResolver:
+    """Find the libraries ELF files load, without running the dynamic linker.
+
+    The libraries needed by an ELF file, and those needed by these in
+    turn, are searched for in the same order as ld.so does:
+
+    - the DT_RPATH of the object needing them and of the objects that
+      loaded it, unless the object needing them has a DT_RUNPATH,
+    - ld_library_paths, as if set in LD_LIBRARY_PATH,
+    - the DT_RUNPATH of the object needing them,
+    - the directories in ld.so.conf,
+    - the default system directories.
+
+    The results of searching each list of directories are kept, so that
+    the many ELF files of a snap share what was found for one another.
+    """
+
+    def __init__(
+        self,
+        *,
+        ld_library_paths: List[str],
+        arch_triplet: str,
+        load: Callable[[str], Optional["ElfFile"]],
+        ld_so_conf_path: str = "/etc/ld.so.conf",
+    ) -> None:
+        """Create a LibraryResolver.
+
+        :param ld_library_paths: the directories to search before the
+                                 DT_RUNPATH of the ELF files.
+        :param arch_triplet: the architecture triplet of the ELF files, used
+                             for the default directories and $LIB.
+        :param load: return the ElfFile for a path, None if it is not a
+                     valid ELF file.
+        :param ld_so_conf_path: the ld.so.conf listing the directories to
+                                search after the DT_RUNPATH.
+        """
+        self._ld_library_paths = tuple(ld_library_paths)
+        self._arch_triplet = arch_triplet
+        self._load = load
+        self._system_paths = tuple(
+            read_ld_so_conf(ld_so_conf_path)
+            + [
+                os.path.join("/lib", arch_triplet),
+                os.path.join("/usr/lib", arch_triplet),
+                "/lib",
+                "/usr/lib",
+            ]
+        )
+
+        self._elf_files: Dict[str, Optional["ElfFile"]] = dict()
+        self._found: Dict[Tuple[Tuple[str, ...], str, Tuple], Optional[str]] = dict()
+
+    def resolve(self, elf_file: "ElfFile") -> Dict[str, str]:
+        """Return the paths to the libraries elf_file loads, by soname.
+
+        As with ldd, libraries that cannot be found map to their soname.
+        """
+        libraries: Dict[str, str] = dict()
+
+        # The objects loaded, each with the DT_RPATH directories of the
+        # objects that loaded it, in the breadth-first order of ld.so.
+        queue = collections.deque([(elf_file, ())])  # type: ignore
+        while queue:
+            loaded, loader_rpaths = queue.popleft()
+            rpaths = self._expand(loaded.rpath, loaded.path) + loader_rpaths
+
+            for soname in loaded.needed:
+                if soname in libraries or _DYNAMIC_LINKER_PATTERN.match(soname):
+                    continue
+
+                path = self._find(soname, loaded, rpaths)
+                if path is None:
+                    libraries[soname] = soname
+                    continue
+
+                libraries[soname] = path
+                queue.append((self._elf_files[path], rpaths))
+
+        return libraries
+
+    def _find(
+        self, soname: str, loaded: "ElfFile", rpaths: Tuple[str, ...]
+    ) -> Optional[str]:
+        # A name with a slash is a path rather than a name to search for.
+        if "/" in soname:
+            return self._find_in(
+                (os.path.dirname(soname),), os.path.basename(soname), loaded.arch
+            )
+
+        if loaded.runpath:
+            search_paths = [
+                self._ld_library_paths,
+                self._expand(loaded.runpath, loaded.path),
+                self._system_paths,
+            ]
+        else:
+            search_paths = [rpaths, self._ld_library_paths, self._system_paths]
+
+        for paths in search_paths:
+            path = self._find_in(paths, soname, loaded.arch)
+            if path is not None:
+                return path
+        return None
+
+    def _find_in(
+        self, paths: Tuple[str, ...], soname: str, arch: Optional[Tuple]
+    ) -> Optional[str]:
+        key = (paths, soname, arch)
+        if key not in self._found:
+            self._found[key] = self._search(paths, soname, arch)
+        return self._found[key]
+
+    def _search(
+        self, paths: Tuple[str, ...], soname: str, arch: Optional[Tuple]
+    ) -> Optional[str]:
+        for directory in paths:
+            path = os.path.abspath(os.path.join(directory, soname))
+            if not os.path.isfile(path):
+                continue
+
+            if path not in self._elf_files:
+                self._elf_files[path] = self._load(path)
+            candidate = self._elf_files[path]
+
+            # Like ld.so, skip libraries built for another architecture.
+            if candidate is not None and candidate.arch == arch:
+                return path
+        return None
+
+    def _expand(self, search_path: str, path: str) -> Tuple[str, ...]:
+        """Return the directories in search_path, found in the ELF at path."""
+        origin = os.path.dirname(os.path.abspath(path))
+        lib = os.path.join("lib", self._arch_triplet)
+
+        directories: List[str] = list()
+        for directory in search_path.split(":"):
+            if not directory:
+                continue
+            directory = _ORIGIN_PATTERN.sub(lambda m: origin, directory)
+            directory = _LIB_PATTERN.sub(lambda m: lib, directory)
+            if "$" in directory:
+                logger.debug(
+                    "Ignoring {!r} from the search path of {!r}".format(directory, path)
+                )
+                continue
+            directories.append(directory)
+        return tuple(directories)
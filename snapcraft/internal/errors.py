@@ -320,6 +320,40 @@ class SnapcraftPartConflictError(SnapcraftError):
         )
 
 
+class SnapcraftPartConflictsError(SnapcraftError):
+
+    fmt = (
+        "Failed to stage: "
+        "The following parts have files in common, but with different "
+        "contents:\n"
+        "{conflicts}\n\n"
+        "Snapcraft offers some capabilities to solve this by use of the "
+        "following keywords:\n"
+        "    - `filesets`\n"
+        "    - `stage`\n"
+        "    - `snap`\n"
+        "    - `organize`\n\n"
+        "To learn more about these part keywords, run "
+        "`snapcraft help plugins`."
+    )
+
+    def __init__(self, *, conflicts):
+        """
+        :param conflicts: (other_part_name, part_name, conflict_files) of
+                          every pair of parts with conflicting files.
+        """
+        descriptions = []
+        for other_part_name, part_name, conflict_files in conflicts:
+            descriptions.append(
+                "Parts {!r} and {!r}:\n{}".format(
+                    other_part_name,
+                    part_name,
+                    "\n".join(sorted("    {}".format(i) for i in conflict_files)),
+                )
+            )
+        super().__init__(conflicts="\n".join(descriptions))
+
+
 class SnapcraftOrganizeError(SnapcraftError):
 
     fmt = "Failed to organize part {part_name!r}: {message}"
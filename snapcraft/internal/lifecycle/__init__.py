@@ -17,3 +17,4 @@ from ._clean import clean  # noqa: F401
 from ._init import init  # noqa: F401
 from ._runner import execute  # noqa: F401
 from ._status_cache import StatusCache  # noqa: F401
+from ._watch import watch  # noqa: F401
@@ -15,7 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
-from typing import List, Optional, Sequence, Set
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
 from snapcraft import config, plugins, storeapi
 from snapcraft.internal import (
@@ -32,6 +32,7 @@ from snapcraft.internal.pluginhandler._part_environment import (
     get_snapcraft_part_directory_environment,
 )
 
+from ._scheduler import Scheduler
 from ._status_cache import StatusCache
 
 logger = logging.getLogger(__name__)
@@ -98,6 +99,9 @@ def execute(
     step: steps.Step,
     project_config: "project_loader._config.Config",
     part_names: Sequence[str] = None,
+    *,
+    parallel_parts: Optional[int] = None,
+    rerun_requested_step: bool = True,
 ):
     """Execute until step in the lifecycle for part_names or all parts.
 
@@ -113,6 +117,13 @@ def execute(
     :param project_config: Fully loaded project (old logic moving either to
                            Project or the PluginHandler).
     :param list part_names: A list of parts to execute the lifecycle on.
+    :param int parallel_parts: Maximum number of parts to pull or build
+                               concurrently, defaults to the value of
+                               SNAPCRAFT_PARALLEL_PARTS (or 1).
+    :param bool rerun_requested_step: Clean and run step again for the parts
+                                      in part_names that already ran it. If
+                                      False, step only runs again if it is
+                                      dirty or outdated.
     :raises RuntimeError: If a prerequesite of the part needs to be staged
                           and such part is not in the list of parts to iterate
                           over.
@@ -141,9 +152,16 @@ def execute(
         )
     global_state.save(filepath=project_config.project._get_global_state_file_path())
 
-    executor = _Executor(project_config)
-    executor.run(step, part_names)
-    if not executor.steps_were_run:
+    if parallel_parts is None:
+        parallel_parts = common.get_parallel_parts_count()
+
+    executor = _Executor(project_config, parallel_parts=parallel_parts)
+    # Parts share the package caches opened to resolve their packages.
+    with repo.Repo.session():
+        executor.run(step, part_names, rerun_requested_step=rerun_requested_step)
+    # Nothing to do is expected when only running dirty or outdated steps
+    # again, e.g. on every change seen by --watch.
+    if not executor.steps_were_run and rerun_requested_step:
         logger.warning(
             "The requested action has already been taken. Consider\n"
             "specifying parts, or clean the steps you want to run again."
@@ -170,15 +188,20 @@ def _replace_in_part(part):
 
 
 class _Executor:
-    def __init__(self, project_config):
+    def __init__(self, project_config, *, parallel_parts: Optional[int] = None):
         self.config = project_config
         self.project = project_config.project
         self.parts_config = project_config.parts
         self.steps_were_run = False
 
         self._cache = StatusCache(project_config)
+        self._parallel_parts = parallel_parts if parallel_parts else 1
+        self._scheduler: Optional[Scheduler] = None
+        self._collisions_checked = False
 
-    def run(self, step: steps.Step, part_names=None):
+    def run(
+        self, step: steps.Step, part_names=None, *, rerun_requested_step=True
+    ) -> None:
         if part_names:
             self.parts_config.validate(part_names)
             # self.config.all_parts is already ordered, let's not lose that
@@ -189,17 +212,181 @@ class _Executor:
             parts = self.config.all_parts
             processed_part_names = self.config.part_names
 
+        # Only the parts requested here have their step run again.
+        requested_part_names = part_names if rerun_requested_step else None
         with config.CLIConfig() as cli_config:
-            for current_step in step.previous_steps() + [step]:
-                if current_step == steps.STAGE:
-                    # XXX check only for collisions on the parts that have
-                    # already been built --elopio - 20170713
-                    pluginhandler.check_for_collisions(self.config.all_parts)
-                for part in parts:
-                    self._handle_step(part_names, part, step, current_step, cli_config)
+            if self._can_run_parallel():
+                self._run_parallel(step, parts, requested_part_names, cli_config)
+            else:
+                self._run_serial(step, parts, requested_part_names, cli_config)
 
         self._create_meta(step, processed_part_names)
 
+    def _run_serial(self, step, parts, part_names, cli_config) -> None:
+        for current_step in step.previous_steps() + [step]:
+            if current_step == steps.STAGE:
+                # XXX check only for collisions on the parts that have
+                # already been built --elopio - 20170713
+                pluginhandler.check_for_collisions(self.config.all_parts)
+            for part in parts:
+                self._handle_step(part_names, part, step, current_step, cli_config)
+
+    def _can_run_parallel(self) -> bool:
+        # Dependencies pulled in from within a parallel run are always part of
+        # its graph, anything else reaching here is run serially.
+        if self._parallel_parts < 2 or self._scheduler is not None:
+            return False
+
+        # Legacy plugins share their build environment through common.env.
+        if any(
+            isinstance(p.plugin, plugins.v1.PluginV1) for p in self.config.all_parts
+        ):
+            logger.warning(
+                "Parts using legacy plugins cannot be run in parallel, "
+                "running one part at a time."
+            )
+            return False
+
+        return True
+
+    def _get_target_steps(self, step: steps.Step, parts) -> Dict[str, steps.Step]:
+        """Return the last step to run for every part in a parallel run.
+
+        Dependencies of the requested parts (which may not have been
+        requested themselves) need to go all the way to the prerequisite
+        step of the requested one.
+        """
+        target_steps = {p.name: step for p in parts}
+        prerequisite_step = steps.get_dependency_prerequisite_step(step)
+        for part in parts:
+            for dependency in self.parts_config.get_dependencies(
+                part.name, recursive=True
+            ):
+                current_step = target_steps.get(dependency.name)
+                if current_step is None or current_step < prerequisite_step:
+                    target_steps[dependency.name] = prerequisite_step
+
+        return target_steps
+
+    def _run_parallel(self, step, parts, part_names, cli_config) -> None:
+        target_steps = self._get_target_steps(step, parts)
+        # Keep the order from self.config.all_parts.
+        graph_parts = [p for p in self.config.all_parts if p.name in target_steps]
+
+        # A serial run stages a dependency right before building the first
+        # part depending on it, and everything else once all parts have
+        # been built. Keep that barrier so collisions are checked against
+        # the same set of built parts.
+        first_dependent_index = {p.name: len(graph_parts) for p in graph_parts}
+        for index, part in enumerate(graph_parts):
+            for dependency in self.parts_config.get_dependencies(part.name):
+                first_dependent_index[dependency.name] = min(
+                    first_dependent_index[dependency.name], index
+                )
+
+        self._scheduler = Scheduler(max_workers=self._parallel_parts)
+        self._collisions_checked = False
+        logger.debug(
+            "Running {} parts with up to {} parts in parallel".format(
+                len(graph_parts), self._parallel_parts
+            )
+        )
+
+        # Tasks are added step by step so that ties are broken in the
+        # same order a serial run would use. Dependencies may have to go
+        # past the requested step, and their tasks are only added once the
+        # tasks depending on them have been.
+        last_step = max(target_steps.values())
+        for current_step in last_step.previous_steps() + [last_step]:
+            for part in graph_parts:
+                if target_steps[part.name] < current_step:
+                    continue
+
+                after = self._get_task_prerequisites(
+                    part,
+                    current_step,
+                    graph_parts=graph_parts,
+                    target_steps=target_steps,
+                    first_dependent_index=first_dependent_index,
+                )
+                self._scheduler.add_task(
+                    (part.name, current_step),
+                    self._get_step_task(
+                        part_names, part, step, current_step, cli_config
+                    ),
+                    after=after,
+                    # Stage and prime write to areas shared by all parts.
+                    inline=current_step >= steps.STAGE,
+                )
+
+        try:
+            self._scheduler.run()
+        finally:
+            self._scheduler = None
+
+    def _get_task_prerequisites(
+        self,
+        part: pluginhandler.PluginHandler,
+        current_step: steps.Step,
+        *,
+        graph_parts: List[pluginhandler.PluginHandler],
+        target_steps: Dict[str, steps.Step],
+        first_dependent_index: Dict[str, int],
+    ) -> List[Tuple[str, steps.Step]]:
+        after = []
+        previous_step = current_step.previous_step()
+        if previous_step:
+            after.append((part.name, previous_step))
+
+        prerequisite_step = steps.get_dependency_prerequisite_step(current_step)
+        for dependency in self.parts_config.get_dependencies(part.name):
+            after.append((dependency.name, prerequisite_step))
+
+        if current_step == steps.STAGE:
+            after.extend(
+                (p.name, steps.BUILD)
+                for p in graph_parts[: first_dependent_index[part.name]]
+                if p is not part and steps.BUILD <= target_steps[p.name]
+            )
+        # Everything is staged before anything is primed, as would
+        # happen when running serially.
+        elif current_step == steps.PRIME:
+            after.extend(
+                (p.name, steps.STAGE)
+                for p in graph_parts
+                if steps.STAGE <= target_steps[p.name]
+            )
+
+        return after
+
+    def _get_step_task(self, part_names, part, step, current_step, cli_config):
+        def _task() -> None:
+            if current_step == steps.STAGE:
+                self._check_for_collisions()
+            elif current_step < steps.STAGE:
+                # Files in the install directory may change, require a new
+                # check before staging anything else.
+                self._collisions_checked = False
+            self._handle_step(part_names, part, step, current_step, cli_config)
+
+        return _task
+
+    def _check_for_collisions(self) -> None:
+        if self._collisions_checked or self._scheduler is None:
+            return
+
+        # Parts still being pulled or built have incomplete install
+        # directories, they are checked once their build completes.
+        busy_part_names = {
+            part_name
+            for part_name, current_step in self._scheduler.running
+            if current_step < steps.STAGE
+        }
+        pluginhandler.check_for_collisions(
+            [p for p in self.config.all_parts if p.name not in busy_part_names]
+        )
+        self._collisions_checked = not busy_part_names
+
     def _handle_step(
         self,
         requested_part_names: Sequence[str],
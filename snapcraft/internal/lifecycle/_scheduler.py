@@ -0,0 +1,193 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import concurrent.futures
+import logging
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+    def __init__(
+        self,
+        *,
+        key: Hashable,
+        function: Callable[[], None],
+        inline: bool,
+        order: int,
+    ) -> None:
+        self.key = key
+        self.function = function
+        self.inline = inline
+        self.order = order
+        self.prerequisites: Set[Hashable] = set()
+        self.dependents: Set[Hashable] = set()
+
+
+class Scheduler:
+    """Run a graph of interdependent tasks on a bounded pool of workers.
+
+    Tasks become ready once all the tasks they are to run after have
+    completed. Ready tasks are started in the order they were added, so
+    a graph with no parallelism runs exactly as a serial loop would.
+
+    Inline tasks are run one at a time on the calling thread, which
+    allows steps touching areas shared by all parts (i.e. stage and
+    prime) to be serialized while other tasks keep running on the pool.
+    """
+
+    def __init__(self, *, max_workers: int) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be a positive number")
+
+        self._max_workers = max_workers
+        self._tasks: Dict[Hashable, _Task] = dict()
+        self._running: Dict[concurrent.futures.Future, Hashable] = dict()
+        self._running_inline: Optional[Hashable] = None
+
+    @property
+    def running(self) -> Set[Hashable]:
+        """Keys of the tasks currently being run."""
+        keys = set(self._running.values())
+        if self._running_inline is not None:
+            keys.add(self._running_inline)
+        return keys
+
+    def add_task(
+        self,
+        key: Hashable,
+        function: Callable[[], None],
+        *,
+        after: Iterable[Hashable] = (),
+        inline: bool = False,
+    ) -> None:
+        """Add a task to the graph.
+
+        :param key: unique identifier for this task.
+        :param function: callable to run for this task.
+        :param after: keys of tasks that need to complete before this task
+                      can run, which may be added later on.
+        :param inline: whether to run this task on the calling thread.
+        """
+        if key in self._tasks:
+            raise ValueError(f"task {key!r} already added")
+
+        task = _Task(key=key, function=function, inline=inline, order=len(self._tasks))
+        task.prerequisites.update(after)
+        self._tasks[key] = task
+
+    def _link_tasks(self) -> None:
+        for task in self._tasks.values():
+            task.dependents.clear()
+        for task in self._tasks.values():
+            for prerequisite in task.prerequisites:
+                try:
+                    self._tasks[prerequisite].dependents.add(task.key)
+                except KeyError:
+                    raise ValueError(
+                        f"task {task.key!r} depends on unknown task {prerequisite!r}"
+                    )
+
+    def run(self) -> None:
+        """Run all tasks, respecting their ordering.
+
+        If a task fails no new tasks are started; tasks already running
+        are allowed to finish and the first error is raised.
+
+        :raises ValueError: if a task depends on a task that was not added,
+                            or tasks depend on each other.
+        """
+        self._link_tasks()
+        # Map each task not yet started to its outstanding prerequisites.
+        pending = {k: set(t.prerequisites) for k, t in self._tasks.items()}
+        errors: List[BaseException] = []
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._max_workers
+        ) as pool:
+            while pending or self._running:
+                ready = [] if errors else self._get_ready(pending)
+                self._submit(pool, [t for t in ready if not t.inline], pending)
+
+                inline_tasks = [t for t in ready if t.inline]
+                if inline_tasks:
+                    self._run_inline(inline_tasks[0], pending, errors)
+                elif self._running:
+                    self._wait(pending, errors)
+                elif pending and not errors:
+                    # Nothing can make the remaining tasks ready.
+                    raise ValueError(
+                        "tasks {} depend on each other".format(
+                            ", ".join(repr(k) for k in pending)
+                        )
+                    )
+                else:
+                    break
+
+        if errors:
+            raise errors[0]
+
+    def _get_ready(self, pending: Dict[Hashable, Set[Hashable]]) -> List[_Task]:
+        ready = [self._tasks[k] for k, p in pending.items() if not p]
+        return sorted(ready, key=lambda t: t.order)
+
+    def _submit(
+        self,
+        pool: concurrent.futures.Executor,
+        tasks: List[_Task],
+        pending: Dict[Hashable, Set[Hashable]],
+    ) -> None:
+        for task in tasks[: self._max_workers - len(self._running)]:
+            del pending[task.key]
+            self._running[pool.submit(task.function)] = task.key
+
+    def _run_inline(
+        self,
+        task: _Task,
+        pending: Dict[Hashable, Set[Hashable]],
+        errors: List[BaseException],
+    ) -> None:
+        del pending[task.key]
+        self._running_inline = task.key
+        try:
+            task.function()
+        except Exception as task_error:
+            errors.append(task_error)
+        else:
+            self._complete(task.key, pending)
+        finally:
+            self._running_inline = None
+
+    def _wait(
+        self, pending: Dict[Hashable, Set[Hashable]], errors: List[BaseException]
+    ) -> None:
+        done, _ = concurrent.futures.wait(
+            self._running, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            key = self._running.pop(future)
+            task_error = future.exception()
+            if task_error is not None:
+                logger.debug(f"Task {key!r} failed: {task_error!s}")
+                errors.append(task_error)
+            else:
+                self._complete(key, pending)
+
+    def _complete(self, key: Hashable, pending: Dict[Hashable, Set[Hashable]]) -> None:
+        for dependent in self._tasks[key].dependents:
+            if dependent in pending:
+                pending[dependent].discard(key)
@@ -0,0 +1,326 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Set
+
+from snapcraft.internal import errors, sources, steps
+
+from ._runner import execute
+
+if TYPE_CHECKING:
+    from snapcraft.internal.project_loader._config import Config
+
+logger = logging.getLogger(__name__)
+
+# From <sys/inotify.h>.
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+    | _IN_DONT_FOLLOW
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Editors tend to save files as a burst of events, wait for things to
+# settle this long before rebuilding.
+_SETTLE_TIMEOUT = 0.3
+
+
+class _Inotify:
+    def __init__(self, *, exclude: Callable[[str], bool]) -> None:
+        libc_name = ctypes.util.find_library("c")
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError):
+            raise errors.SnapcraftEnvironmentError(
+                "--watch requires inotify, which is not available on this system."
+            )
+
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            _raise_inotify_error("initialize inotify")
+        self._paths: Dict[int, str] = dict()
+        self._exclude = exclude
+
+    def add_watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), ctypes.c_uint32(_WATCH_MASK)
+        )
+        if wd < 0:
+            # The directory may be gone already, the event for it going
+            # away will follow.
+            if ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR):
+                return
+            _raise_inotify_error(f"watch {path!r}")
+        self._paths[wd] = path
+
+    def read(self, timeout: Optional[float]) -> List[Optional[str]]:
+        """Return the paths affected by new events.
+
+        None is returned in place of paths when events were lost.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths: List[Optional[str]] = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                paths.append(None)
+            elif mask & _IN_IGNORED:
+                self._paths.pop(wd, None)
+            elif wd in self._paths:
+                path = os.path.join(self._paths[wd], name)
+                paths.append(path)
+                # New directories need watches of their own.
+                if (
+                    mask & _IN_ISDIR
+                    and mask & (_IN_CREATE | _IN_MOVED_TO)
+                    and not self._exclude(path)
+                ):
+                    paths.extend(self.add_tree(path))
+        return paths
+
+    def add_tree(self, root: str) -> List[str]:
+        """Watch root and all the directories in it, returning files found."""
+        found = []
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = [
+                d
+                for d in subdirectories
+                if not self._exclude(os.path.join(directory, d))
+            ]
+            self.add_watch(directory)
+            found.extend(os.path.join(directory, f) for f in files)
+        return found
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def _raise_inotify_error(action: str) -> None:
+    error_number = ctypes.get_errno()
+    message = f"Failed to {action}: {os.strerror(error_number)}."
+    if error_number == errno.ENOSPC:
+        message += (
+            " Raise the limit of watches set in"
+            " /proc/sys/fs/inotify/max_user_watches to watch more directories."
+        )
+    raise errors.SnapcraftEnvironmentError(message)
+
+
+class _ProjectWatcher:
+    """Map filesystem events in a project to the parts they affect."""
+
+    def __init__(self) -> None:
+        self._inotify = _Inotify(exclude=self._is_excluded)
+        self._excluded: Set[str] = set()
+        self._project_files: Set[str] = set()
+        self._source_dirs: Dict[str, Set[str]] = dict()
+
+    def update(self, project_config: "Config") -> None:
+        """Watch the local sources and assets of project_config."""
+        project = project_config.project
+        self._excluded = {
+            os.path.abspath(d)
+            for d in (project.parts_dir, project.stage_dir, project.prime_dir)
+        }
+        self._project_files = {
+            os.path.abspath(project._get_snapcraft_assets_dir()),
+            os.path.abspath(project.info.snapcraft_yaml_file_path),
+        }
+        for path in self._project_files:
+            if os.path.isdir(path):
+                self._inotify.add_tree(path)
+            else:
+                self._inotify.add_watch(os.path.dirname(path))
+
+        self._source_dirs = dict()
+        for part in project_config.parts.all_parts:
+            if isinstance(part.source_handler, sources.Local):
+                source_dir = part.source_handler.source_abspath
+                self._source_dirs.setdefault(source_dir, set()).add(part.name)
+                self._inotify.add_tree(source_dir)
+
+    def wait(self) -> Optional[Set[str]]:
+        """Block until files of interest change.
+
+        :returns: the names of the parts with modified sources, or None if
+                  the project itself was modified and needs to be reloaded.
+        """
+        paths: List[Optional[str]] = []
+        while not paths:
+            paths = [p for p in self._inotify.read(None) if self._is_relevant(p)]
+        while True:
+            new_paths = self._inotify.read(_SETTLE_TIMEOUT)
+            if not new_paths:
+                break
+            paths.extend(p for p in new_paths if self._is_relevant(p))
+
+        part_names: Set[str] = set()
+        for path in paths:
+            if path is None or self._is_project_file(path):
+                return None
+            for source_dir, names in self._source_dirs.items():
+                if _is_subpath(path, source_dir):
+                    part_names |= names
+        return part_names
+
+    def close(self) -> None:
+        self._inotify.close()
+
+    def _is_relevant(self, path: Optional[str]) -> bool:
+        if path is None or self._is_project_file(path):
+            return True
+        if self._is_excluded(path):
+            return False
+        # Snaps packed into the project directory, which is commonly used
+        # as a source.
+        if path.endswith(".snap") and os.path.dirname(path) in self._source_dirs:
+            return False
+        return any(_is_subpath(path, d) for d in self._source_dirs)
+
+    def _is_project_file(self, path: str) -> bool:
+        return any(_is_subpath(path, p) for p in self._project_files)
+
+    def _is_excluded(self, path: str) -> bool:
+        return any(_is_subpath(path, d) for d in self._excluded)
+
+
+def _is_subpath(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def watch(
+    step: steps.Step,
+    load_config: Callable[[], "Config"],
+    part_names: Sequence[str] = None,
+) -> None:
+    """Execute step for part_names, and again whenever their sources change.
+
+    Only local sources (and the project's own snapcraft.yaml and assets)
+    are watched. Whenever sources are modified, the lifecycle is executed
+    again for the parts using them and the parts depending on those,
+    relying on the usual outdated and dirty checks to decide what steps
+    to run again. Modifying the project reloads it entirely.
+
+    Runs until interrupted. Errors in any but the first run are reported
+    and watching continues, so they can be fixed.
+
+    :param steps.Step step: the step to execute.
+    :param load_config: callable returning a freshly loaded project.
+    :param part_names: the parts to execute step for, all if empty.
+    """
+    watcher = _ProjectWatcher()
+    try:
+        project_config = load_config()
+        watcher.update(project_config)
+        execute(step, project_config, part_names)
+
+        while True:
+            logger.info("Watching for changes (press Ctrl+C to stop)...")
+            changed_parts = watcher.wait()
+
+            try:
+                _rerun(step, load_config, part_names, watcher, changed_parts)
+            except (errors.SnapcraftError, errors.SnapcraftException) as error:
+                if isinstance(error, errors.SnapcraftException):
+                    logger.error(error.get_brief())
+                else:
+                    logger.error(str(error))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def _rerun(
+    step: steps.Step,
+    load_config: Callable[[], "Config"],
+    part_names: Optional[Sequence[str]],
+    watcher: _ProjectWatcher,
+    changed_parts: Optional[Set[str]],
+) -> None:
+    # The state of the parts is only loaded once while executing the
+    # lifecycle, so each run needs a freshly loaded project.
+    project_config = load_config()
+    watcher.update(project_config)
+
+    run_part_names = _get_run_part_names(project_config, changed_parts, part_names)
+    if run_part_names:
+        logger.info(f"Changes detected, updating {', '.join(run_part_names)}.")
+        # Run for the parts originally requested, the dirty and outdated
+        # checks pick the steps to run again for the parts that changed.
+        execute(step, project_config, part_names, rerun_requested_step=False)
+
+
+def _get_run_part_names(
+    project_config: "Config",
+    changed_parts: Optional[Set[str]],
+    part_names: Optional[Sequence[str]],
+) -> List[str]:
+    graph = project_config.parts.dependency_graph
+    if changed_parts is None:
+        run_part_names = set(part_names or graph.order)
+    else:
+        run_part_names = set(changed_parts)
+        for name in changed_parts:
+            run_part_names |= graph.get_reverse_dependencies(name, recursive=True)
+        if part_names:
+            run_part_names &= set(part_names)
+
+    # Keep the order parts are processed in.
+    return [n for n in graph.order if n in run_part_names]
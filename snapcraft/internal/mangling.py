@@ -13,32 +13,108 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import concurrent.futures
 import logging
+import os
 import re
-import subprocess
-from typing import FrozenSet
+from typing import FrozenSet, Iterator, Optional, Tuple
 
 from snapcraft import file_utils
-from snapcraft.internal import elf
+from snapcraft.internal import common, elf, errors
 
 logger = logging.getLogger(__name__)
 
 
-def rewrite_python_shebangs(root_dir):
+# The kernel reads less than this of a script to find its interpreter, so
+# a longer first line cannot be a shebang worth rewriting.
+_SHEBANG_MAX_LENGTH = 4096
+
+_ARGLESS_SHEBANG_PATTERN = re.compile(r"\A#!.*(python\S*)$")
+_SHEBANG_WITH_ARGS_PATTERN = re.compile(r"\A#!.*(python\S*)[ \t\f\v]+(\S+)$")
+
+
+def rewrite_python_shebangs(root_dir: str, *, workers: Optional[int] = None) -> None:
     """Recursively change #!/usr/bin/pythonX shebangs to #!/usr/bin/env pythonX
 
+    Only the first line of each regular file is read, and the files are
+    checked by a pool of threads.
+
     :param str root_dir: Directory that will be crawled for shebangs.
+    :param int workers: the number of threads to check files with,
+                        common.get_file_workers_count() by default.
+    """
+    if workers is None:
+        workers = common.get_file_workers_count()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        rewritten = sum(
+            executor.map(rewrite_python_shebang, _iter_regular_files(root_dir))
+        )
+    logger.debug("Rewrote {} python shebangs in {!r}".format(rewritten, root_dir))
+
+
+def rewrite_python_shebang(path: str) -> bool:
+    """Change a #!/usr/bin/pythonX shebang in the file at path to use env.
+
+    :param str path: the regular file to rewrite the shebang of.
+    :returns: whether the shebang was rewritten.
     """
+    first_line = _read_first_line(path)
+    if first_line is None:
+        return False
+
+    shebang, line_end = first_line
+    new_shebang = _rewrite_shebang(shebang)
+    if new_shebang is None:
+        return False
+
+    try:
+        file_utils.break_hard_link(path)
+        with open(path, "r+b") as f:
+            f.seek(line_end)
+            rest = f.read()
+            f.seek(0)
+            f.write(new_shebang.encode())
+            f.write(rest)
+            f.truncate()
+    except PermissionError as e:
+        logger.warning(
+            "Unable to open {path} for writing: {error}".format(path=path, error=e)
+        )
+        return False
+    return True
+
+
+def _read_first_line(path: str) -> Optional[Tuple[str, int]]:
+    """Return the first line of a script at path, and where it ends."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_SHEBANG_MAX_LENGTH + 1)
+    except OSError as e:
+        logger.warning("Unable to open {path}: {error}".format(path=path, error=e))
+        return None
+
+    if not head.startswith(b"#!"):
+        return None
+
+    line_end = head.find(b"\n")
+    if line_end == -1:
+        if len(head) > _SHEBANG_MAX_LENGTH:
+            return None
+        line_end = len(head)
 
-    file_pattern = re.compile(r"")
-    argless_shebang_pattern = re.compile(r"\A#!.*(python\S*)$", re.MULTILINE)
-    shebang_pattern_with_args = re.compile(
-        r"\A#!.*(python\S*)[ \t\f\v]+(\S+)$", re.MULTILINE
-    )
+    try:
+        # A \r\n line ending is read as \n, as text mode reads would.
+        return head[:line_end].decode().rstrip("\r"), line_end
+    except UnicodeDecodeError:
+        return None
 
-    file_utils.replace_in_file(
-        root_dir, file_pattern, argless_shebang_pattern, r"#!/usr/bin/env \1"
-    )
+
+def _rewrite_shebang(shebang: str) -> Optional[str]:
+    match = _ARGLESS_SHEBANG_PATTERN.match(shebang)
+    if match:
+        new_shebang = "#!/usr/bin/env {}".format(match.group(1))
+        return new_shebang if new_shebang != shebang else None
 
     # The above rewrite will barf if the shebang includes any args to python.
     # For example, if the shebang was `#!/usr/bin/python3 -Es`, just replacing
@@ -49,12 +125,29 @@ def rewrite_python_shebangs(root_dir):
     # then exec the original shebang with included arguments. This requires
     # some quoting hacks to ensure the file can be interpreted by both sh as
     # well as python, but it's better than shipping our own `env`.
-    file_utils.replace_in_file(
-        root_dir,
-        file_pattern,
-        shebang_pattern_with_args,
-        r"""#!/bin/sh\n''''exec \1 \2 -- "$0" "$@" # '''""",
-    )
+    match = _SHEBANG_WITH_ARGS_PATTERN.match(shebang)
+    if match:
+        return "#!/bin/sh\n''''exec {} {} -- \"$0\" \"$@\" # '''".format(
+            match.group(1), match.group(2)
+        )
+
+    return None
+
+
+def _iter_regular_files(root_dir: str) -> Iterator[str]:
+    # Symlinks are not followed, they are either invalid or their target is
+    # rewritten on its own.
+    directories = [root_dir]
+    while directories:
+        try:
+            entries = list(os.scandir(directories.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path
 
 
 def clear_execstack(*, elf_files: FrozenSet[elf.ElfFile]) -> None:
@@ -63,7 +156,6 @@ def clear_execstack(*, elf_files: FrozenSet[elf.ElfFile]) -> None:
     param elf.ElfFile elf_files: the full list of elf files to analyze
                                  and clear the execstack if present.
     """
-    execstack_path = file_utils.get_snap_tool_path("execstack")
     elf_files_with_execstack = [e for e in elf_files if e.execstack_set]
 
     if elf_files_with_execstack:
@@ -78,6 +170,6 @@ def clear_execstack(*, elf_files: FrozenSet[elf.ElfFile]) -> None:
 
     for elf_file in elf_files_with_execstack:
         try:
-            subprocess.check_call([execstack_path, "--clear-execstack", elf_file.path])
-        except subprocess.CalledProcessError:
+            elf_file.clear_execstack()
+        except errors.CorruptedElfFileError:
             logger.warning("Failed to clear execstack for {!r}".format(elf_file.path))
@@ -17,7 +17,6 @@
 import collections
 import contextlib
 import copy
-import filecmp
 import io
 import logging
 import os
@@ -34,8 +33,10 @@ from snapcraft.internal import common, elf, errors, repo, sources, states, steps
 from snapcraft.internal.mangling import clear_execstack
 
 from ._build_attributes import BuildAttributes
+from ._collisions import CollisionIndex, FileDigests
 from ._dependencies import MissingDependencyResolver
 from ._dirty_report import Dependency, DirtyReport  # noqa
+from ._fileset import get_fileset_matcher
 from ._metadata_extraction import extract_metadata
 from ._outdated_report import OutdatedReport
 from ._part_environment import get_snapcraft_part_environment
@@ -86,6 +87,8 @@ class PluginHandler:
         self.part_install_dir = os.path.join(self.part_dir, "install")
         self.part_state_dir = os.path.join(self.part_dir, "state")
         self.part_snaps_dir = os.path.join(self.part_dir, "snaps")
+        self._state_index = states.get_state_index(project.parts_dir)
+        self._file_digests: Optional[FileDigests] = None
 
         # Location to store fetch stage packages.
         self.stage_packages_path = pathlib.Path(self.part_dir) / "stage_packages"
@@ -187,7 +190,14 @@ class PluginHandler:
         return self._prime_state
 
     def get_state(self, step) -> states.PartState:
-        return states.get_state(self.part_state_dir, step)
+        return self._state_index.get_state(self.part_state_dir, step)
+
+    def get_file_digests(self) -> FileDigests:
+        """Return the digests of the files installed, to check collisions."""
+        if self._file_digests is None:
+            stage_state = self.get_state(steps.STAGE)
+            self._file_digests = FileDigests(getattr(stage_state, "file_digests", None))
+        return self._file_digests
 
     def _get_source_handler(self, properties):
         """Returns a source_handler for the source in properties."""
@@ -241,7 +251,7 @@ class PluginHandler:
             latest_step = self.latest_step()
             required_steps = latest_step.previous_steps() + [latest_step]
             for other_step in reversed(required_steps):
-                state = states.get_state(self.part_state_dir, other_step)
+                state = self.get_state(other_step)
                 conflicts = metadata.overlap(state.scriptlet_metadata)
                 if len(conflicts) > 0:
                     raise errors.ScriptletDuplicateDataError(
@@ -380,7 +390,7 @@ class PluginHandler:
         """
 
         # Retrieve the stored state for this step (assuming it has already run)
-        state = states.get_state(self.part_state_dir, step)
+        state = self.get_state(step)
         if state:
             # state.properties contains the old YAML that this step cares
             # about, and we're comparing it to those same keys in the current
@@ -423,6 +433,7 @@ class PluginHandler:
         state_file = states.get_step_state_file(self.part_state_dir, step)
         if os.path.exists(state_file):
             os.remove(state_file)
+        self._state_index.forget(self.part_state_dir, step)
 
         if os.path.isdir(self.part_state_dir) and not os.listdir(self.part_state_dir):
             os.rmdir(self.part_state_dir)
@@ -593,8 +604,14 @@ class PluginHandler:
                 shutil.rmtree(self.part_build_dir)
 
             # No hard-links being used here in case the build process modifies
-            # these files.
-            shutil.copytree(self.part_source_dir, self.part_build_dir, symlinks=True)
+            # these files. Copies are reflinked where supported, which is just
+            # as safe.
+            shutil.copytree(
+                self.part_source_dir,
+                self.part_build_dir,
+                symlinks=True,
+                copy_function=file_utils.copy,
+            )
 
         self._do_build()
 
@@ -880,6 +897,7 @@ class PluginHandler:
                 self._part_properties,
                 self._project,
                 self._scriptlet_metadata[steps.STAGE],
+                self.get_file_digests().marshal(snap_files),
             ),
         )
 
@@ -887,7 +905,7 @@ class PluginHandler:
         if self.is_clean(steps.STAGE):
             return
 
-        state = states.get_state(self.part_state_dir, steps.STAGE)
+        state = self.get_state(steps.STAGE)
 
         try:
             self._clean_shared_area(
@@ -936,7 +954,6 @@ class PluginHandler:
 
     def _handle_elf(self, snap_files: Sequence[str]) -> Set[str]:
         elf_files = elf.get_elf_files(self._project.prime_dir, snap_files)
-        all_dependencies: Set[str] = set()
         if self._project._snap_meta.base is not None:
             core_path = common.get_installed_snap_path(self._project._snap_meta.base)
         else:
@@ -948,16 +965,14 @@ class PluginHandler:
         # Determine content directories.
         content_dirs = self._project._get_provider_content_dirs()
 
-        for elf_file in elf_files:
-            all_dependencies.update(
-                elf_file.load_dependencies(
-                    root_path=self._project.prime_dir,
-                    core_base_path=core_path,
-                    content_dirs=content_dirs,
-                    arch_triplet=self._project.arch_triplet,
-                    soname_cache=self._soname_cache,
-                )
-            )
+        all_dependencies = elf.load_dependencies(
+            elf_files,
+            root_path=self._project.prime_dir,
+            core_base_path=core_path,
+            content_dirs=content_dirs,
+            arch_triplet=self._project.arch_triplet,
+            soname_cache=self._soname_cache,
+        )
 
         # Split the necessary dependencies into their corresponding location.
         search_paths = [self._project.prime_dir, core_path, *content_dirs]
@@ -1210,47 +1225,8 @@ def _expand_part_properties(part_properties, part_schema):
 def _migratable_filesets(fileset, srcdir):
     includes, excludes = _get_file_list(fileset)
 
-    include_files = _generate_include_set(srcdir, includes)
-    exclude_files, exclude_dirs = _generate_exclude_set(srcdir, excludes)
-
-    # Chop files, including whole trees if any dirs are mentioned.
-    snap_files = include_files - exclude_files
-    for exclude_dir in exclude_dirs:
-        snap_files = set([x for x in snap_files if not x.startswith(exclude_dir + "/")])
-
-    # Separate dirs from files.
-    snap_dirs = set(
-        [
-            x
-            for x in snap_files
-            if os.path.isdir(os.path.join(srcdir, x))
-            and not os.path.islink(os.path.join(srcdir, x))
-        ]
-    )
-
-    # Remove snap_dirs from snap_files.
-    snap_files = snap_files - snap_dirs
-
-    # Include (resolved) parent directories for each selected file.
-    for snap_file in snap_files:
-        snap_file = file_utils.get_resolved_relative_path(snap_file, srcdir)
-        dirname = os.path.dirname(snap_file)
-        while dirname:
-            snap_dirs.add(dirname)
-            dirname = os.path.dirname(dirname)
-
-    # Resolve parent paths for dirs and files.
-    resolved_snap_dirs = set()
-    for snap_dir in snap_dirs:
-        snap_dir = file_utils.get_resolved_relative_path(snap_dir, srcdir)
-        resolved_snap_dirs.add(snap_dir)
-
-    resolved_snap_files = set()
-    for snap_file in snap_files:
-        snap_file = file_utils.get_resolved_relative_path(snap_file, srcdir)
-        resolved_snap_files.add(snap_file)
-
-    return resolved_snap_files, resolved_snap_dirs
+    matcher = get_fileset_matcher(tuple(includes), tuple(excludes))
+    return matcher.match(srcdir)
 
 
 def _migrate_files(
@@ -1284,7 +1260,7 @@ def _migrate_files(
             os.remove(dst)
 
         if src.endswith(".pc"):
-            shutil.copy2(src, dst, follow_symlinks=follow_symlinks)
+            file_utils.copy(src, dst, follow_symlinks=follow_symlinks)
         else:
             file_utils.link_or_copy(src, dst, follow_symlinks=follow_symlinks)
 
@@ -1389,141 +1365,44 @@ def _get_file_list(stage_set):
     return includes, excludes
 
 
-def _generate_include_set(directory, includes):
-    include_files = set()
-    for include in includes:
-        if "*" in include:
-            pattern = os.path.join(directory, include)
-            matches = iglob(pattern, recursive=True)
-            include_files |= set(matches)
-        else:
-            include_files |= set([os.path.join(directory, include)])
-
-    include_dirs = [
-        x for x in include_files if os.path.isdir(x) and not os.path.islink(x)
-    ]
-    include_files = set([os.path.relpath(x, directory) for x in include_files])
-
-    # Expand includeFiles, so that an exclude like '*/*.so' will still match
-    # files from an include like 'lib'
-    for include_dir in include_dirs:
-        for root, dirs, files in os.walk(include_dir):
-            include_files |= set(
-                [os.path.relpath(os.path.join(root, d), directory) for d in dirs]
-            )
-            include_files |= set(
-                [os.path.relpath(os.path.join(root, f), directory) for f in files]
-            )
-
-    return include_files
-
-
-def _generate_exclude_set(directory, excludes):
-    exclude_files = set()
-
-    for exclude in excludes:
-        pattern = os.path.join(directory, exclude)
-        matches = iglob(pattern, recursive=True)
-        exclude_files |= set(matches)
-
-    exclude_dirs = [
-        os.path.relpath(x, directory) for x in exclude_files if os.path.isdir(x)
-    ]
-    exclude_files = set([os.path.relpath(x, directory) for x in exclude_files])
-
-    return exclude_files, exclude_dirs
-
-
 def _validate_relative_paths(files):
     for d in files:
         if os.path.isabs(d):
             raise errors.PluginError('path "{}" must be relative'.format(d))
 
 
-def _file_collides(file_this, file_other):
-    if not file_this.endswith(".pc"):
-        return not filecmp.cmp(file_this, file_other, shallow=False)
-
-    pc_file_1 = open(file_this)
-    pc_file_2 = open(file_other)
-
-    try:
-        for lines in zip(pc_file_1, pc_file_2):
-            for line in zip(lines[0].split("\n"), lines[1].split("\n")):
-                if line[0].startswith("prefix="):
-                    continue
-                if line[0] != line[1]:
-                    return True
-    except Exception as e:
-        raise e from e
-    finally:
-        pc_file_1.close()
-        pc_file_2.close()
-    return False
-
-
 def check_for_collisions(parts):
-    """Raises a SnapcraftPartConflictError if conflicts are found."""
-    parts_files = {}
+    """Raises a SnapcraftPartConflictError if conflicts are found.
+
+    All the conflicts are reported at once, with SnapcraftPartConflictsError
+    if there are conflicts between more than two parts.
+    """
+    index = CollisionIndex()
+    conflicts = []
     for part in parts:
-        # Gather our own files up
         part_files, part_directories = part.migratable_fileset_for(steps.STAGE)
-        part_contents = part_files | part_directories
-
-        # Scan previous parts for collisions
-        for other_part_name in parts_files:
-            common = part_contents & parts_files[other_part_name]["files"]
-            conflict_files = []
-            for f in common:
-                this = os.path.join(part.part_install_dir, f)
-                other = os.path.join(parts_files[other_part_name]["installdir"], f)
-
-                if _paths_collide(this, other):
-                    conflict_files.append(f)
-
-            if conflict_files:
-                raise errors.SnapcraftPartConflictError(
-                    other_part_name=other_part_name,
-                    part_name=part.name,
-                    conflict_files=conflict_files,
+        part_conflicts = index.add(
+            part.name,
+            part.part_install_dir,
+            part_files | part_directories,
+            part.get_file_digests(),
+        )
+        # Report conflicts in the order parts were checked.
+        for other_part in parts:
+            if other_part.name in part_conflicts:
+                conflicts.append(
+                    (other_part.name, part.name, part_conflicts[other_part.name])
                 )
 
-        # And add our files to the list
-        parts_files[part.name] = {
-            "files": part_contents,
-            "installdir": part.part_install_dir,
-        }
-
-
-def _paths_collide(path1: str, path2: str) -> bool:
-    if not (os.path.lexists(path1) and os.path.lexists(path2)):
-        return False
-
-    path1_is_dir = os.path.isdir(path1)
-    path2_is_dir = os.path.isdir(path2)
-    path1_is_link = os.path.islink(path1)
-    path2_is_link = os.path.islink(path2)
-
-    # Paths collide if they're both symlinks, but pointing to different places
-    if path1_is_link and path2_is_link:
-        return os.readlink(path1) != os.readlink(path2)
-
-    # Paths collide if one is a symlink, but not the other
-    elif path1_is_link or path2_is_link:
-        return True
-
-    # Paths collide if one is a directory, but not the other
-    elif path1_is_dir != path2_is_dir:
-        return True
-
-    # Paths collide if neither path is a directory, and the files have
-    # different contents
-    elif not (path1_is_dir and path2_is_dir) and _file_collides(path1, path2):
-        return True
-
-    # Otherwise, paths do not conflict
-    else:
-        return False
+    if len(conflicts) == 1:
+        other_part_name, part_name, conflict_files = conflicts[0]
+        raise errors.SnapcraftPartConflictError(
+            other_part_name=other_part_name,
+            part_name=part_name,
+            conflict_files=conflict_files,
+        )
+    elif conflicts:
+        raise errors.SnapcraftPartConflictsError(conflicts=conflicts)
 
 
 def _get_includes(fileset):
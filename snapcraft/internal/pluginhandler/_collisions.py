@@ -0,0 +1,179 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import os
+import stat
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from snapcraft import file_utils
+
+# Digests of files modified this recently are not kept, as a rewrite within
+# the timestamp granularity of the filesystem could go unnoticed.
+_RACY_INTERVAL_NS = 2 * 10 ** 9
+
+_Signature = Tuple[int, int, int]
+
+
+class FileDigests:
+    """Digests of the files of a part, cached by their stat signature.
+
+    The digests are recorded in the stage state of the part, so files that
+    did not change are not read again to check them for collisions.
+    """
+
+    def __init__(self, recorded: Optional[Dict[str, List]] = None) -> None:
+        self._digests: Dict[str, Tuple[_Signature, str]] = dict()
+        for path, (size, mtime_ns, inode, digest) in (recorded or {}).items():
+            self._digests[path] = ((size, mtime_ns, inode), digest)
+
+    def get(self, path: str, file_path: str, file_stat: os.stat_result) -> str:
+        """Return the digest of path, found at file_path."""
+        signature = _get_signature(file_stat)
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        digest = file_utils.calculate_hash(file_path, algorithm="sha256")
+        if file_stat.st_mtime_ns < time.time() * 10 ** 9 - _RACY_INTERVAL_NS:
+            self._digests[path] = (signature, digest)
+        return digest
+
+    def marshal(self, paths: Iterable[str]) -> Dict[str, List]:
+        """Return the digests known for paths, to be recorded."""
+        return {
+            path: [*self._digests[path][0], self._digests[path][1]]
+            for path in paths
+            if path in self._digests
+        }
+
+
+class _IndexedPath:
+    def __init__(
+        self, part_name: str, install_dir: str, path: str, digests: FileDigests
+    ) -> None:
+        self.part_name = part_name
+        self.path = path
+        self.file_path = os.path.join(install_dir, path)
+        self._digests = digests
+        self._digest: Optional[str] = None
+        self._link_target: Optional[str] = None
+
+        try:
+            self.stat: Optional[os.stat_result] = os.lstat(self.file_path)
+        except OSError:
+            self.stat = None
+
+    @property
+    def digest(self) -> Optional[str]:
+        if self._digest is None and self.stat is not None:
+            self._digest = self._digests.get(self.path, self.file_path, self.stat)
+        return self._digest
+
+    @property
+    def link_target(self) -> str:
+        if self._link_target is None:
+            self._link_target = os.readlink(self.file_path)
+        return self._link_target
+
+    def collides(self, other: "_IndexedPath") -> bool:
+        # Paths that are not staged by both parts do not collide.
+        if self.stat is None or other.stat is None:
+            return False
+
+        mode = self.stat.st_mode
+        other_mode = other.stat.st_mode
+
+        # Symlinks collide if they point to different places, or with
+        # anything other than a symlink.
+        if stat.S_ISLNK(mode) or stat.S_ISLNK(other_mode):
+            if not (stat.S_ISLNK(mode) and stat.S_ISLNK(other_mode)):
+                return True
+            return self.link_target != other.link_target
+
+        # Directories only collide with anything other than a directory.
+        if stat.S_ISDIR(mode) or stat.S_ISDIR(other_mode):
+            return stat.S_ISDIR(mode) != stat.S_ISDIR(other_mode)
+
+        # Special files always collide.
+        if not (stat.S_ISREG(mode) and stat.S_ISREG(other_mode)):
+            return True
+
+        # A file hard-linked from the other is identical.
+        if (self.stat.st_dev, self.stat.st_ino) == (
+            other.stat.st_dev,
+            other.stat.st_ino,
+        ):
+            return False
+
+        if self.path.endswith(".pc"):
+            return _pc_files_collide(self.file_path, other.file_path)
+
+        if self.stat.st_size != other.stat.st_size:
+            return True
+        return self.digest != other.digest
+
+
+class CollisionIndex:
+    """An index of the paths staged by parts, to find those colliding.
+
+    Every path is only compared with the same path from the parts added
+    before, looking into the contents of files only when they are
+    regular files of the same size that are not hard links of each other.
+    """
+
+    def __init__(self) -> None:
+        self._paths: Dict[str, List[_IndexedPath]] = dict()
+
+    def add(
+        self,
+        part_name: str,
+        install_dir: str,
+        paths: Iterable[str],
+        digests: FileDigests,
+    ) -> Dict[str, List[str]]:
+        """Add the paths of a part to the index.
+
+        :returns: the paths colliding with the paths of the parts added
+                  before, by the name of those parts.
+        """
+        conflicts: Dict[str, List[str]] = collections.OrderedDict()
+        for path in paths:
+            indexed_path = _IndexedPath(part_name, install_dir, path, digests)
+            others = self._paths.setdefault(path, [])
+            for other in others:
+                if indexed_path.collides(other):
+                    conflicts.setdefault(other.part_name, []).append(path)
+            others.append(indexed_path)
+
+        return conflicts
+
+
+def _get_signature(file_stat: os.stat_result) -> _Signature:
+    return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+
+def _pc_files_collide(file_this: str, file_other: str) -> bool:
+    # The prefix of pkg-config files is replaced when staging them.
+    with open(file_this) as pc_file_1, open(file_other) as pc_file_2:
+        for lines in zip(pc_file_1, pc_file_2):
+            for line in zip(lines[0].split("\n"), lines[1].split("\n")):
+                if line[0].startswith("prefix="):
+                    continue
+                if line[0] != line[1]:
+                    return True
+    return False
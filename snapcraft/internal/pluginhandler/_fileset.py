@@ -0,0 +1,375 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import fnmatch
+import functools
+import os
+import re
+import stat
+from typing import Callable, DefaultDict, Dict, List, Optional, Sequence, Set, Tuple
+
+# The characters glob treats as wildcards.
+_MAGIC_CHECK = re.compile("[*?[]")
+
+# A path matched by a pattern, along with its directory entry when known.
+_Matches = Dict[str, Optional[os.DirEntry]]
+# A pattern being matched, as its index and the index of its next component.
+_State = Tuple[int, int]
+
+
+class _Component:
+    def __init__(self, component: str) -> None:
+        self.literal: Optional[str] = None
+        self.recursive = component == "**"
+        self.match: Optional[Callable] = None
+        self.matches_hidden = component.startswith(".")
+
+        if not _MAGIC_CHECK.search(component):
+            self.literal = component
+        elif not self.recursive:
+            self.match = re.compile(fnmatch.translate(component)).match
+
+
+class _Pattern:
+    def __init__(self, pattern: str) -> None:
+        # A trailing slash only matches directories.
+        self.dironly = pattern == "" or pattern.endswith("/")
+        self.components = [_Component(c) for c in pattern.split("/") if c]
+
+        # Like glob, the leading literal components are not checked for
+        # existence, only the ones following wildcards are.
+        self.unchecked = 0
+        for component in self.components:
+            if component.literal is None:
+                break
+            self.unchecked += 1
+        if self.unchecked == len(self.components):
+            self.unchecked -= 1
+
+
+class _Glob:
+    """Match several glob patterns at once in a directory.
+
+    Paths are matched as glob.iglob(recursive=True) does: hidden names are
+    only matched by components starting with a dot (and never by "**"),
+    and symlinks to directories are followed to match the components
+    beyond them.
+
+    Patterns are matched walking the directory once, from the literal
+    prefixes of the patterns down to only the directories their following
+    components may match, listing each of those only once.
+    """
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self._patterns = [_Pattern(p) for p in patterns]
+
+    def match(self, directory: str) -> _Matches:
+        matches: _Matches = dict()
+        if self._patterns:
+            initial_states = {(i, 0) for i in range(len(self._patterns))}
+            self._match(directory, ".", initial_states, (), matches)
+        return matches
+
+    def _match(
+        self,
+        directory: str,
+        relpath: str,
+        states: Set[_State],
+        links: Tuple[str, ...],
+        matches: _Matches,
+    ) -> None:
+        path = os.path.join(directory, relpath)
+        next_states: DefaultDict[str, Set[_State]] = collections.defaultdict(set)
+        child_links: Dict[str, Tuple[str, ...]] = dict()
+        entries: Optional[List[os.DirEntry]] = None
+
+        for index, position in self._expand_recursive(states):
+            pattern = self._patterns[index]
+            if position == len(pattern.components):
+                if not pattern.dironly or os.path.isdir(path):
+                    matches[os.path.normpath(relpath)] = None
+                continue
+
+            component = pattern.components[position]
+            if component.literal is not None:
+                if position < pattern.unchecked or os.path.lexists(
+                    os.path.join(path, component.literal)
+                ):
+                    next_states[component.literal].add((index, position + 1))
+                continue
+
+            if entries is None:
+                entries = _scandir(path)
+            self._match_entries(
+                relpath,
+                entries,
+                (index, position),
+                links,
+                next_states,
+                child_links,
+                matches,
+            )
+
+        for name, child_states in next_states.items():
+            self._match(
+                directory,
+                os.path.join(relpath, name),
+                child_states,
+                child_links.get(name, links),
+                matches,
+            )
+
+    def _match_entries(
+        self,
+        relpath: str,
+        entries: List[os.DirEntry],
+        state: _State,
+        links: Tuple[str, ...],
+        next_states: DefaultDict[str, Set[_State]],
+        child_links: Dict[str, Tuple[str, ...]],
+        matches: _Matches,
+    ) -> None:
+        index, position = state
+        pattern = self._patterns[index]
+        component = pattern.components[position]
+        is_final = position + 1 == len(pattern.components) and not pattern.dironly
+
+        for entry in entries:
+            if entry.name.startswith(".") and not component.matches_hidden:
+                continue
+            if component.match is not None and not component.match(entry.name):
+                continue
+
+            if is_final:
+                matches[os.path.normpath(os.path.join(relpath, entry.name))] = entry
+            if not _is_dir(entry):
+                continue
+
+            if not component.recursive:
+                if not is_final:
+                    next_states[entry.name].add((index, position + 1))
+            elif _follow_recursive(entry, links, child_links):
+                next_states[entry.name].add(state)
+
+    def _expand_recursive(self, states: Set[_State]) -> Set[_State]:
+        # "**" also matches no directories at all.
+        expanded = set(states)
+        pending = list(states)
+        while pending:
+            index, position = pending.pop()
+            components = self._patterns[index].components
+            if position < len(components) and components[position].recursive:
+                state = (index, position + 1)
+                if state not in expanded:
+                    expanded.add(state)
+                    pending.append(state)
+        return expanded
+
+
+def _follow_recursive(
+    entry: os.DirEntry,
+    links: Tuple[str, ...],
+    child_links: Dict[str, Tuple[str, ...]],
+) -> bool:
+    if not entry.is_symlink():
+        return True
+
+    # Unlike glob, do not follow symlinks looping back forever.
+    target = os.path.realpath(entry.path)
+    if target in links:
+        return False
+    child_links[entry.name] = links + (target,)
+    return True
+
+
+class FilesetMatcher:
+    """The files selected by the fileset of a step (e.g. `stage`)."""
+
+    def __init__(self, includes: Sequence[str], excludes: Sequence[str]) -> None:
+        """Compile includes and excludes.
+
+        :param includes: paths or glob patterns (if they contain "*") of
+                         the files to select.
+        :param excludes: glob patterns of the files to not select.
+        """
+        self._literal_includes = [os.path.normpath(i) for i in includes if "*" not in i]
+        self._includes = _Glob([i for i in includes if "*" in i])
+        self._excludes = _Glob(excludes)
+
+    def match(self, directory: str) -> Tuple[Set[str], Set[str]]:
+        """Return the files and directories selected in directory.
+
+        Included directories select everything in them, and excluded
+        directories exclude everything in them. The files and directories
+        are returned with their parent directories resolved, along with
+        those parent directories.
+        """
+        include_matches = self._includes.match(directory)
+        for include in self._literal_includes:
+            include_matches[include] = None
+
+        excludes = self._excludes.match(directory)
+        exclude_dirs = {
+            path
+            for path, entry in excludes.items()
+            if (
+                _is_dir(entry)
+                if entry is not None
+                else os.path.isdir(_join(directory, path))
+            )
+        }
+        is_excluded = _ExcludedDirs(exclude_dirs)
+
+        # Whether the selected paths are directories (and not symlinks).
+        selected: Dict[str, bool] = dict()
+        for path, entry in include_matches.items():
+            selected[path] = _is_real_dir(directory, path, entry)
+
+        # Include the whole trees of included directories, skipping those
+        # that were already walked or are excluded.
+        walked: Set[str] = set()
+        for root in sorted(p for p in include_matches if selected[p]):
+            if root not in walked and not is_excluded(root):
+                _walk(directory, root, exclude_dirs, selected, walked)
+
+        files: Set[str] = set()
+        dirs: Set[str] = set()
+        for path, is_dir in selected.items():
+            if path not in excludes and not is_excluded(path):
+                (dirs if is_dir else files).add(path)
+
+        # Include (resolved) parent directories for each selected file.
+        resolver = _PathResolver(directory)
+        resolved_files = {resolver.resolve(f) for f in files}
+        parents: Set[str] = set()
+        for snap_file in resolved_files:
+            dirname = os.path.dirname(snap_file)
+            while dirname and dirname not in parents:
+                parents.add(dirname)
+                dirname = os.path.dirname(dirname)
+        dirs |= parents
+
+        return resolved_files, {resolver.resolve(d) for d in dirs}
+
+
+@functools.lru_cache(maxsize=None)
+def get_fileset_matcher(
+    includes: Tuple[str, ...], excludes: Tuple[str, ...]
+) -> FilesetMatcher:
+    """Return the (shared) FilesetMatcher for includes and excludes."""
+    return FilesetMatcher(includes, excludes)
+
+
+class _ExcludedDirs:
+    """Tell whether paths are in one of the excluded directories."""
+
+    def __init__(self, exclude_dirs: Set[str]) -> None:
+        self._exclude_dirs = exclude_dirs
+        self._cache: Dict[str, bool] = dict()
+
+    def __call__(self, path: str) -> bool:
+        if not self._exclude_dirs:
+            return False
+
+        parent = os.path.dirname(path)
+        if not parent:
+            return False
+        if parent not in self._cache:
+            self._cache[parent] = parent in self._exclude_dirs or self(parent)
+        return self._cache[parent]
+
+
+class _PathResolver:
+    """Resolve paths as file_utils.get_resolved_relative_path does.
+
+    The resolved parent directories are cached, as they are shared by
+    many of the paths.
+    """
+
+    def __init__(self, base_directory: str) -> None:
+        self._base_directory = os.path.abspath(base_directory)
+        self._parents: Dict[str, str] = dict()
+
+    def resolve(self, relative_path: str) -> str:
+        parent_relpath, filename = os.path.split(relative_path)
+        parent_abspath = self._parents.get(parent_relpath)
+        if parent_abspath is None:
+            parent_abspath = os.path.realpath(
+                os.path.join(self._base_directory, parent_relpath)
+            )
+            self._parents[parent_relpath] = parent_abspath
+
+        return os.path.relpath(
+            os.path.join(parent_abspath, filename), self._base_directory
+        )
+
+
+def _walk(
+    directory: str,
+    root: str,
+    exclude_dirs: Set[str],
+    selected: Dict[str, bool],
+    walked: Set[str],
+) -> None:
+    # Like os.walk, symlinks to directories are not followed.
+    pending = [root]
+    while pending:
+        relpath = pending.pop()
+        walked.add(relpath)
+        # Everything in excluded directories is excluded, but for the
+        # directory itself as its paths are not prefixed with it.
+        if relpath in exclude_dirs and relpath != ".":
+            continue
+
+        for entry in _scandir(_join(directory, relpath)):
+            path = _join(relpath, entry.name)
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            selected[path] = is_dir
+            if is_dir:
+                pending.append(path)
+
+
+def _scandir(path: str) -> List[os.DirEntry]:
+    # Directories that cannot be listed are skipped, as glob and os.walk do.
+    try:
+        with os.scandir(path) as iterator:
+            return list(iterator)
+    except OSError:
+        return []
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _is_real_dir(directory: str, path: str, entry: Optional[os.DirEntry]) -> bool:
+    try:
+        if entry is not None:
+            return entry.is_dir(follow_symlinks=False)
+        return stat.S_ISDIR(os.lstat(_join(directory, path)).st_mode)
+    except OSError:
+        return False
+
+
+def _join(directory: str, path: str) -> str:
+    return path if directory == "." else os.path.join(directory, path)
@@ -14,12 +14,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import logging
 import os
 from typing import Dict  # noqa: F401
 from typing import FrozenSet, List
 
-from snapcraft.internal import elf, errors
+from snapcraft.internal import common, elf, errors
 from snapcraft.project import Project
 
 logger = logging.getLogger(__name__)
@@ -78,10 +79,21 @@ class PartPatcher:
 
         # Patching all files instead of a subset of them to ensure the
         # environment is consistent and the chain of dlopens that may
-        # happen remains sane.
-        for elf_file in self._elf_files:
+        # happen remains sane. Files that are already patched are skipped.
+        elf_files = list(self._elf_files)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=common.get_elf_workers_count()
+        ) as executor:
+            results = [
+                executor.submit(elf_patcher.patch, elf_file=elf_file)
+                for elf_file in elf_files
+            ]
+
+        patched_count = 0
+        for elf_file, result in zip(elf_files, results):
             try:
-                elf_patcher.patch(elf_file=elf_file)
+                if result.result():
+                    patched_count += 1
             except errors.PatcherError as patch_error:
                 logger.warning(
                     "An attempt to patch {!r} so that it would work "
@@ -93,6 +105,12 @@ class PartPatcher:
                 )
                 raise patch_error
 
+        logger.debug(
+            "Patched {} ELF files, {} were already patched".format(
+                patched_count, len(elf_files) - patched_count
+            )
+        )
+
     def _verify_compat(self) -> None:
         if self._project._snap_meta.base is None:
             return
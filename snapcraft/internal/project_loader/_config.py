@@ -25,7 +25,7 @@ from typing import List, Set
 import jsonschema
 
 from snapcraft import formatting_utils, plugins, project
-from snapcraft.internal import deprecations, repo, states, steps
+from snapcraft.internal import deprecations, repo, steps
 from snapcraft.internal.meta.package_repository import PackageRepository
 from snapcraft.internal.meta.snap import Snap
 from snapcraft.internal.pluginhandler._part_environment import (
@@ -340,7 +340,7 @@ class Config:
 
         state = {}
         for part in self.parts.all_parts:
-            state[part.name] = states.get_state(part.part_state_dir, step)
+            state[part.name] = part.get_state(step)
 
         return state
 
@@ -0,0 +1,113 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+from typing import Dict, FrozenSet, Iterable, List, Mapping
+
+from . import errors
+
+
+class DependencyGraph:
+    """An index of the dependencies between parts.
+
+    The topological order and the transitive closures of both the
+    dependencies and the reverse dependencies are computed once, when
+    the graph is created, so all queries are simple lookups.
+    """
+
+    def __init__(self, dependencies: Mapping[str, Iterable[str]]) -> None:
+        """Create a new DependencyGraph.
+
+        :param dependencies: mapping of every part name to the names of the
+                             parts it needs to run after.
+        :raises errors.SnapcraftLogicError: if a circular dependency is found.
+        """
+        self._dependencies: Dict[str, FrozenSet[str]] = {
+            name: frozenset(deps) for name, deps in dependencies.items()
+        }
+
+        reverse_dependencies: Dict[str, set] = {n: set() for n in self._dependencies}
+        for name, deps in self._dependencies.items():
+            for dep in deps:
+                reverse_dependencies[dep].add(name)
+        self._reverse_dependencies: Dict[str, FrozenSet[str]] = {
+            name: frozenset(deps) for name, deps in reverse_dependencies.items()
+        }
+
+        self._order = self._sort()
+
+        # Dependencies come first in the topological order, so walking it
+        # forwards (backwards for reverse dependencies) only ever needs
+        # closures that have already been computed.
+        self._recursive_dependencies = _get_closures(self._order, self._dependencies)
+        self._recursive_reverse_dependencies = _get_closures(
+            reversed(self._order), self._reverse_dependencies
+        )
+
+    @property
+    def order(self) -> List[str]:
+        """Part names in the order they are to be processed."""
+        return list(self._order)
+
+    def get_dependencies(self, name: str, *, recursive: bool = False) -> FrozenSet[str]:
+        """Return the names of the parts name depends upon."""
+        if recursive:
+            return self._recursive_dependencies.get(name, frozenset())
+        return self._dependencies.get(name, frozenset())
+
+    def get_reverse_dependencies(
+        self, name: str, *, recursive: bool = False
+    ) -> FrozenSet[str]:
+        """Return the names of the parts that depend upon name."""
+        if recursive:
+            return self._recursive_reverse_dependencies.get(name, frozenset())
+        return self._reverse_dependencies.get(name, frozenset())
+
+    def _sort(self) -> List[str]:
+        # Kahn's algorithm run from the end: take the part no remaining part
+        # depends upon, breaking ties by picking the greatest name so the
+        # order is consistent between runs.
+        remaining = {n: len(deps) for n, deps in self._reverse_dependencies.items()}
+        ready = sorted(n for n, count in remaining.items() if count == 0)
+
+        order: List[str] = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for dep in self._dependencies[name]:
+                remaining[dep] -= 1
+                if remaining[dep] == 0:
+                    bisect.insort(ready, dep)
+
+        if len(order) != len(self._dependencies):
+            raise errors.SnapcraftLogicError(
+                "circular dependency chain found in parts definition"
+            )
+
+        order.reverse()
+        return order
+
+
+def _get_closures(
+    order: Iterable[str], edges: Mapping[str, FrozenSet[str]]
+) -> Dict[str, FrozenSet[str]]:
+    closures: Dict[str, FrozenSet[str]] = dict()
+    for name in order:
+        closure = set(edges[name])
+        for other in edges[name]:
+            closure |= closures[other]
+        closures[name] = frozenset(closure)
+    return closures
@@ -18,7 +18,7 @@ import logging
 from collections import ChainMap
 from os import path
 from typing import Set  # noqa: F401
-from typing import List
+from typing import Dict, Iterable, List
 
 import snapcraft
 from snapcraft.internal import elf, pluginhandler, repo
@@ -28,6 +28,7 @@ from snapcraft.internal.pluginhandler._part_environment import (
 )
 
 from . import errors, grammar_processing
+from ._dependency_graph import DependencyGraph
 from ._env import build_env, build_env_for_stage, runtime_env
 
 logger = logging.getLogger(__name__)
@@ -43,6 +44,7 @@ class PartsConfig:
 
         self.all_parts = []
         self._part_names = []
+        self._parts_by_name: Dict[str, pluginhandler.PluginHandler] = dict()
         self.after_requests = {}
 
         self._process_parts()
@@ -51,6 +53,10 @@ class PartsConfig:
     def part_names(self):
         return self._part_names
 
+    @property
+    def dependency_graph(self) -> DependencyGraph:
+        return self._dependency_graph
+
     def _process_parts(self):
         for part_name in self._parts_data:
             self._part_names.append(part_name)
@@ -81,84 +87,39 @@ class PartsConfig:
 
                 part.deps.append(dep)
 
-    def _sort_parts(self):
-        """Performs an inneficient but easy to follow sorting of parts."""
-        sorted_parts = []
-
-        # We want to process parts in a consistent order between runs. The
-        # simplest way to do this is to sort them by name.
-        self.all_parts = sorted(
-            self.all_parts, key=lambda part: part.name, reverse=True
+        self._dependency_graph = DependencyGraph(
+            {p.name: self.after_requests.get(p.name, []) for p in self.all_parts}
         )
 
-        while self.all_parts:
-            top_part = None
-            for part in self.all_parts:
-                mentioned = False
-                for other in self.all_parts:
-                    if part in other.deps:
-                        mentioned = True
-                        break
-                if not mentioned:
-                    top_part = part
-                    break
-            if not top_part:
-                raise errors.SnapcraftLogicError(
-                    "circular dependency chain found in parts definition"
-                )
-            sorted_parts = [top_part] + sorted_parts
-            self.all_parts.remove(top_part)
-
-        return sorted_parts
+    def _sort_parts(self):
+        """Sort parts so that dependencies come before their dependents."""
+        return [self._parts_by_name[n] for n in self._dependency_graph.order]
 
     def get_dependencies(
         self, part_name: str, *, recursive: bool = False
     ) -> Set[pluginhandler.PluginHandler]:
         """Returns a set of all the parts upon which part_name depends."""
 
-        dependency_names = set(self.after_requests.get(part_name, []))
-        dependencies = {p for p in self.all_parts if p.name in dependency_names}
-
-        if recursive:
-            # No need to worry about infinite recursion due to circular
-            # dependencies since the YAML validation won't allow it.
-            for dependency_name in dependency_names:
-                dependencies |= self.get_dependencies(
-                    dependency_name, recursive=recursive
-                )
-
-        return dependencies
+        return self._get_parts(
+            self._dependency_graph.get_dependencies(part_name, recursive=recursive)
+        )
 
     def get_reverse_dependencies(
         self, part_name: str, *, recursive: bool = False
     ) -> Set[pluginhandler.PluginHandler]:
         """Returns a set of all the parts that depend upon part_name."""
 
-        reverse_dependency_names = set()
-        for part, dependencies in self.after_requests.items():
-            if part_name in dependencies:
-                reverse_dependency_names.add(part)
-
-        reverse_dependencies = {
-            p for p in self.all_parts if p.name in reverse_dependency_names
-        }
-
-        if recursive:
-            # No need to worry about infinite recursion due to circular
-            # dependencies since the YAML validation won't allow it.
-            for reverse_dependency_name in reverse_dependency_names:
-                reverse_dependencies |= self.get_reverse_dependencies(
-                    reverse_dependency_name, recursive=recursive
-                )
+        return self._get_parts(
+            self._dependency_graph.get_reverse_dependencies(
+                part_name, recursive=recursive
+            )
+        )
 
-        return reverse_dependencies
+    def _get_parts(self, part_names: Iterable[str]) -> Set[pluginhandler.PluginHandler]:
+        return {self._parts_by_name[n] for n in part_names}
 
     def get_part(self, part_name):
-        for part in self.all_parts:
-            if part.name == part_name:
-                return part
-
-        return None
+        return self._parts_by_name.get(part_name)
 
     def clean_part(self, part_name, staged_state, primed_state, step):
         part = self.get_part(part_name)
@@ -211,6 +172,7 @@ class PartsConfig:
         )
 
         self.all_parts.append(part)
+        self._parts_by_name[part.name] = part
 
         return part
 
@@ -16,20 +16,20 @@
 
 import contextlib
 import fileinput
+import functools
 import glob
-import itertools
 import logging
 import os
 import pathlib
 import re
 import shutil
-import stat
-from typing import List, Optional, Set
+import time
+from typing import Dict, Iterator, List, Optional, Set
 
 from snapcraft import file_utils
-from snapcraft.internal import mangling, xattrs
+from snapcraft.internal import common
 
-from . import errors
+from . import _normalize, errors
 
 logger = logging.getLogger(__name__)
 
@@ -165,6 +165,17 @@ class BaseRepo:
         """
         raise errors.NoNativeBackendError()
 
+    @classmethod
+    @contextlib.contextmanager
+    def session(cls) -> Iterator[None]:
+        """Share the package caches opened until the session ends.
+
+        Package caches are otherwise opened again every time packages are
+        resolved. Sessions can be nested, caches are closed when the
+        outermost one ends.
+        """
+        yield
+
     @classmethod
     def fetch_stage_packages(
         cls,
@@ -190,7 +201,9 @@ class BaseRepo:
         raise errors.NoNativeBackendError()
 
     @classmethod
-    def normalize(cls, unpackdir: str) -> None:
+    def normalize(
+        cls, unpackdir: str, *, origins: Optional[Dict[str, str]] = None
+    ) -> Dict[str, float]:
         """Normalize artifacts in unpackdir.
 
         Repo specific packages are generally created to live in a specific
@@ -198,30 +211,59 @@ class BaseRepo:
         and slightly modifies them to work better with snapcraft projects
         when building and to also work within a snap's environment.
 
+        The files in unpackdir are visited once, by all the fixers returned
+        by _get_normalize_fixers. Files may be hard-linked to other trees, so
+        the links of the files changed in place are broken first.
+
         :param str unpackdir: directory where files where unpacked.
+        :param dict origins: the stage package each file comes from, by its
+                             path joined from unpackdir, to mark files with.
+        :returns: the seconds spent in each fixer, by fixer name.
         """
         cls._remove_useless_files(unpackdir)
-        cls._fix_artifacts(unpackdir)
-        cls._fix_xml_tools(unpackdir)
-        cls._fix_shebangs(unpackdir)
 
-    @classmethod
-    def _mark_origin_stage_package(
-        cls, sources_dir: str, stage_package: str
-    ) -> Set[str]:
-        """Mark all files in sources_dir as coming from stage_package."""
-        file_list = set()
-        for (root, dirs, files) in os.walk(sources_dir):
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-
-                # Mark source.
-                xattrs.write_origin_stage_package(file_path, stage_package)
+        start = time.monotonic()
+        timings = _normalize.normalize_tree(
+            unpackdir,
+            cls._get_normalize_fixers(unpackdir, origins=origins),
+            workers=common.get_file_workers_count(),
+        )
+        logger.debug(
+            "Normalized {!r} in {:.3f}s ({})".format(
+                unpackdir,
+                time.monotonic() - start,
+                ", ".join(
+                    "{}: {:.3f}s".format(name, elapsed)
+                    for name, elapsed in timings.items()
+                ),
+            )
+        )
 
-                file_path = os.path.relpath(root, sources_dir)
-                file_list.add(file_path)
+        cls._fix_xml_tools(unpackdir)
+        return timings
 
-        return file_list
+    @classmethod
+    def _get_normalize_fixers(
+        cls, unpackdir: str, *, origins: Optional[Dict[str, str]] = None
+    ) -> List[_normalize.Fixer]:
+        """Return the fixers normalize applies to each file, in order."""
+        fixers: List[_normalize.Fixer] = [
+            # Sometimes distro packages will contain absolute symlinks (e.g.
+            # if the relative path would go all the way to root, they just do
+            # absolute). We can't have that, so instead clean those absolute
+            # symlinks.
+            _normalize.SymlinkFixer(
+                functools.partial(cls._fix_symlink, unpack_dir=unpackdir)
+            ),
+            # Some unpacked items will also contain suid binaries which we do
+            # not want in the resulting snap.
+            _normalize.FileModeFixer(),
+            _normalize.PkgConfigFixer(functools.partial(fix_pkg_config, unpackdir)),
+            _normalize.ShebangFixer(),
+        ]
+        if origins:
+            fixers.append(_normalize.OriginFixer(origins))
+        return fixers
 
     @classmethod
     def _remove_useless_files(cls, unpackdir: str) -> None:
@@ -232,38 +274,11 @@ class BaseRepo:
         for sitecustomize_file in sitecustomize_files:
             os.remove(sitecustomize_file)
 
-    @classmethod
-    def _fix_artifacts(cls, unpackdir: str) -> None:
-        """Perform various modifications to unpacked artifacts.
-
-        Sometimes distro packages will contain absolute symlinks (e.g. if the
-        relative path would go all the way to root, they just do absolute). We
-        can't have that, so instead clean those absolute symlinks.
-
-        Some unpacked items will also contain suid binaries which we do not
-        want in the resulting snap.
-        """
-        for root, dirs, files in os.walk(unpackdir):
-            # Symlinks to directories will be in dirs, while symlinks to
-            # non-directories will be in files.
-            for entry in itertools.chain(files, dirs):
-                path = os.path.join(root, entry)
-                if os.path.islink(path):
-                    cls._fix_symlink(path, unpackdir)
-                elif os.path.exists(path):
-                    _fix_filemode(path)
-
-                if (
-                    path.endswith(".pc")
-                    and os.path.isfile(path)
-                    and not os.path.islink(path)
-                ):
-                    fix_pkg_config(unpackdir, path)
-
     @classmethod
     def _fix_xml_tools(cls, unpackdir: str) -> None:
         xml2_config_path = os.path.join(unpackdir, "usr", "bin", "xml2-config")
         with contextlib.suppress(FileNotFoundError):
+            file_utils.break_hard_link(xml2_config_path)
             file_utils.search_and_replace_contents(
                 xml2_config_path,
                 re.compile(r"prefix=/usr"),
@@ -272,6 +287,7 @@ class BaseRepo:
 
         xslt_config_path = os.path.join(unpackdir, "usr", "bin", "xslt-config")
         with contextlib.suppress(FileNotFoundError):
+            file_utils.break_hard_link(xslt_config_path)
             file_utils.search_and_replace_contents(
                 xslt_config_path,
                 re.compile(r"prefix=/usr"),
@@ -318,11 +334,6 @@ class BaseRepo:
         relative_link = os.path.relpath(symlink_path, unpack_dir)
         logger.warning("%r will be a dangling symlink", relative_link)
 
-    @classmethod
-    def _fix_shebangs(cls, unpackdir: str) -> None:
-        """Change hard-coded shebangs in unpacked files to use env."""
-        mangling.rewrite_python_shebangs(unpackdir)
-
 
 class DummyRepo(BaseRepo):
     @classmethod
@@ -352,13 +363,6 @@ def fix_pkg_config(
                 print(line, end="")
 
 
-def _fix_filemode(path: str) -> None:
-    mode = stat.S_IMODE(os.stat(path, follow_symlinks=False).st_mode)
-    if mode & 0o4000 or mode & 0o2000:
-        logger.warning("Removing suid/guid from {}".format(path))
-        os.chmod(path, mode & 0o1777)
-
-
 def get_pkg_name_parts(pkg_name):
     """Break package name into base parts"""
 
@@ -14,37 +14,47 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import fileinput
-import functools
+import contextlib
+import hashlib
 import logging
 import os
 import pathlib
 import re
 import subprocess
 import sys
-import tempfile
-from typing import Dict, List, Optional, Set, Tuple  # noqa: F401
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple  # noqa: F401
 
 from xdg import BaseDirectory
 
 from snapcraft import file_utils
+from snapcraft.internal import common
 from snapcraft.internal.indicators import is_dumb_terminal
 
-from . import errors
+from . import _deb_cache, _debfile, _dpkg, _stage_packages_lock, errors
 from ._base import BaseRepo, get_pkg_name_parts
 from .deb_package import DebPackage
 
 if sys.platform == "linux":
     # Ensure importing works on non-Linux.
-    from .apt_cache import AptCache
+    from .apt_cache import AptCache, get_sources_digest
 
 logger = logging.getLogger(__name__)
 
-_DEB_CACHE_DIR: pathlib.Path = pathlib.Path(
-    BaseDirectory.save_cache_path("snapcraft", "download")
-)
-_STAGE_CACHE_DIR: pathlib.Path = pathlib.Path(
-    BaseDirectory.save_cache_path("snapcraft", "stage-packages")
+
+def _save_cache_path(*resource: str) -> pathlib.Path:
+    # Unlike BaseDirectory.save_cache_path, do not fail when another process
+    # creates the directory at the same time, e.g. snapcraftctl from the
+    # scriptlets of parts run in parallel.
+    path = pathlib.Path(BaseDirectory.xdg_cache_home, *resource)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+_DEB_CACHE_DIR: pathlib.Path = _save_cache_path("snapcraft", "download")
+_STAGE_CACHE_DIR: pathlib.Path = _save_cache_path("snapcraft", "stage-packages")
+_EXTRACTED_DEB_CACHE = _deb_cache.ExtractedDebCache(
+    str(_save_cache_path("snapcraft", "extracted-debs"))
 )
 
 _HASHSUM_MISMATCH_PATTERN = re.compile(r"(E:Failed to fetch.+Hash Sum mismatch)+")
@@ -207,41 +217,76 @@ IGNORE_FILTERS: Dict[str, Set[str]] = {
 }
 
 
-@functools.lru_cache(maxsize=256)
-def _run_dpkg_query_search(file_path: str) -> str:
-    try:
-        output = (
-            subprocess.check_output(
-                ["dpkg-query", "-S", os.path.join(os.path.sep, file_path)],
-                stderr=subprocess.STDOUT,
-                env=dict(LANG="C.UTF-8"),
-            )
-            .decode()
-            .strip()
-        )
-    except subprocess.CalledProcessError as call_error:
-        logger.debug(
-            "Error finding package for {}: {}".format(file_path, str(call_error))
-        )
-        raise errors.FileProviderNotFound(file_path=file_path) from call_error
-
-    # Remove diversions
-    provides_output = [p for p in output.splitlines() if not p.startswith("diversion")][
-        0
-    ]
-    return provides_output.split(":")[0]
-
-
-@functools.lru_cache(maxsize=256)
-def _run_dpkg_query_list_files(package_name: str) -> Set[str]:
-    output = (
-        subprocess.check_output(["dpkg", "-L", package_name])
-        .decode(sys.getfilesystemencoding())
-        .strip()
-        .split()
-    )
+# The dpkg database of the host, indexed on first use.
+_DPKG_DATABASE = _dpkg.DpkgDatabase()
+
+
+class _AptCacheSession:
+    """The apt caches kept open for reuse.
+
+    The host cache is opened on first use and kept open for the rest of the
+    process, it is opened again when the package lists or the installed
+    packages change, or when invalidated. Stage caches are only kept open
+    while a session is active.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._host_cache: Optional["AptCache"] = None
+        # The stage caches opened in the session, by target arch.
+        self._stage_caches: Dict[str, "AptCache"] = dict()
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator[None]:
+        with self._lock:
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if self._depth == 0:
+                    apt_caches = list(self._stage_caches.values())
+                    self._stage_caches.clear()
+                else:
+                    apt_caches = []
+            for apt_cache in apt_caches:
+                apt_cache.close()
+
+    def get_stage_cache(self, target_arch: str) -> "AptCache":
+        """Return the stage cache for target_arch, shared while active."""
+        with self._lock:
+            if self._depth == 0:
+                return AptCache(
+                    stage_cache=_STAGE_CACHE_DIR, stage_cache_arch=target_arch
+                )
+            apt_cache = self._stage_caches.get(target_arch)
+            if apt_cache is None:
+                apt_cache = AptCache(
+                    stage_cache=_STAGE_CACHE_DIR,
+                    stage_cache_arch=target_arch,
+                    keep_open=True,
+                )
+                self._stage_caches[target_arch] = apt_cache
+            return apt_cache
+
+    def get_host_cache(self) -> "AptCache":
+        """Return the host cache, shared by the whole process."""
+        with self._lock:
+            if self._host_cache is None:
+                self._host_cache = AptCache(keep_open=True)
+            return self._host_cache
 
-    return {i for i in output if ("lib" in i and os.path.isfile(i))}
+    def invalidate_host_cache(self) -> None:
+        """Open the host cache again on next use, e.g. after installing."""
+        with self._lock:
+            host_cache = self._host_cache
+        if host_cache is not None:
+            host_cache.close()
+
+
+_APT_CACHE_SESSION = _AptCacheSession()
 
 
 def _get_dpkg_list_path(base: str) -> pathlib.Path:
@@ -266,30 +311,28 @@ def get_packages_in_base(*, base: str) -> List[DebPackage]:
         return [DebPackage.from_unparsed(p) for p in _DEFAULT_FILTERED_STAGE_PACKAGES]
 
     base_package_list_path = _get_dpkg_list_path(base)
-    if not base_package_list_path.exists():
+    try:
+        package_names = _dpkg.read_dpkg_list(str(base_package_list_path))
+    except FileNotFoundError:
         return list()
 
-    # Lines we care about in dpkg.list had the following format:
-    # ii adduser 3.118ubuntu1 all add and rem
-    package_list = list()
-    with fileinput.input(str(base_package_list_path)) as fp:
-        for line in fp:
-            if not line.startswith("ii "):
-                continue
-            package = DebPackage.from_unparsed(line.split()[1])
-            package_list.append(package)
-
-    return package_list
+    return [DebPackage.from_unparsed(name) for name in package_names]
 
 
 class Ubuntu(BaseRepo):
+    @classmethod
+    @contextlib.contextmanager
+    def session(cls) -> Iterator[None]:
+        with _APT_CACHE_SESSION.activate():
+            yield
+
     @classmethod
     def get_package_libraries(cls, package_name: str) -> Set[str]:
-        return _run_dpkg_query_list_files(package_name)
+        return _DPKG_DATABASE.get_package_libraries(package_name)
 
     @classmethod
     def get_package_for_file(cls, file_path: str) -> str:
-        return _run_dpkg_query_search(file_path)
+        return _DPKG_DATABASE.get_package_for_file(file_path)
 
     @classmethod
     def get_packages_for_source_type(cls, source_type):
@@ -322,6 +365,9 @@ class Ubuntu(BaseRepo):
             raise errors.CacheUpdateFailedError(
                 "failed to run apt update"
             ) from call_error
+        finally:
+            # The package lists may have changed, even if apt update failed.
+            _APT_CACHE_SESSION.invalidate_host_cache()
 
     @classmethod
     def _check_if_all_packages_installed(cls, package_names: List[str]) -> bool:
@@ -334,7 +380,7 @@ class Ubuntu(BaseRepo):
         :return True if _all_ packages are installed (with correct versions).
         """
 
-        with AptCache() as apt_cache:
+        with _APT_CACHE_SESSION.get_host_cache() as apt_cache:
             for package in package_names:
                 pkg_name, pkg_version = get_pkg_name_parts(package)
                 installed_version = apt_cache.get_installed_version(
@@ -352,7 +398,7 @@ class Ubuntu(BaseRepo):
     def _get_packages_marked_for_installation(
         cls, package_names: List[str]
     ) -> List[Tuple[str, str]]:
-        with AptCache() as apt_cache:
+        with _APT_CACHE_SESSION.get_host_cache() as apt_cache:
             try:
                 apt_cache.mark_packages(set(package_names))
             except errors.PackageNotFoundError as error:
@@ -424,6 +470,8 @@ class Ubuntu(BaseRepo):
             subprocess.check_call(apt_command + package_names, env=env)
         except subprocess.CalledProcessError:
             raise errors.BuildPackagesNotInstalledError(packages=package_names)
+        finally:
+            _APT_CACHE_SESSION.invalidate_host_cache()
 
         versionless_names = [get_pkg_name_parts(p)[0] for p in package_names]
         try:
@@ -448,80 +496,93 @@ class Ubuntu(BaseRepo):
 
         installed: Set[str] = set()
 
+        stage_packages_path.mkdir(exist_ok=True)
+        # Packages are only resolved again when the lock does not match the
+        # apt sources or the requested packages anymore. Plugins may fetch
+        # other packages to the same directory (e.g. rosdep dependencies), so
+        # each set of requested packages has its own lock.
+        names_digest = hashlib.sha256(
+            "\n".join(sorted(package_names)).encode()
+        ).hexdigest()
         package_list = [DebPackage.from_unparsed(name) for name in package_names]
         filtered_names = _get_filtered_stage_package_names(
             base=base, package_list=package_list
         )
+        lock = _stage_packages_lock.StagePackagesLock(
+            stage_packages_path / f"stage-packages-{names_digest[:16]}.lock",
+            sources_digest=get_sources_digest(),
+            target_arch=target_arch,
+            filtered_names=filtered_names,
+            package_names=package_names,
+        )
+        fetched_packages = lock.get_fetched_packages(_DEB_CACHE_DIR)
+        if fetched_packages is None:
+            fetched_packages = cls._resolve_stage_packages(
+                package_names=package_names,
+                filtered_names=filtered_names,
+                target_arch=target_arch,
+            )
+            lock.write(fetched_packages)
+        else:
+            logger.debug(f"Using the stage-packages locked in {str(lock.path)!r}")
 
-        stage_packages_path.mkdir(exist_ok=True)
-        with AptCache(
-            stage_cache=_STAGE_CACHE_DIR, stage_cache_arch=target_arch
-        ) as apt_cache:
-            apt_cache.mark_packages(set(package_names))
-            apt_cache.unmark_packages(filtered_names)
-            for pkg_name, pkg_version, dl_path in apt_cache.fetch_archives(
-                _DEB_CACHE_DIR
-            ):
-                logger.debug(f"Extracting stage package: {pkg_name}")
-                installed.add(f"{pkg_name}={pkg_version}")
-                file_utils.link_or_copy(
-                    str(dl_path), str(stage_packages_path / dl_path.name)
-                )
+        for pkg_name, pkg_version, dl_path in fetched_packages:
+            logger.debug(f"Extracting stage package: {pkg_name}")
+            installed.add(f"{pkg_name}={pkg_version}")
+            file_utils.link_or_copy(
+                str(dl_path), str(stage_packages_path / dl_path.name)
+            )
 
         return sorted(installed)
 
+    @classmethod
+    def _resolve_stage_packages(
+        cls,
+        *,
+        package_names: List[str],
+        filtered_names: Set[str],
+        target_arch: str,
+    ) -> List[Tuple[str, str, pathlib.Path]]:
+        with _APT_CACHE_SESSION.get_stage_cache(target_arch) as apt_cache:
+            apt_cache.mark_packages(set(package_names))
+            apt_cache.unmark_packages(filtered_names)
+            return apt_cache.fetch_archives(_DEB_CACHE_DIR)
+
     @classmethod
     def unpack_stage_packages(
         cls, *, stage_packages_path: pathlib.Path, install_path: pathlib.Path
     ) -> None:
-        pkg_path = None
-
-        for pkg_path in stage_packages_path.glob("*.deb"):
-            with tempfile.TemporaryDirectory(suffix="deb-extract") as extract_dir:
-                # Extract deb package.
-                cls._extract_deb(pkg_path, extract_dir)
-                # Mark source of files.
-                marked_name = cls._extract_deb_name_version(pkg_path)
-                cls._mark_origin_stage_package(extract_dir, marked_name)
-                # Stage files to install_dir.
-                file_utils.link_or_copy_tree(extract_dir, install_path.as_posix())
+        # Later packages win over earlier ones for the paths they share, so
+        # extract them in a stable order.
+        deb_paths = sorted(stage_packages_path.glob("*.deb"))
+        if not deb_paths:
+            return
 
-        if pkg_path:
-            cls.normalize(str(install_path))
+        workers = common.get_file_workers_count()
+        try:
+            origins = _EXTRACTED_DEB_CACHE.install(
+                deb_paths, str(install_path), workers=workers
+            )
+        except OSError as error:
+            logger.debug(f"Cannot install stage packages from the cache: {error}")
+            origins = _debfile.extract_debs(
+                deb_paths, str(install_path), workers=workers
+            )
+        cls.normalize(str(install_path), origins=origins)
 
     @classmethod
     def build_package_is_valid(cls, package_name) -> bool:
-        with AptCache() as apt_cache:
+        with _APT_CACHE_SESSION.get_host_cache() as apt_cache:
             return apt_cache.is_package_valid(package_name)
 
     @classmethod
     def is_package_installed(cls, package_name) -> bool:
-        with AptCache() as apt_cache:
+        with _APT_CACHE_SESSION.get_host_cache() as apt_cache:
             return apt_cache.get_installed_version(package_name) is not None
 
     @classmethod
     def get_installed_packages(cls) -> List[str]:
-        with AptCache() as apt_cache:
-            return [
-                f"{pkg_name}={pkg_version}"
-                for pkg_name, pkg_version in apt_cache.get_installed_packages().items()
-            ]
-
-    @classmethod
-    def _extract_deb_name_version(cls, deb_path: pathlib.Path) -> str:
-        try:
-            output = subprocess.check_output(
-                ["dpkg-deb", "--show", "--showformat=${Package}=${Version}", deb_path]
-            )
-        except subprocess.CalledProcessError:
-            raise errors.UnpackError(deb_path)
-
-        return output.decode().strip()
-
-    @classmethod
-    def _extract_deb(cls, deb_path: pathlib.Path, extract_dir: str) -> None:
-        """Extract deb and return `<package-name>=<version>`."""
-        try:
-            subprocess.check_call(["dpkg-deb", "--extract", deb_path, extract_dir])
-        except subprocess.CalledProcessError:
-            raise errors.UnpackError(deb_path)
+        return [
+            f"{pkg_name}={pkg_version}"
+            for pkg_name, pkg_version in _DPKG_DATABASE.get_installed_packages().items()
+        ]
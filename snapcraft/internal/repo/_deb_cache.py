@@ -0,0 +1,249 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Keep the files of extracted deb packages, to copy them from."""
+
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import stat
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from snapcraft import file_utils
+
+from . import _debfile
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of entries, or how packages are extracted, changes.
+_CACHE_VERSION = 1
+
+# Files are handed to the workers in chunks, a thread per copy costs more
+# than the copy of most files does.
+_CHUNK_SIZE = 256
+
+
+class ExtractedDebCache:
+    """A cache of the files of deb packages, by the SHA256 of the packages.
+
+    Packages are extracted to the cache once, and their files are then copied
+    to install directories, sharing their data when the filesystem supports
+    reflinks. Files are never hard linked, for changes made in place to an
+    install directory (e.g. by plugins or scriptlets) not to reach the cache
+    or the other install directories.
+
+    The mode, size and modification time of cached files are checked before
+    copying them, and packages whose files changed are extracted again.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self._entries_dir = os.path.join(cache_dir, "v{}".format(_CACHE_VERSION))
+
+    def install(
+        self, deb_paths: Sequence[pathlib.Path], install_dir: str, *, workers: int
+    ) -> Dict[str, str]:
+        """Install the files of the deb packages at deb_paths to install_dir.
+
+        Packages missing from the cache are extracted to it first. As with
+        _debfile.extract_debs, paths shipped by several packages are left
+        with the files of the package that comes last in deb_paths.
+
+        :returns: the <name>=<version> of the package each file comes from, by
+                  its path joined from install_dir.
+        :raises snapcraft.repo.errors.UnpackError:
+            if a package cannot be extracted.
+        """
+        os.makedirs(self._entries_dir, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = list(executor.map(self._get_entry, deb_paths))
+
+            origins: Dict[str, str] = dict()
+            directories: Dict[str, Tuple[int, int]] = dict()
+            for entry in entries:
+                origins.update(entry.copy(install_dir, executor))
+                directories.update(entry.get_directories(install_dir))
+
+        # Directories are changed by the files copied in them, so their
+        # metadata is only set once all files are in place.
+        for path, (mode, mtime_ns) in sorted(directories.items(), reverse=True):
+            os.chmod(path, mode & 0o7777)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return origins
+
+    def _get_entry(self, deb_path: pathlib.Path) -> "_Entry":
+        sha256 = file_utils.calculate_hash(str(deb_path), algorithm="sha256")
+        entry_dir = os.path.join(self._entries_dir, sha256)
+
+        entry = _Entry.load(entry_dir)
+        if entry is not None:
+            if entry.is_intact():
+                logger.debug("Cache hit for {!r}".format(str(deb_path)))
+                return entry
+            logger.debug("Files of {!r} changed in the cache".format(str(deb_path)))
+            self._remove(entry_dir)
+
+        return self._add(deb_path, entry_dir)
+
+    def _add(self, deb_path: pathlib.Path, entry_dir: str) -> "_Entry":
+        # Entries are built aside and moved in place once complete, so that
+        # partial entries are never used.
+        temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self._entries_dir)
+        try:
+            tree_dir = os.path.join(temp_dir, "tree")
+            os.mkdir(tree_dir)
+            _debfile.extract_debs([deb_path], tree_dir, workers=1)
+            stage_package = _debfile.DebFile(deb_path).get_name_version()
+            _write_manifest(temp_dir, stage_package)
+            os.rename(temp_dir, entry_dir)
+        except OSError as error:
+            file_utils.rmtree(temp_dir)
+            # Another part may have added the same package meanwhile.
+            entry = _Entry.load(entry_dir)
+            if entry is None:
+                raise
+            logger.debug("Cannot add {!r}: {}".format(entry_dir, error))
+            return entry
+        except BaseException:
+            file_utils.rmtree(temp_dir)
+            raise
+
+        entry = _Entry.load(entry_dir)
+        assert entry is not None
+        return entry
+
+    def _remove(self, entry_dir: str) -> None:
+        # The entry is moved aside first, for it not to be seen half removed.
+        temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self._entries_dir)
+        with contextlib.suppress(FileNotFoundError):
+            os.rename(entry_dir, os.path.join(temp_dir, "entry"))
+        file_utils.rmtree(temp_dir)
+
+
+class _Entry:
+    """The files of a package in the cache, and their expected metadata."""
+
+    def __init__(self, entry_dir: str, manifest: Dict[str, Any]) -> None:
+        self._tree_dir = os.path.join(entry_dir, "tree")
+        self.stage_package: str = manifest["stage_package"]
+        # The mode and modification time of directories, by relative path.
+        self._directories: Dict[str, List[int]] = manifest["directories"]
+        # The mode, size and modification time of files, by relative path.
+        self._files: Dict[str, List[int]] = manifest["files"]
+        # The target of symlinks, by relative path.
+        self._symlinks: Dict[str, str] = manifest["symlinks"]
+
+    @classmethod
+    def load(cls, entry_dir: str) -> Optional["_Entry"]:
+        try:
+            with open(os.path.join(entry_dir, "manifest.json")) as manifest_file:
+                return cls(entry_dir, json.load(manifest_file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as error:
+            logger.debug("Cannot load {!r}: {}".format(entry_dir, error))
+            return None
+
+    def is_intact(self) -> bool:
+        """Tell whether the cached files are as they were extracted."""
+        for relative_path, metadata in self._files.items():
+            try:
+                path_stat = os.lstat(os.path.join(self._tree_dir, relative_path))
+            except OSError:
+                return False
+            if _get_file_metadata(path_stat) != metadata:
+                return False
+        return True
+
+    def copy(
+        self, install_dir: str, executor: concurrent.futures.Executor
+    ) -> Dict[str, str]:
+        """Copy the files of the entry to install_dir.
+
+        :returns: the stage package of each file, by its path joined from
+                  install_dir.
+        """
+        for relative_path in sorted(self._directories):
+            os.makedirs(os.path.join(install_dir, relative_path), exist_ok=True)
+
+        relative_paths = list(self._files)
+        chunks = [
+            relative_paths[i : i + _CHUNK_SIZE]
+            for i in range(0, len(relative_paths), _CHUNK_SIZE)
+        ]
+        # Consume the results to raise the first error found.
+        for _ in executor.map(lambda c: self._copy_files(c, install_dir), chunks):
+            pass
+
+        for relative_path, target in self._symlinks.items():
+            path = os.path.join(install_dir, relative_path)
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            os.symlink(target, path)
+
+        return {
+            os.path.join(install_dir, relative_path): self.stage_package
+            for relative_path in [*self._files, *self._symlinks]
+        }
+
+    def _copy_files(self, relative_paths: List[str], install_dir: str) -> None:
+        for relative_path in relative_paths:
+            file_utils.copy(
+                os.path.join(self._tree_dir, relative_path),
+                os.path.join(install_dir, relative_path),
+            )
+
+    def get_directories(self, install_dir: str) -> Dict[str, Tuple[int, int]]:
+        """Return the mode and modification time of the directories to create."""
+        return {
+            os.path.join(install_dir, relative_path): (mode, mtime_ns)
+            for relative_path, (mode, mtime_ns) in self._directories.items()
+        }
+
+
+def _write_manifest(entry_dir: str, stage_package: str) -> None:
+    """Write the manifest of the files extracted to entry_dir/tree."""
+    tree_dir = os.path.join(entry_dir, "tree")
+    manifest: Dict[str, Any] = {
+        "stage_package": stage_package,
+        "directories": dict(),
+        "files": dict(),
+        "symlinks": dict(),
+    }
+    for directory, directories, files in os.walk(tree_dir):
+        for name in directories + files:
+            path = os.path.join(directory, name)
+            relative_path = os.path.relpath(path, tree_dir)
+            path_stat = os.lstat(path)
+            if stat.S_ISDIR(path_stat.st_mode):
+                manifest["directories"][relative_path] = [
+                    path_stat.st_mode,
+                    path_stat.st_mtime_ns,
+                ]
+            elif stat.S_ISLNK(path_stat.st_mode):
+                manifest["symlinks"][relative_path] = os.readlink(path)
+            elif stat.S_ISREG(path_stat.st_mode):
+                manifest["files"][relative_path] = _get_file_metadata(path_stat)
+
+    with open(os.path.join(entry_dir, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def _get_file_metadata(path_stat: os.stat_result) -> List[int]:
+    return [path_stat.st_mode, path_stat.st_size, path_stat.st_mtime_ns]
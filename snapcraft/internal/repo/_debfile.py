@@ -0,0 +1,316 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Read and extract deb packages without running dpkg-deb."""
+
+import bz2
+import concurrent.futures
+import contextlib
+import gzip
+import io
+import logging
+import lzma
+import os
+import pathlib
+import shutil
+import struct
+import subprocess
+import tarfile
+import threading
+import zlib
+from typing import IO, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from . import errors
+
+logger = logging.getLogger(__name__)
+
+_AR_MAGIC = b"!<arch>\n"
+# name, mtime, uid, gid, mode, size and the "`\n" terminator.
+_AR_HEADER = struct.Struct("16s12s6s6s8s10s2s")
+
+# The decompressors of the tar members of packages, by file name extension.
+# Members compressed otherwise (e.g. with zstd) are read through dpkg-deb.
+_DECOMPRESSORS: Dict[str, Callable[[IO[bytes]], IO[bytes]]] = {
+    "": lambda member: member,
+    ".gz": lambda member: gzip.GzipFile(fileobj=member, mode="rb"),
+    ".xz": lzma.LZMAFile,
+    ".bz2": bz2.BZ2File,
+}
+
+_EXTRACT_ERRORS = (OSError, EOFError, tarfile.TarError, lzma.LZMAError, zlib.error)
+
+
+class DebFile:
+    """A deb package, read in place."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        """Read the table of contents of the deb package at path.
+
+        :raises snapcraft.repo.errors.UnpackError:
+            if path is not a deb package.
+        """
+        self.path = path
+        # The offset and size of each member, by name.
+        self._members: Dict[str, Tuple[int, int]] = dict()
+
+        try:
+            with path.open("rb") as deb_file:
+                self._read_members(deb_file)
+        except (OSError, ValueError, struct.error) as error:
+            logger.debug("Cannot read {!r}: {}".format(str(path), error))
+            raise errors.UnpackError(path) from error
+
+    def _read_members(self, deb_file: IO[bytes]) -> None:
+        if deb_file.read(len(_AR_MAGIC)) != _AR_MAGIC:
+            raise ValueError("not an ar archive")
+
+        offset = len(_AR_MAGIC)
+        while True:
+            header = deb_file.read(_AR_HEADER.size)
+            if not header:
+                break
+            name, _, _, _, _, size, terminator = _AR_HEADER.unpack(header)
+            if terminator != b"`\n":
+                raise ValueError("corrupted ar member header")
+
+            offset += _AR_HEADER.size
+            member_size = int(size)
+            # GNU ar terminates names with a slash.
+            self._members[name.decode().strip().rstrip("/")] = (offset, member_size)
+
+            # Members are aligned on even offsets.
+            offset += member_size + member_size % 2
+            deb_file.seek(offset)
+
+    def get_control(self) -> Dict[str, str]:
+        """Return the fields of the control file of the package."""
+        with self._open_tar("control", "--ctrl-tarfile") as control_tar:
+            for member in control_tar:
+                if os.path.normpath(member.name) == "control":
+                    control_file = control_tar.extractfile(member)
+                    if control_file is None:
+                        break
+                    return _parse_control(control_file.read().decode())
+        raise errors.UnpackError(self.path)
+
+    def get_name_version(self) -> str:
+        """Return the package name and version, as <name>=<version>."""
+        control = self.get_control()
+        return "{}={}".format(control.get("Package", ""), control.get("Version", ""))
+
+    @contextlib.contextmanager
+    def open_data(self) -> Iterator[tarfile.TarFile]:
+        """Open the tar archive of the files of the package, to stream."""
+        with self._open_tar("data", "--fsys-tarfile") as data_tar:
+            yield data_tar
+
+    @contextlib.contextmanager
+    def _open_tar(self, name: str, dpkg_deb_option: str) -> Iterator[tarfile.TarFile]:
+        member_name, extension = self._find_tar_member(name)
+        decompressor = _DECOMPRESSORS.get(extension)
+        if decompressor is None:
+            with self._open_tar_with_dpkg_deb(dpkg_deb_option) as tar:
+                yield tar
+            return
+
+        offset, size = self._members[member_name]
+        with self.path.open("rb") as deb_file:
+            deb_file.seek(offset)
+            tar_file = decompressor(_MemberReader(deb_file, size))  # type: ignore
+            with tarfile.open(fileobj=tar_file, mode="r|") as tar:
+                yield tar
+            # Decompress up to the end, for truncated members to be found.
+            while tar_file.read(io.DEFAULT_BUFFER_SIZE):
+                pass
+
+    @contextlib.contextmanager
+    def _open_tar_with_dpkg_deb(
+        self, dpkg_deb_option: str
+    ) -> Iterator[tarfile.TarFile]:
+        process = subprocess.Popen(
+            ["dpkg-deb", dpkg_deb_option, str(self.path)], stdout=subprocess.PIPE
+        )
+        assert process.stdout is not None
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                yield tar
+            # Read the padding left after the archive, for dpkg-deb to exit.
+            while process.stdout.read(io.DEFAULT_BUFFER_SIZE):
+                pass
+        finally:
+            process.stdout.close()
+            return_code = process.wait()
+
+        if return_code != 0:
+            raise errors.UnpackError(self.path)
+
+    def _find_tar_member(self, name: str) -> Tuple[str, str]:
+        for member_name in self._members:
+            if member_name.startswith(name + ".tar"):
+                return member_name, member_name[len(name + ".tar") :]
+        raise errors.UnpackError(self.path)
+
+
+class _MemberReader:
+    """Read a member of an ar archive, up to its end."""
+
+    def __init__(self, archive: IO[bytes], size: int) -> None:
+        self._archive = archive
+        self._remaining = size
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._archive.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+def _parse_control(contents: str) -> Dict[str, str]:
+    control: Dict[str, str] = dict()
+    for line in contents.splitlines():
+        if line and not line[0].isspace():
+            field, _, value = line.partition(":")
+            control[field] = value.strip()
+    return control
+
+
+def extract_debs(
+    deb_paths: Sequence[pathlib.Path], install_dir: str, *, workers: int
+) -> Dict[str, str]:
+    """Extract the files of the deb packages at deb_paths to install_dir.
+
+    Packages are extracted by workers threads, each writing files straight
+    to install_dir. Paths shipped by several packages are left with the
+    files of the package that comes last in deb_paths, whatever the order
+    packages are extracted in.
+
+    :returns: the <name>=<version> of the package each file comes from, by
+              its path joined from install_dir.
+    :raises snapcraft.repo.errors.UnpackError:
+        if a package cannot be extracted.
+    """
+    extractor = _Extractor(install_dir)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(extractor.extract, priority, deb_path)
+            for priority, deb_path in enumerate(deb_paths)
+        ]
+        # Raise the first error found.
+        for future in futures:
+            future.result()
+
+    extractor.set_directories_metadata()
+    return extractor.origins
+
+
+class _Extractor:
+    def __init__(self, install_dir: str) -> None:
+        self._install_dir = install_dir
+        self._lock = threading.Lock()
+        # The priority of the package each path was last written by.
+        self._owners: Dict[str, int] = dict()
+        # The priority, mode and modification time of directories.
+        self._directories: Dict[str, Tuple[int, int, int]] = dict()
+        self.origins: Dict[str, str] = dict()
+
+    def extract(self, priority: int, deb_path: pathlib.Path) -> None:
+        deb_file = DebFile(deb_path)
+        try:
+            stage_package = deb_file.get_name_version()
+            logger.debug("Extracting stage package: {}".format(stage_package))
+            with deb_file.open_data() as data_tar:
+                for member in data_tar:
+                    self._extract_member(data_tar, member, priority, stage_package)
+        except _EXTRACT_ERRORS as error:
+            logger.debug("Cannot extract {!r}: {}".format(str(deb_path), error))
+            raise errors.UnpackError(deb_path) from error
+
+    def _extract_member(
+        self,
+        data_tar: tarfile.TarFile,
+        member: tarfile.TarInfo,
+        priority: int,
+        stage_package: str,
+    ) -> None:
+        path = self._get_install_path(member.name)
+        if path is None:
+            return
+
+        if member.isdir():
+            os.makedirs(path, exist_ok=True)
+            with self._lock:
+                current = self._directories.get(path)
+                if current is None or current[0] <= priority:
+                    self._directories[path] = (priority, member.mode, member.mtime)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Files are written next to their destination and moved in place,
+        # so that other packages never see them half written.
+        temporary_path = os.path.join(
+            os.path.dirname(path), ".snapcraft-extract-{}".format(threading.get_ident())
+        )
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temporary_path)
+
+        if member.isreg():
+            with open(temporary_path, "wb") as destination:
+                source = data_tar.extractfile(member)
+                if source is not None:
+                    shutil.copyfileobj(source, destination)
+            os.chmod(temporary_path, member.mode & 0o7777)
+            os.utime(temporary_path, (member.mtime, member.mtime))
+        elif member.issym():
+            os.symlink(member.linkname, temporary_path)
+        elif member.islnk():
+            link_target = self._get_install_path(member.linkname)
+            if link_target is None:
+                raise tarfile.ExtractError("invalid link {!r}".format(member.name))
+            os.link(link_target, temporary_path)
+        else:
+            logger.debug("Skipping special file {!r}".format(member.name))
+            return
+
+        self._move_in_place(temporary_path, path, priority, stage_package)
+
+    def _move_in_place(
+        self, temporary_path: str, path: str, priority: int, stage_package: str
+    ) -> None:
+        with self._lock:
+            owner = self._owners.get(path)
+            if owner is not None and owner > priority:
+                os.unlink(temporary_path)
+                return
+
+            os.replace(temporary_path, path)
+            self._owners[path] = priority
+            self.origins[path] = stage_package
+
+    def _get_install_path(self, name: str) -> Optional[str]:
+        name = os.path.normpath(name.lstrip("/"))
+        if name == ".":
+            return None
+        if name == ".." or name.startswith("../"):
+            raise tarfile.ExtractError("{!r} is outside of the package".format(name))
+        return os.path.join(self._install_dir, name)
+
+    def set_directories_metadata(self) -> None:
+        # Directories are changed by the files extracted in them, so their
+        # metadata is only set once all files are in place.
+        for path, (_, mode, mtime) in sorted(self._directories.items(), reverse=True):
+            os.chmod(path, mode & 0o7777)
+            os.utime(path, (mtime, mtime))
@@ -0,0 +1,214 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Look up the packages installed on the host in the dpkg database."""
+
+import collections
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import errors
+
+logger = logging.getLogger(__name__)
+
+
+class DpkgDatabase:
+    """An index of the dpkg database, read without running dpkg.
+
+    The index is built from the status file and the file lists in info
+    the first time it is used, and built again whenever the status file
+    changes, as dpkg updates it on every install or removal.
+    """
+
+    def __init__(self, admin_dir: str = "/var/lib/dpkg") -> None:
+        self._admin_dir = admin_dir
+        self._lock = threading.Lock()
+        self._status_signature: Optional[Tuple[int, int]] = None
+        self._index: Optional[_DpkgIndex] = None
+
+    def get_package_for_file(self, file_path: str) -> str:
+        """Return the package that installed file_path.
+
+        :raises snapcraft.repo.errors.FileProviderNotFound:
+            if no package installed file_path.
+        """
+        path = os.path.join(os.path.sep, file_path)
+        packages = self._get_index().packages_by_path.get(path)
+        if not packages:
+            raise errors.FileProviderNotFound(file_path=file_path)
+        # Like dpkg-query -S, list all the packages sharing the path.
+        return ", ".join(packages)
+
+    def get_package_libraries(self, package_name: str) -> Set[str]:
+        """Return the library files installed by package_name.
+
+        :raises snapcraft.repo.errors.PackageNotFoundError:
+            if package_name is not installed.
+        """
+        index = self._get_index()
+        with self._lock:
+            libraries = index.libraries.get(package_name)
+            if libraries is None:
+                if package_name not in index.files_by_package:
+                    raise errors.PackageNotFoundError(package_name)
+                libraries = {
+                    path
+                    for path in index.files_by_package[package_name]
+                    if "lib" in path and os.path.isfile(path)
+                }
+                index.libraries[package_name] = libraries
+        return libraries
+
+    def get_installed_packages(self) -> Dict[str, str]:
+        """Return the versions of the installed packages, by name.
+
+        Packages of a foreign architecture are named with it, as apt does.
+        """
+        return dict(self._get_index().installed)
+
+    def _get_index(self) -> "_DpkgIndex":
+        status_path = os.path.join(self._admin_dir, "status")
+        try:
+            status_stat = os.stat(status_path)
+            signature = (status_stat.st_mtime_ns, status_stat.st_size)
+        except FileNotFoundError:
+            signature = None
+
+        with self._lock:
+            if self._index is None or signature != self._status_signature:
+                start = time.monotonic()
+                self._index = _DpkgIndex.read(self._admin_dir)
+                self._status_signature = signature
+                logger.debug(
+                    "Indexed {} files of {} packages from {!r} in {:.3f}s".format(
+                        len(self._index.packages_by_path),
+                        len(self._index.files_by_package),
+                        self._admin_dir,
+                        time.monotonic() - start,
+                    )
+                )
+            return self._index
+
+
+class _DpkgIndex:
+    def __init__(self) -> None:
+        self.packages_by_path: Dict[str, List[str]] = collections.defaultdict(list)
+        self.files_by_package: Dict[str, List[str]] = collections.defaultdict(list)
+        self.installed: Dict[str, str] = dict()
+        # The libraries of packages, found on first use.
+        self.libraries: Dict[str, Set[str]] = dict()
+
+    @classmethod
+    def read(cls, admin_dir: str) -> "_DpkgIndex":
+        index = cls()
+        index._read_status(os.path.join(admin_dir, "status"))
+
+        info_dir = os.path.join(admin_dir, "info")
+        try:
+            list_names = sorted(n for n in os.listdir(info_dir) if n.endswith(".list"))
+        except FileNotFoundError:
+            list_names = []
+
+        for list_name in list_names:
+            # Multi-Arch: same packages are listed as <package>:<arch>.list.
+            package_name = list_name[: -len(".list")].split(":")[0]
+            index._read_list(os.path.join(info_dir, list_name), package_name)
+
+        # Lookups must not add keys.
+        index.packages_by_path = dict(index.packages_by_path)
+        index.files_by_package = dict(index.files_by_package)
+        return index
+
+    def _read_list(self, list_path: str, package_name: str) -> None:
+        try:
+            with open(list_path, "rb") as list_file:
+                contents = list_file.read()
+        except OSError as error:
+            logger.debug("Cannot read {!r}: {}".format(list_path, error))
+            return
+
+        files = self.files_by_package[package_name]
+        for line in os.fsdecode(contents).splitlines():
+            if not line:
+                continue
+            files.append(line)
+            packages = self.packages_by_path[line]
+            if package_name not in packages:
+                packages.append(package_name)
+
+    def _read_status(self, status_path: str) -> None:
+        try:
+            with open(status_path, encoding="utf-8", errors="replace") as status_file:
+                stanzas = _parse_stanzas(status_file.read())
+        except FileNotFoundError:
+            return
+
+        installed = [s for s in stanzas if s.get("Status", "").endswith(" installed")]
+
+        # dpkg is always of the native architecture.
+        native_arches = {"all"}
+        native_arches.update(
+            s.get("Architecture", "") for s in installed if s.get("Package") == "dpkg"
+        )
+        for stanza in installed:
+            name = stanza.get("Package", "")
+            arch = stanza.get("Architecture", "all")
+            if len(native_arches) > 1 and arch not in native_arches:
+                name = "{}:{}".format(name, arch)
+            self.installed[name] = stanza.get("Version", "")
+
+
+def _parse_stanzas(contents: str) -> List[Dict[str, str]]:
+    """Return the fields of the stanzas of a deb822 file like dpkg status.
+
+    Only the first line of multiline fields is kept.
+    """
+    stanzas: List[Dict[str, str]] = []
+    stanza: Dict[str, str] = dict()
+    for line in contents.splitlines():
+        if not line.strip():
+            if stanza:
+                stanzas.append(stanza)
+                stanza = dict()
+        elif not line[0].isspace():
+            field, _, value = line.partition(":")
+            stanza[field] = value.strip()
+    if stanza:
+        stanzas.append(stanza)
+    return stanzas
+
+
+@functools.lru_cache(maxsize=None)
+def _read_package_names(path: str, signature: Tuple[int, int]) -> Tuple[str, ...]:
+    # Lines we care about in dpkg.list had the following format:
+    # ii adduser 3.118ubuntu1 all add and rem
+    with open(path, encoding="utf-8", errors="replace") as dpkg_list:
+        return tuple(line.split()[1] for line in dpkg_list if line.startswith("ii "))
+
+
+def read_dpkg_list(path: str) -> List[str]:
+    """Return the names of the installed packages listed by dpkg -l at path.
+
+    The contents are only read again when the file changes.
+
+    :raises FileNotFoundError: if path does not exist.
+    """
+    path_stat = os.stat(path)
+    return list(_read_package_names(path, (path_stat.st_mtime_ns, path_stat.st_size)))
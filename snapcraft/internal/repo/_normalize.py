@@ -0,0 +1,206 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fix up unpacked packages in a single walk of their files."""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Sequence
+
+from snapcraft import file_utils
+from snapcraft.internal import mangling, xattrs
+
+logger = logging.getLogger(__name__)
+
+# Files are handed to the workers in chunks, a thread per file costs more
+# than most fixes do.
+_CHUNK_SIZE = 128
+
+
+class Fixer:
+    """Fix one kind of problem in the entries visited by normalize_tree.
+
+    Subclasses set name, used to report the time spent in each fixer, and
+    implement fix, which is called for every file, directory and symlink
+    visited and must ignore the entries it does not apply to.
+
+    Fixers for regular files are called from a pool of threads, so fix
+    must be safe to call concurrently for different entries.
+    """
+
+    name = ""
+
+    def fix(self, entry: os.DirEntry) -> None:
+        raise NotImplementedError()
+
+
+class SymlinkFixer(Fixer):
+    """Make absolute symlinks relative to the unpacked tree."""
+
+    name = "symlinks"
+
+    def __init__(self, fix_symlink: Callable[[str], None]) -> None:
+        self._fix_symlink = fix_symlink
+
+    def fix(self, entry: os.DirEntry) -> None:
+        if entry.is_symlink():
+            self._fix_symlink(entry.path)
+
+
+class FileModeFixer(Fixer):
+    """Remove the suid and sgid bits of files and directories."""
+
+    name = "filemode"
+
+    def fix(self, entry: os.DirEntry) -> None:
+        if entry.is_symlink():
+            return
+
+        mode = entry.stat(follow_symlinks=False).st_mode & 0o7777
+        if mode & 0o4000 or mode & 0o2000:
+            logger.warning("Removing suid/guid from {}".format(entry.path))
+            if entry.is_file(follow_symlinks=False):
+                file_utils.break_hard_link(entry.path)
+            os.chmod(entry.path, mode & 0o1777)
+
+
+class PkgConfigFixer(Fixer):
+    """Prefix the prefix of pkg-config files with the unpacked tree."""
+
+    name = "pkg-config"
+
+    # fix_pkg_config rewrites files in place by redirecting sys.stdout, so
+    # only one file can be rewritten at a time.
+    _lock = threading.Lock()
+
+    def __init__(self, fix_pkg_config: Callable[[str], None]) -> None:
+        self._fix_pkg_config = fix_pkg_config
+
+    def fix(self, entry: os.DirEntry) -> None:
+        if entry.name.endswith(".pc") and entry.is_file(follow_symlinks=False):
+            with self._lock:
+                self._fix_pkg_config(entry.path)
+
+
+class ShebangFixer(Fixer):
+    """Make python shebangs use env."""
+
+    name = "shebangs"
+
+    def fix(self, entry: os.DirEntry) -> None:
+        if entry.is_file(follow_symlinks=False):
+            mangling.rewrite_python_shebang(entry.path)
+
+
+class OriginFixer(Fixer):
+    """Mark files with the stage package they come from.
+
+    Marking is done last, so files that other fixers replace are marked.
+    """
+
+    name = "origin"
+
+    def __init__(self, origins: Dict[str, str]) -> None:
+        """Create an OriginFixer.
+
+        :param origins: the stage package of each file, by its path joined
+                        from the directory given to normalize_tree.
+        """
+        self._origins = origins
+
+    def fix(self, entry: os.DirEntry) -> None:
+        stage_package = self._origins.get(entry.path)
+        if stage_package is not None and not entry.is_symlink():
+            xattrs.write_origin_stage_package(entry.path, stage_package)
+
+
+def normalize_tree(
+    root: str, fixers: Sequence[Fixer], *, workers: int
+) -> Dict[str, float]:
+    """Walk root once, applying all fixers to each entry in order.
+
+    Directories and symlinks are fixed while walking, so that the tree is
+    not changed under the walk, and regular files are fixed by workers
+    threads.
+
+    :param root: the directory to fix the contents of.
+    :param fixers: the fixers to apply, in order, to each entry.
+    :param workers: the number of threads to fix regular files with.
+    :returns: the seconds spent in each fixer, by fixer name.
+    """
+    fix_entries = _EntriesFixer(fixers)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        files: List[os.DirEntry] = []
+        directories = [root]
+        while directories:
+            for entry in _scan_directory(directories.pop()):
+                if entry.is_file(follow_symlinks=False):
+                    files.append(entry)
+                    continue
+
+                fix_entries([entry])
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+
+            while len(files) >= _CHUNK_SIZE:
+                futures.append(executor.submit(fix_entries, files[:_CHUNK_SIZE]))
+                del files[:_CHUNK_SIZE]
+        if files:
+            futures.append(executor.submit(fix_entries, files))
+
+        # Raise the first error found.
+        for future in futures:
+            future.result()
+
+    return fix_entries.timings
+
+
+class _EntriesFixer:
+    """Apply fixers to entries, keeping the time spent in each fixer."""
+
+    def __init__(self, fixers: Sequence[Fixer]) -> None:
+        self._fixers = fixers
+        self._lock = threading.Lock()
+        self.timings: Dict[str, float] = collections.OrderedDict(
+            (fixer.name, 0.0) for fixer in fixers
+        )
+
+    def __call__(self, entries: List[os.DirEntry]) -> None:
+        elapsed = [0.0] * len(self._fixers)
+        for entry in entries:
+            for index, fixer in enumerate(self._fixers):
+                start = time.monotonic()
+                fixer.fix(entry)
+                elapsed[index] += time.monotonic() - start
+
+        with self._lock:
+            for fixer, fixer_elapsed in zip(self._fixers, elapsed):
+                self.timings[fixer.name] += fixer_elapsed
+
+
+def _scan_directory(directory: str) -> List[os.DirEntry]:
+    try:
+        with os.scandir(directory) as iterator:
+            return list(iterator)
+    except OSError:
+        # Unreadable directories are skipped, as os.walk would.
+        return []
@@ -0,0 +1,130 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Record the stage packages resolved for a part."""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from snapcraft import file_utils
+
+logger = logging.getLogger(__name__)
+
+# Bump when the format of lock files changes.
+_LOCK_VERSION = 2
+
+# (<package-name>, <package-version>, <dl-path>), as fetched from apt.
+FetchedPackage = Tuple[str, str, pathlib.Path]
+
+
+class StagePackagesLock:
+    """The packages the stage packages of a part were resolved to.
+
+    A lock is only valid for the same apt sources, target architecture,
+    packages filtered out and requested packages it was written for, so that
+    packages are resolved again whenever any of them changes.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        *,
+        sources_digest: str,
+        target_arch: str,
+        filtered_names: Iterable[str],
+        package_names: Sequence[str],
+    ) -> None:
+        """Create a StagePackagesLock.
+
+        :param path: the lock file.
+        :param sources_digest: unique digest of the current apt sources.
+        :param target_arch: the architecture packages are resolved for.
+        :param filtered_names: the packages filtered out, as provided by the
+                               base.
+        :param package_names: the stage packages requested.
+        """
+        self.path = path
+        self._key: Dict[str, Any] = {
+            "sources-digest": sources_digest,
+            "target-arch": target_arch,
+            # The packages filtered out of a base may change while its name
+            # does not, and there can be many of them.
+            "filtered-names-digest": hashlib.sha256(
+                "\n".join(sorted(filtered_names)).encode()
+            ).hexdigest(),
+            "package-names": sorted(package_names),
+        }
+
+    def get_fetched_packages(
+        self, download_path: pathlib.Path
+    ) -> Optional[List[FetchedPackage]]:
+        """Return the locked packages, if all of them are in download_path.
+
+        :returns: the locked packages, as fetch_archives would, or None if
+                  the lock is not valid or a package is missing.
+        """
+        try:
+            with self.path.open() as lock_file:
+                lock = json.load(lock_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logger.debug("Cannot read {!r}: {}".format(str(self.path), error))
+            return None
+
+        if lock.get("version") != _LOCK_VERSION or lock.get("key") != self._key:
+            return None
+
+        fetched_packages: List[FetchedPackage] = []
+        for package in lock["packages"]:
+            dl_path = download_path / package["filename"]
+            try:
+                sha256 = file_utils.calculate_hash(str(dl_path), algorithm="sha256")
+            except OSError:
+                logger.debug("Locked package {!r} not fetched".format(str(dl_path)))
+                return None
+            if sha256 != package["sha256"]:
+                logger.debug("Locked package {!r} changed".format(str(dl_path)))
+                return None
+            fetched_packages.append((package["name"], package["version"], dl_path))
+        return fetched_packages
+
+    def write(self, fetched_packages: Sequence[FetchedPackage]) -> None:
+        """Lock the packages fetched for the stage packages requested."""
+        lock = {
+            "version": _LOCK_VERSION,
+            "key": self._key,
+            "packages": [
+                {
+                    "name": name,
+                    "version": version,
+                    "filename": dl_path.name,
+                    "sha256": file_utils.calculate_hash(
+                        str(dl_path), algorithm="sha256"
+                    ),
+                }
+                for name, version, dl_path in sorted(fetched_packages)
+            ],
+        }
+
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with temp_path.open("w") as lock_file:
+            json.dump(lock, lock_file, indent=4, sort_keys=True)
+        os.replace(str(temp_path), str(self.path))
@@ -14,16 +14,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
+import hashlib
 import logging
 import os
 import re
 import shutil
-from contextlib import ContextDecorator
+import tempfile
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import apt
 
+from snapcraft import file_utils
 from snapcraft.internal import common
 from snapcraft.internal.indicators import is_dumb_terminal
 from snapcraft.internal.repo import errors
@@ -34,8 +38,16 @@ logger = logging.getLogger(__name__)
 
 _HASHSUM_MISMATCH_PATTERN = re.compile(r"(E:Failed to fetch.+Hash Sum mismatch)+")
 
+# apt_pkg configuration is global to the process, only one cache can be
+# opened at a time (parts may be pulled from multiple threads).
+_APT_CACHE_LOCK = threading.RLock()
 
-class AptCache(ContextDecorator):
+# The binary caches apt builds from the package lists, kept in the stage
+# cache for as long as its configuration does not change.
+_APT_BINARY_CACHES = ["pkgcache.bin", "srcpkgcache.bin"]
+
+
+class AptCache(contextlib.ContextDecorator):
     """Transient cache for use with stage-packages, or read-only host-mode for build-packages."""
 
     def __init__(
@@ -43,23 +55,73 @@ class AptCache(ContextDecorator):
         *,
         stage_cache: Optional[Path] = None,
         stage_cache_arch: Optional[str] = None,
+        keep_open: bool = False,
     ) -> None:
+        """Create an AptCache.
+
+        :param stage_cache: the root directory of the cache to stage packages
+                            with, or None to use the host cache.
+        :param stage_cache_arch: the architecture of the stage cache.
+        :param keep_open: keep the cache open when leaving its context, for
+                          the next context to reuse until close() is called.
+        """
         self.stage_cache = stage_cache
         self.stage_cache_arch = stage_cache_arch
+        self.keep_open = keep_open
+        self._is_open = False
+        self._state_signature: Optional[List[Tuple[str, int, int]]] = None
 
     def __enter__(self) -> "AptCache":
+        _APT_CACHE_LOCK.acquire()
+        try:
+            self._open()
+        except BaseException:
+            _APT_CACHE_LOCK.release()
+            raise
+        return self
+
+    def __exit__(self, *exc) -> None:
+        try:
+            if self.keep_open:
+                # Unmark the packages marked in this context.
+                self.cache.clear()
+            else:
+                self.close()
+        finally:
+            _APT_CACHE_LOCK.release()
+
+    def _open(self) -> None:
+        config_changed = False
         if self.stage_cache is not None:
             self._configure_apt()
-            self._populate_stage_cache_dir()
-            self.cache = apt.Cache(rootdir=str(self.stage_cache), memonly=True)
+            config_changed = self._populate_stage_cache_dir()
+
+        # The package lists or the installed packages may have changed since
+        # a cache kept open was opened, e.g. when installing build packages.
+        state_signature = _get_state_signature()
+        if self._is_open and not config_changed:
+            if state_signature == self._state_signature:
+                return
+            logger.debug("Package lists changed, opening the apt cache again.")
+        self.close()
+
+        if self.stage_cache is not None:
+            # The binary caches are written to the stage cache, for opening
+            # it again to skip parsing the package lists.
+            self.cache = apt.Cache(rootdir=str(self.stage_cache))
         else:
             # There appears to be a slowdown when using `rootdir` = '/' with
             # apt.Cache().  Do not set it for the host cache.
             self.cache = apt.Cache()
-        return self
+        self._is_open = True
+        self._state_signature = state_signature
 
-    def __exit__(self, *exc) -> None:
-        self.cache.close()
+    def close(self) -> None:
+        """Close the cache, if open."""
+        with _APT_CACHE_LOCK:
+            if self._is_open:
+                self._is_open = False
+                self.cache.close()
 
     def _configure_apt(self):
         # Do not install recommends.
@@ -97,35 +159,50 @@ class AptCache(ContextDecorator):
             self.progress.pulse = lambda owner: True
             self.progress._width = 0
 
-    def _populate_stage_cache_dir(self) -> None:
+    def _populate_stage_cache_dir(self) -> bool:
         """Create/refresh cache configuration.
 
         (1) Delete old-style symlink cache, if symlink.
-        (2) Delete current-style (copied) tree.
-        (3) Copy current host apt configuration.
-        (4) Configure primary arch to target arch.
-        (5) Install dpkg into cache directory to support multi-arch.
+        (2) Compare the digest of the host apt configuration and target arch
+            with the one of the current configuration, if any.
+        (3) If different, copy current host apt configuration aside,
+            configure primary arch to target arch and move it in place.
+        (4) Install dpkg into cache directory to support multi-arch.
+
+        :returns: True if the cache configuration changed.
         """
         if self.stage_cache is None:
-            return
+            return False
 
         # Copy apt configuration from host.
         cache_etc_apt_path = Path(self.stage_cache, "etc", "apt")
+        digest_path = cache_etc_apt_path.with_name("apt.sha256")
 
-        # Delete potentially outdated cache configuration.
+        # Delete old-style symlink cache.
         if cache_etc_apt_path.is_symlink():
             cache_etc_apt_path.unlink()
-        elif cache_etc_apt_path.exists():
-            shutil.rmtree(cache_etc_apt_path)
 
-        # Copy current cache configuration.
-        cache_etc_apt_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copytree("/etc/apt", cache_etc_apt_path)
+        digest = _get_config_digest("/etc/apt", self.stage_cache_arch)
+        try:
+            config_changed = digest_path.read_text() != digest
+        except FileNotFoundError:
+            config_changed = True
+        config_changed = config_changed or not cache_etc_apt_path.is_dir()
 
-        # Specify default arch (if specified).
-        if self.stage_cache_arch is not None:
-            arch_conf_path = cache_etc_apt_path / "apt.conf.d" / "00default-arch"
-            arch_conf_path.write_text(f'APT::Architecture "{self.stage_cache_arch}";\n')
+        if config_changed:
+            logger.debug(
+                "Configuring the stage cache in {!r}".format(str(self.stage_cache))
+            )
+            self._write_stage_cache_config(cache_etc_apt_path)
+            # apt only checks the package lists the binary caches were built
+            # from, not the configuration they were built with.
+            cache_dir = Path(self.stage_cache, "var", "cache", "apt")
+            for name in _APT_BINARY_CACHES:
+                with contextlib.suppress(FileNotFoundError):
+                    (cache_dir / name).unlink()
+            temp_digest_path = digest_path.with_name(digest_path.name + ".tmp")
+            temp_digest_path.write_text(digest)
+            os.replace(str(temp_digest_path), str(digest_path))
 
         # dpkg also needs to be in the rootdir in order to support multiarch
         # (apt calls dpkg --print-foreign-architectures).
@@ -139,6 +216,31 @@ class AptCache(ContextDecorator):
         else:
             logger.warning("Cannot find 'dpkg' command needed to support multiarch")
 
+        return config_changed
+
+    def _write_stage_cache_config(self, cache_etc_apt_path: Path) -> None:
+        # The configuration is written aside and moved in place once
+        # complete, for apt to never read a partial configuration.
+        cache_etc_apt_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=str(cache_etc_apt_path.parent))
+        try:
+            new_etc_apt_path = Path(temp_dir, "apt")
+            shutil.copytree("/etc/apt", str(new_etc_apt_path))
+
+            # Specify default arch (if specified).
+            if self.stage_cache_arch is not None:
+                arch_conf_path = new_etc_apt_path / "apt.conf.d" / "00default-arch"
+                arch_conf_path.write_text(
+                    f'APT::Architecture "{self.stage_cache_arch}";\n'
+                )
+
+            # Delete potentially outdated cache configuration.
+            if cache_etc_apt_path.exists():
+                os.rename(str(cache_etc_apt_path), os.path.join(temp_dir, "old"))
+            os.rename(str(new_etc_apt_path), str(cache_etc_apt_path))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def _autokeep_packages(self) -> None:
         # If the package has been installed automatically as a dependency
         # of another package, and if no packages depend on it anymore,
@@ -191,20 +293,82 @@ class AptCache(ContextDecorator):
         return package_version
 
     def fetch_archives(self, download_path: Path) -> List[Tuple[str, str, Path]]:
-        """Fetches archives, list of (<package-name>, <package-version>, <dl-path>)."""
-        downloaded = list()
-        for package in self.cache.get_changes():
-            try:
-                dl_path = package.candidate.fetch_binary(str(download_path))  # type: ignore
-            except apt.package.FetchError as e:
-                raise errors.PackageFetchError(str(e))
+        """Fetches archives, list of (<package-name>, <package-version>, <dl-path>).
 
-            if package.candidate is None:
+        All the archives are queued to a single acquire run, which downloads
+        them concurrently, with a queue per mirror, and verifies their hashes.
+        Archives already in download_path are not downloaded again.
+
+        As with apt.package.Version.fetch_binary, archives are only fetched
+        from trusted sources and with a usable hash, unless
+        APT::Get::AllowUnauthenticated is set.
+        """
+        allow_unauthenticated = apt.apt_pkg.config.find_b(
+            "APT::Get::AllowUnauthenticated", False
+        )
+        acquire = apt.apt_pkg.Acquire(self.progress)
+        fetches: List[Tuple[str, str, Path, Optional[apt.apt_pkg.AcquireFile]]] = []
+        for package in self.cache.get_changes():
+            version = package.candidate
+            if version is None:
                 raise errors.PackageNotFoundError(package.name)
 
-            downloaded.append((package.name, package.candidate.version, Path(dl_path)))
+            dl_path = download_path / os.path.basename(version.filename)
+            if _is_archive_fetched(dl_path, size=version.size, sha256=version.sha256):
+                acquire_file = None
+            else:
+                uri = self._get_archive_uri(
+                    version, allow_unauthenticated=allow_unauthenticated
+                )
+                if uri is None:
+                    raise errors.PackageFetchError(
+                        f"The item {dl_path.name!r} could not be fetched: "
+                        "The source is not trusted."
+                    )
+                hashes = version._records.hashes
+                if not allow_unauthenticated and not hashes.usable:
+                    raise errors.PackageFetchError(
+                        f"The item {dl_path.name!r} could not be fetched: "
+                        "No trusted hash found."
+                    )
+                acquire_file = apt.apt_pkg.AcquireFile(
+                    acquire,
+                    uri=uri,
+                    hash=hashes,
+                    size=version.size,
+                    descr=dl_path.name,
+                    short_descr=package.name,
+                    destfile=str(dl_path),
+                )
+            fetches.append((package.name, version.version, dl_path, acquire_file))
+
+        if any(acquire_file is not None for *_, acquire_file in fetches):
+            acquire.run()
+
+        downloaded = list()
+        for name, version_string, dl_path, acquire_file in fetches:
+            if (
+                acquire_file is not None
+                and acquire_file.status != acquire_file.STAT_DONE
+            ):
+                raise errors.PackageFetchError(
+                    f"The item {acquire_file.destfile!r} could not be fetched: "
+                    f"{acquire_file.error_text}"
+                )
+            downloaded.append((name, version_string, Path(os.path.abspath(dl_path))))
         return downloaded
 
+    def _get_archive_uri(
+        self, version: apt.package.Version, *, allow_unauthenticated: bool
+    ) -> Optional[str]:
+        # The first source of version whose index is trusted, as picked by
+        # apt.package.Version.fetch_binary.
+        for package_file, _ in version._cand.file_list:
+            index = self.cache._list.find_index(package_file)
+            if index and (allow_unauthenticated or index.is_trusted):
+                return index.archive_uri(version._records.filename)
+        return None
+
     def get_installed_packages(self) -> Dict[str, str]:
         installed: Dict[str, str] = dict()
         for package in self.cache:
@@ -295,3 +459,85 @@ class AptCache(ContextDecorator):
 
         # Unmark dependencies that are no longer required.
         self._autokeep_packages()
+
+
+def get_sources_digest(
+    apt_dir: str = "/etc/apt", lists_dir: str = "/var/lib/apt/lists"
+) -> str:
+    """Return a digest of the apt configuration and package lists.
+
+    Stage packages are resolved with a copy of the apt configuration of the
+    host and its package lists, so the digest changes whenever a source is
+    added or apt update fetches new lists.
+    """
+    digest = hashlib.sha256(_get_config_digest(apt_dir).encode())
+    for path, size, mtime_ns in _get_lists_signature(lists_dir):
+        digest.update("{}:{}:{}\0".format(path, size, mtime_ns).encode())
+    return digest.hexdigest()
+
+
+def _get_config_digest(apt_dir: str, arch: Optional[str] = None) -> str:
+    """Return a digest of the apt configuration in apt_dir, for arch."""
+    digest = hashlib.sha256("{}\0".format(arch).encode())
+    for directory, directories, files in os.walk(apt_dir):
+        directories.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            digest.update(os.fsencode(os.path.relpath(path, apt_dir)) + b"\0")
+            if os.path.islink(path):
+                digest.update(os.fsencode(os.readlink(path)) + b"\0")
+            with contextlib.suppress(OSError):
+                digest.update(
+                    file_utils.calculate_hash(path, algorithm="sha256").encode()
+                )
+    return digest.hexdigest()
+
+
+def _get_state_signature() -> List[Tuple[str, int, int]]:
+    """Return the size and modification time of the files apt caches are
+    built from: the package lists and the status of installed packages."""
+    return _get_stat_signature(["/var/lib/dpkg/status"]) + _get_lists_signature(
+        "/var/lib/apt/lists"
+    )
+
+
+def _get_lists_signature(lists_dir: str) -> List[Tuple[str, int, int]]:
+    # Package lists are large, their size and modification time tell when
+    # apt updated them.
+    try:
+        names = sorted(os.listdir(lists_dir))
+    except FileNotFoundError:
+        return []
+    return _get_stat_signature(
+        os.path.join(lists_dir, name)
+        for name in names
+        if name not in ("lock", "partial")
+    )
+
+
+def _get_stat_signature(paths: Iterable[str]) -> List[Tuple[str, int, int]]:
+    signature: List[Tuple[str, int, int]] = []
+    for path in paths:
+        try:
+            path_stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature.append((path, path_stat.st_size, path_stat.st_mtime_ns))
+    return signature
+
+
+def _is_archive_fetched(path: Path, *, size: int, sha256: Optional[str]) -> bool:
+    try:
+        if path.stat().st_size != size:
+            return False
+    except FileNotFoundError:
+        return False
+
+    if not sha256:
+        return False
+
+    file_hash = hashlib.sha256()
+    with path.open("rb") as archive_file:
+        for block in iter(lambda: archive_file.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest() == sha256
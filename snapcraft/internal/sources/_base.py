@@ -21,6 +21,7 @@ import sys
 import requests
 
 import snapcraft.internal.common
+from snapcraft import file_utils
 from snapcraft.internal.cache import FileCache
 from snapcraft.internal.indicators import (
     download_requests_stream,
@@ -142,7 +143,7 @@ class FileBase(Base):
             if cache_file:
                 # We make this copy as the provisioning logic can delete
                 # this file and we don't want that.
-                shutil.copy2(cache_file, self.file)
+                file_utils.copy(cache_file, self.file)
                 return self.file
 
         # If not we download and store
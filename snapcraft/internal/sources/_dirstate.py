@@ -0,0 +1,247 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os
+import stat
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from snapcraft import file_utils
+
+logger = logging.getLogger(__name__)
+
+_DIRSTATE_VERSION = 1
+
+# Files modified this close to the time the dirstate was recorded could be
+# modified again without their stat changing, so their contents are always
+# verified.
+_RACY_INTERVAL_NS = 2 * 10 ** 9
+
+_Signature = Tuple[int, int, int]
+
+
+class _Entry:
+    def __init__(
+        self,
+        *,
+        signature: _Signature,
+        digest: Optional[str],
+        copy_signature: Optional[_Signature],
+    ) -> None:
+        self.signature = signature
+        self.digest = digest
+        self.copy_signature = copy_signature
+
+
+class DirState:
+    """A record of the files in a source tree and of their copies.
+
+    For every file in the source tree the dirstate holds its stat
+    signature (size, mtime and inode), a hash of its contents and the
+    stat signature of the copy made of it, much like the index of git.
+    This allows telling files that were really modified apart from files
+    that were only touched (e.g. by switching branches back and forth).
+    """
+
+    def __init__(self, *, source: str, destination: str) -> None:
+        self.source = source
+        self.destination = destination
+        self.directories: Set[str] = set()
+        self.recorded_ns = _now_ns()
+        self._entries: Dict[str, _Entry] = dict()
+
+    @classmethod
+    def load(cls, path: str, *, source: str, destination: str) -> Optional["DirState"]:
+        """Load the dirstate recorded at path, if any."""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data["version"] != _DIRSTATE_VERSION or data["source"] != source:
+                return None
+
+            dirstate = cls(source=source, destination=destination)
+            dirstate.recorded_ns = data["recorded"]
+            dirstate.directories = set(data["directories"])
+            for name, (signature, digest, copy_signature) in data["files"].items():
+                dirstate._entries[name] = _Entry(
+                    signature=tuple(signature),
+                    digest=digest,
+                    copy_signature=tuple(copy_signature) if copy_signature else None,
+                )
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, TypeError, ValueError) as error:
+            logger.debug(f"Ignoring unreadable dirstate {path!r}: {error!s}")
+            return None
+
+        return dirstate
+
+    def save(self, path: str) -> None:
+        """Record the dirstate at path."""
+        data = dict(
+            version=_DIRSTATE_VERSION,
+            source=self.source,
+            recorded=self.recorded_ns,
+            directories=sorted(self.directories),
+            files={
+                name: [entry.signature, entry.digest, entry.copy_signature]
+                for name, entry in self._entries.items()
+            },
+        )
+
+        # A dirstate is only an optimization, failing to record one must
+        # not fail the step.
+        try:
+            with open(path + ".partial", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".partial", path)
+        except OSError as error:
+            logger.debug(f"Unable to record dirstate {path!r}: {error!s}")
+
+    def is_modified(self, name: str) -> bool:
+        """Return True if the file name was modified since it was recorded.
+
+        Files that were only touched are refreshed in the dirstate, so
+        following checks can rely on their stat signature again.
+
+        :param str name: path of the file, relative to the source tree.
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            return True
+
+        path = os.path.join(self.source, name)
+        file_stat = os.lstat(path)
+        signature = _get_signature(file_stat)
+        if signature == entry.signature and not self._is_racy(entry):
+            return False
+        if entry.digest is None or signature[0] != entry.signature[0]:
+            return True
+        if _get_digest(path, file_stat) != entry.digest:
+            return True
+
+        # The contents are the same, but the copy may have been replaced
+        # since (e.g. by cleaning the step) by a different version.
+        copy_path = os.path.join(self.destination, name)
+        try:
+            copy_stat = os.lstat(copy_path)
+        except FileNotFoundError:
+            return True
+        if (
+            _get_signature(copy_stat) != entry.copy_signature
+            and (
+                copy_stat.st_dev,
+                copy_stat.st_ino,
+            )
+            != (file_stat.st_dev, file_stat.st_ino)
+        ):
+            return True
+
+        entry.signature = signature
+        entry.copy_signature = _get_signature(copy_stat)
+        return False
+
+    def scan(
+        self,
+        ignore: Callable[[str, List[str]], List[str]],
+        previous: Optional["DirState"] = None,
+    ) -> None:
+        """Record every file in the source tree and its copy.
+
+        :param ignore: callable returning the names to skip in a directory.
+        :param previous: a dirstate to reuse the hashes of unmodified
+                         files from.
+        """
+        self.recorded_ns = _now_ns()
+        self.directories = set()
+        self._entries = dict()
+
+        for root, directories, files in os.walk(self.source, topdown=True):
+            ignored = set(ignore(root, directories + files))
+            directories[:] = [d for d in directories if d not in ignored]
+
+            names = set(files) - ignored
+            for directory in directories:
+                path = os.path.join(root, directory)
+                if os.path.islink(path):
+                    names.add(directory)
+                else:
+                    self.directories.add(os.path.relpath(path, self.source))
+
+            for file_name in names:
+                path = os.path.join(root, file_name)
+                self._record(os.path.relpath(path, self.source), previous)
+
+    def _record(self, name: str, previous: Optional["DirState"]) -> None:
+        path = os.path.join(self.source, name)
+        file_stat = os.lstat(path)
+        signature = _get_signature(file_stat)
+
+        previous_entry = previous._entries.get(name) if previous else None
+        if (
+            previous
+            and previous_entry
+            and previous_entry.signature == signature
+            and not previous._is_racy(previous_entry)
+        ):
+            digest = previous_entry.digest
+        else:
+            digest = _get_digest(path, file_stat)
+
+        try:
+            copy_stat = os.lstat(os.path.join(self.destination, name))
+            copy_signature: Optional[_Signature] = _get_signature(copy_stat)
+        except FileNotFoundError:
+            copy_signature = None
+
+        self._entries[name] = _Entry(
+            signature=signature, digest=digest, copy_signature=copy_signature
+        )
+
+    def _is_racy(self, entry: _Entry) -> bool:
+        return entry.signature[1] >= self.recorded_ns - _RACY_INTERVAL_NS
+
+
+def get_dirstate_path(destination: str) -> str:
+    """Return the path to the dirstate of the copy at destination.
+
+    The dirstate is kept next to the copy, not in it, so it does not end
+    up being built or staged along with it.
+    """
+    destination = os.path.normpath(os.path.abspath(destination))
+    return os.path.join(
+        os.path.dirname(destination), f".{os.path.basename(destination)}.dirstate"
+    )
+
+
+def _now_ns() -> int:
+    return int(time.time() * 10 ** 9)
+
+
+def _get_signature(file_stat: os.stat_result) -> _Signature:
+    return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+
+def _get_digest(path: str, file_stat: os.stat_result) -> Optional[str]:
+    if stat.S_ISLNK(file_stat.st_mode):
+        return "symlink:" + os.readlink(path)
+    if stat.S_ISREG(file_stat.st_mode):
+        return file_utils.calculate_hash(path, algorithm="sha1")
+
+    # Special files are considered modified whenever their stat changes.
+    return None
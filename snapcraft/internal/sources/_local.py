@@ -23,6 +23,7 @@ from snapcraft import file_utils
 from snapcraft.internal import common
 
 from ._base import Base
+from ._dirstate import DirState, get_dirstate_path
 
 
 class Local(Base):
@@ -32,6 +33,8 @@ class Local(Base):
         self.copy_function = copy_function
 
         self._ignore = functools.partial(_ignore, self.source_abspath, os.getcwd())
+        self._dirstate_path = get_dirstate_path(self.source_dir)
+        self._dirstate = None
 
     def pull(self):
         file_utils.link_or_copy_tree(
@@ -40,6 +43,7 @@ class Local(Base):
             ignore=self._ignore,
             copy_function=self.copy_function,
         )
+        self._record_dirstate(previous=self._load_dirstate())
 
     def _check(self, target):
         try:
@@ -50,6 +54,44 @@ class Local(Base):
         self._updated_files = set()
         self._updated_directories = set()
 
+        # Sources pulled by older versions of snapcraft have no dirstate,
+        # fall back to comparing timestamps for those.
+        self._dirstate = self._load_dirstate()
+        if self._dirstate is None:
+            self._check_timestamps(target_mtime)
+        else:
+            self._check_dirstate(self._dirstate)
+
+        return len(self._updated_files) > 0 or len(self._updated_directories) > 0
+
+    def _check_dirstate(self, dirstate):
+        for (root, directories, files) in os.walk(self.source_abspath, topdown=True):
+            ignored = set(self._ignore(root, directories + files, check=True))
+            directories[:] = [d for d in directories if d not in ignored]
+
+            names = set(files) - ignored
+            for directory in list(directories):
+                path = os.path.join(root, directory)
+                if os.path.islink(path):
+                    names.add(directory)
+                elif os.path.relpath(path, self.source_abspath) not in (
+                    dirstate.directories
+                ):
+                    # A new directory, copy it entirely.
+                    directories.remove(directory)
+                    self._updated_directories.add(os.path.relpath(path, self.source))
+
+            for file_name in names:
+                path = os.path.join(root, file_name)
+                if dirstate.is_modified(os.path.relpath(path, self.source_abspath)):
+                    self._updated_files.add(os.path.relpath(path, self.source))
+
+        # Record the files that were only touched, so they are not hashed
+        # again by the next check.
+        if not self._updated_files and not self._updated_directories:
+            dirstate.save(self._dirstate_path)
+
+    def _check_timestamps(self, target_mtime):
         for (root, directories, files) in os.walk(self.source_abspath, topdown=True):
             ignored = set(self._ignore(root, directories + files, check=True))
             if ignored:
@@ -77,8 +119,6 @@ class Local(Base):
                     else:
                         self._updated_directories.add(relpath)
 
-        return len(self._updated_files) > 0 or len(self._updated_directories) > 0
-
     def _update(self):
         # First, copy the directories
         for directory in self._updated_directories:
@@ -96,6 +136,22 @@ class Local(Base):
                 os.path.join(self.source_dir, file_path),
             )
 
+        self._record_dirstate(previous=self._dirstate)
+
+    def _load_dirstate(self):
+        return DirState.load(
+            self._dirstate_path,
+            source=self.source_abspath,
+            destination=os.path.abspath(self.source_dir),
+        )
+
+    def _record_dirstate(self, *, previous):
+        dirstate = DirState(
+            source=self.source_abspath, destination=os.path.abspath(self.source_dir)
+        )
+        dirstate.scan(functools.partial(self._ignore, check=True), previous=previous)
+        dirstate.save(self._dirstate_path)
+
 
 def _ignore(source, current_directory, directory, files, check=False):
     if directory == source or directory == current_directory:
@@ -22,3 +22,5 @@ from snapcraft.internal.states._stage_state import StageState  # noqa
 from snapcraft.internal.states._state import PartState  # noqa
 from snapcraft.internal.states._state import get_state  # noqa
 from snapcraft.internal.states._state import get_step_state_file  # noqa
+from snapcraft.internal.states._state_index import StateIndex  # noqa
+from snapcraft.internal.states._state_index import get_state_index  # noqa
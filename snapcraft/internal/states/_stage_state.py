@@ -28,6 +28,7 @@ class StageState(PartState):
         part_properties=None,
         project=None,
         scriptlet_metadata=None,
+        file_digests=None,
     ):
         super().__init__(part_properties, project)
 
@@ -37,6 +38,9 @@ class StageState(PartState):
         self.files = files
         self.directories = directories
         self.scriptlet_metadata = scriptlet_metadata
+        # Digests of the files in the install directory, by path, along with
+        # the size, mtime and inode of the files they were calculated from.
+        self.file_digests = file_digests or {}
 
     def properties_of_interest(self, part_properties):
         """Extract the properties concerning this step from part_properties.
@@ -0,0 +1,260 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Type
+
+from snapcraft import yaml_utils
+from snapcraft.internal import steps
+from snapcraft.internal.states._state import State, get_step_state_file
+
+logger = logging.getLogger(__name__)
+
+_INDEX_FILE_NAME = "state.db"
+
+# Bump whenever the schema or the encoding of the stored states changes,
+# existing indexes are then dropped and rebuilt from the state files.
+_SCHEMA_VERSION = 1
+
+# State files modified this recently are not indexed, as a rewrite within
+# the timestamp granularity of the filesystem could go unnoticed.
+_RACY_INTERVAL = 2.0
+
+_Signature = Tuple[int, int, int]
+
+
+class _UnsupportedValueError(Exception):
+    pass
+
+
+class StateIndex:
+    """A persistent index of the states of the parts in a project.
+
+    The state of every step of a part is still recorded in its own YAML
+    file, but loading those is slow. The index keeps an already decoded
+    copy of each state file along with the stat signature of the file it
+    came from, so states are only parsed from YAML again if their file
+    has changed since it was indexed.
+
+    State files written by older versions of snapcraft are indexed the
+    first time they are read.
+    """
+
+    def __init__(self, parts_dir: str) -> None:
+        self._parts_dir = parts_dir
+        self._index_path = os.path.join(parts_dir, _INDEX_FILE_NAME)
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_signature: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get_state(self, state_dir: str, step: steps.Step) -> Optional[State]:
+        """Return the state recorded for step in state_dir, if any."""
+        state_file = get_step_state_file(state_dir, step)
+        try:
+            signature = _get_signature(state_file)
+        except FileNotFoundError:
+            return None
+
+        key = os.path.relpath(state_file, self._parts_dir)
+        state = self._lookup(key, signature)
+        if state is not None:
+            return state
+
+        with open(state_file, "r") as f:
+            state = yaml_utils.load(f)
+
+        if time.time() - signature[0] / 1e9 > _RACY_INTERVAL:
+            self._store(key, signature, state)
+
+        return state
+
+    def forget(self, state_dir: str, step: steps.Step) -> None:
+        """Drop the state of step in state_dir from the index."""
+        key = os.path.relpath(get_step_state_file(state_dir, step), self._parts_dir)
+        self._execute("DELETE FROM states WHERE path = ?", (key,))
+
+    def _lookup(self, key: str, signature: _Signature) -> Optional[State]:
+        row = self._execute(
+            "SELECT mtime_ns, size, inode, data FROM states WHERE path = ?", (key,)
+        )
+        if row is None or tuple(row[:3]) != signature:
+            return None
+
+        try:
+            return json.loads(row[3], object_hook=_decode_object)
+        except (KeyError, ValueError) as error:
+            logger.debug(f"Ignoring unreadable indexed state {key!r}: {error!s}")
+            return None
+
+    def _store(self, key: str, signature: _Signature, state: Any) -> None:
+        try:
+            data = json.dumps(_encode(state))
+        except _UnsupportedValueError as error:
+            logger.debug(f"Not indexing state {key!r}: {error!s}")
+            return
+
+        self._execute(
+            "INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?, ?)",
+            (key, *signature, data),
+        )
+
+    def _execute(self, query: str, parameters: Tuple) -> Optional[Tuple]:
+        # The index is only an optimization, so it is never allowed to
+        # prevent states from being read from their files.
+        with self._lock:
+            try:
+                connection = self._connect()
+                if connection is None:
+                    return None
+                with connection:
+                    return connection.execute(query, parameters).fetchone()
+            except sqlite3.Error as error:
+                logger.debug(f"State index {self._index_path!r} unavailable: {error!s}")
+                self._close()
+                return None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not os.path.isdir(self._parts_dir):
+            self._close()
+            return None
+
+        # The parts directory may have been removed and created again (e.g.
+        # by cleaning the project) since the connection was opened.
+        try:
+            stat = os.stat(self._index_path)
+            signature: Optional[Tuple[int, int]] = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            signature = None
+        if self._connection is not None and signature == self._connection_signature:
+            return self._connection
+
+        self._close()
+        connection = sqlite3.connect(
+            self._index_path, timeout=10, check_same_thread=False
+        )
+        try:
+            _ensure_schema(connection)
+        except sqlite3.Error:
+            connection.close()
+            raise
+
+        stat = os.stat(self._index_path)
+        self._connection = connection
+        self._connection_signature = (stat.st_dev, stat.st_ino)
+        return connection
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+        self._connection_signature = None
+
+
+_indexes: Dict[str, StateIndex] = dict()
+_indexes_lock = threading.Lock()
+
+
+def get_state_index(parts_dir: str) -> StateIndex:
+    """Return the StateIndex shared by everything using parts_dir."""
+    parts_dir = os.path.abspath(parts_dir)
+    with _indexes_lock:
+        if parts_dir not in _indexes:
+            _indexes[parts_dir] = StateIndex(parts_dir)
+        return _indexes[parts_dir]
+
+
+def _ensure_schema(connection: sqlite3.Connection) -> None:
+    with connection:
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        if version == _SCHEMA_VERSION:
+            return
+
+        connection.execute("DROP TABLE IF EXISTS states")
+        connection.execute(
+            "CREATE TABLE states ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+            "inode INTEGER, data TEXT)"
+        )
+        connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION:d}")
+
+
+def _get_signature(path: str) -> _Signature:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+# States are stored as JSON, which is much faster to load than YAML. Scalars
+# and lists are stored as they are, anything else is wrapped in an object
+# with a single key identifying how to decode it. Only the types the YAML
+# loader can produce from a state file are supported.
+
+
+def _encode(value: Any) -> Any:
+    value_type = type(value)
+    if value_type in (str, int, float, bool, type(None)):
+        return value
+    if value_type is list:
+        return [_encode(v) for v in value]
+    if value_type in (dict, collections.OrderedDict):
+        kind = "dict" if value_type is dict else "odict"
+        return {kind: [[_encode(k), _encode(v)] for k, v in value.items()]}
+    if value_type is set:
+        return {"set": [_encode(v) for v in value]}
+    if _get_yaml_object(getattr(value, "yaml_tag", None)) is value_type:
+        return {value.yaml_tag: _encode(dict(value.__dict__))}
+
+    raise _UnsupportedValueError(f"cannot encode values of type {value_type!r}")
+
+
+def _decode_object(encoded: Dict[str, Any]) -> Any:
+    ((kind, payload),) = encoded.items()
+    if kind == "dict":
+        return {k: v for k, v in payload}
+    if kind == "odict":
+        return collections.OrderedDict(payload)
+    if kind == "set":
+        return set(payload)
+
+    # Objects are restored the same way the YAML loader does it.
+    cls = _get_yaml_object(kind)
+    if cls is None:
+        raise KeyError(f"unknown YAML object {kind!r}")
+    value = cls.__new__(cls)
+    value.__dict__.update(payload)
+    return value
+
+
+_yaml_objects: Dict[str, Type[yaml_utils.SnapcraftYAMLObject]] = dict()
+
+
+def _get_yaml_object(tag: Optional[str]) -> Optional[Type]:
+    # Classes are looked up again on a miss, as they can be defined at any
+    # time (i.e. by plugins).
+    if tag is not None and tag not in _yaml_objects:
+        classes = [yaml_utils.SnapcraftYAMLObject]
+        while classes:
+            cls = classes.pop()
+            classes.extend(cls.__subclasses__())
+            cls_tag = cls.__dict__.get("yaml_tag")
+            if cls_tag is not None and "from_yaml" not in cls.__dict__:
+                _yaml_objects[cls_tag] = cls
+    return _yaml_objects.get(tag)
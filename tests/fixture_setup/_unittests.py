@@ -271,7 +271,7 @@ class FakeElf(fixtures.Fixture):
         self.useFixture(fixtures.EnvironmentVariable("PATH", new_path))
 
         # Copy strip
-        for f in ["strip", "execstack"]:
+        for f in ["strip"]:
             shutil.copy(
                 os.path.join(binaries_path, f), os.path.join(new_binaries_path, f)
             )
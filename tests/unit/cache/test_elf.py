@@ -0,0 +1,154 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+
+import pytest
+
+from snapcraft.internal import cache
+
+
+@pytest.fixture
+def old_file(tmp_path):
+    def create(name, contents="contents"):
+        path = tmp_path / name
+        path.write_text(contents)
+        timestamp = time.time() - 60
+        os.utime(str(path), (timestamp, timestamp))
+        return os.stat(str(path))
+
+    return create
+
+
+def test_get_nothing_cached(xdg_dirs, old_file):
+    elf_cache = cache.ElfAttributesCache(version=1)
+
+    assert elf_cache.get(old_file("file")) is None
+
+
+def test_add_and_get(xdg_dirs, old_file):
+    file_stat = old_file("file")
+    elf_cache = cache.ElfAttributesCache(version=1)
+
+    elf_cache.add(file_stat, {"soname": "libfoo.so.1"})
+
+    assert elf_cache.has(file_stat)
+    assert elf_cache.get(file_stat) == {"soname": "libfoo.so.1"}
+    assert (elf_cache.hits, elf_cache.misses) == (1, 1)
+
+
+def test_changed_file_not_cached(xdg_dirs, old_file):
+    elf_cache = cache.ElfAttributesCache(version=1)
+    elf_cache.add(old_file("file"), {"soname": "libfoo.so.1"})
+
+    assert elf_cache.get(old_file("file", contents="changed")) is None
+
+
+def test_recent_file_not_cached(xdg_dirs, tmp_path):
+    (tmp_path / "file").write_text("contents")
+    file_stat = os.stat(str(tmp_path / "file"))
+    elf_cache = cache.ElfAttributesCache(version=1)
+
+    elf_cache.add(file_stat, {"soname": "libfoo.so.1"})
+
+    assert elf_cache.get(file_stat) is None
+    assert elf_cache.misses == 1
+
+
+def test_save_shared(xdg_dirs, old_file):
+    file_stat = old_file("file")
+    elf_cache = cache.ElfAttributesCache(version=1)
+    elf_cache.add(file_stat, {"soname": "libfoo.so.1"})
+
+    elf_cache.save()
+
+    assert cache.ElfAttributesCache(version=1).get(file_stat) == {
+        "soname": "libfoo.so.1"
+    }
+    assert cache.ElfAttributesCache(version=2).get(file_stat) is None
+
+
+def test_save_merges(xdg_dirs, old_file):
+    file_stat_1 = old_file("file1")
+    file_stat_2 = old_file("file2")
+    elf_cache_1 = cache.ElfAttributesCache(version=1)
+    elf_cache_2 = cache.ElfAttributesCache(version=1)
+    elf_cache_1.has(file_stat_1)
+    elf_cache_2.has(file_stat_2)
+
+    elf_cache_1.add(file_stat_1, {"soname": "libfoo.so.1"})
+    elf_cache_1.save()
+    elf_cache_2.add(file_stat_2, {"soname": "libbar.so.1"})
+    elf_cache_2.save()
+
+    elf_cache = cache.ElfAttributesCache(version=1)
+    assert elf_cache.get(file_stat_1) == {"soname": "libfoo.so.1"}
+    assert elf_cache.get(file_stat_2) == {"soname": "libbar.so.1"}
+
+
+def test_save_keeps_recently_used(xdg_dirs, old_file):
+    file_stats = [old_file("file{}".format(i)) for i in range(3)]
+    elf_cache = cache.ElfAttributesCache(version=1, max_entries=2)
+    for file_stat in file_stats:
+        elf_cache.add(file_stat, {})
+    elf_cache.save()
+
+    elf_cache = cache.ElfAttributesCache(version=1, max_entries=2)
+    elf_cache.get(file_stats[1])
+    elf_cache.add(file_stats[0], {})
+    elf_cache.save()
+
+    elf_cache = cache.ElfAttributesCache(version=1)
+    assert not elf_cache.has(file_stats[2])
+    assert elf_cache.has(file_stats[1])
+    assert elf_cache.has(file_stats[0])
+
+
+def test_corrupted_cache_ignored(xdg_dirs, old_file):
+    elf_cache = cache.ElfAttributesCache(version=1)
+    os.makedirs(os.path.dirname(elf_cache.cache_file))
+    with open(elf_cache.cache_file, "w") as cache_file:
+        cache_file.write("{")
+
+    assert elf_cache.get(old_file("file")) is None
+
+
+def test_soname_index_add_and_get(xdg_dirs):
+    soname_index_cache = cache.SonameIndexCache(version=1)
+
+    soname_index_cache.add("core20", "1234", "lib", [["arch", "libfoo.so.1", "foo"]])
+    soname_index_cache.add("core20", "1234", "usr/lib", [])
+
+    soname_index_cache = cache.SonameIndexCache(version=1)
+    assert soname_index_cache.get("core20", "1234", "lib") == [
+        ["arch", "libfoo.so.1", "foo"]
+    ]
+    assert soname_index_cache.get("core20", "1234", "usr/lib") == []
+    assert soname_index_cache.get("core20", "1234", "other") is None
+    assert cache.SonameIndexCache(version=2).get("core20", "1234", "lib") is None
+
+
+def test_soname_index_keeps_latest_revision(xdg_dirs):
+    soname_index_cache = cache.SonameIndexCache(version=1)
+
+    soname_index_cache.add("core20", "1234", "lib", [])
+    soname_index_cache.add("core18", "1234", "lib", [])
+    soname_index_cache.add("core20", "1235", "lib", [])
+
+    assert soname_index_cache.get("core20", "1234", "lib") is None
+    assert soname_index_cache.get("core18", "1234", "lib") == []
+    assert soname_index_cache.get("core20", "1235", "lib") == []
@@ -63,6 +63,14 @@ class TestProviderOptions:
                 flags=dict(SNAPCRAFT_IMAGE_INFO="{}"),
             ),
         ),
+        (
+            "host parallel parts",
+            dict(
+                provider="host",
+                kwargs=dict(parallel_parts=4),
+                flags=dict(SNAPCRAFT_PARALLEL_PARTS=4),
+            ),
+        ),
         (
             "host all",
             dict(
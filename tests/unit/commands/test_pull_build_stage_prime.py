@@ -16,6 +16,7 @@
 
 from unittest import mock
 
+import fixtures
 from testtools.matchers import Equals
 
 from snapcraft.internal import steps
@@ -200,3 +201,31 @@ class TestPullBuildStagePrimeCommand(LifecycleCommandsBaseTestCase):
 
     def test_prime_with_parts_specified_using_destructive_mode(self):
         self.run_test_with_parts_specified_using_destructive_mode(step=steps.PRIME)
+
+    def test_prime_watch_using_destructive_mode(self):
+        fake_lifecycle_watch = fixtures.MockPatch("snapcraft.internal.lifecycle.watch")
+        self.useFixture(fake_lifecycle_watch)
+
+        result = self.run_command(["prime", "--destructive-mode", "--watch", "part0"])
+
+        self.assertThat(result.exit_code, Equals(0))
+        self.fake_lifecycle_execute.mock.assert_not_called()
+        fake_lifecycle_watch.mock.assert_called_once_with(
+            steps.PRIME, mock.ANY, tuple(["part0"])
+        )
+
+    def test_prime_watch_using_defaults(self):
+        # Default to a build provider even when running in a container.
+        self.useFixture(
+            fixtures.MockPatch(
+                "snapcraft.internal.common.is_process_container", return_value=False
+            )
+        )
+        fake_lifecycle_watch = fixtures.MockPatch("snapcraft.internal.lifecycle.watch")
+        self.useFixture(fake_lifecycle_watch)
+
+        result = self.run_command(["prime", "--watch"])
+
+        self.assertThat(result.exit_code, Equals(2))
+        self.fake_get_provider_for.mock.assert_not_called()
+        fake_lifecycle_watch.mock.assert_not_called()
@@ -0,0 +1,291 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+import sys
+from unittest import mock
+
+import pytest
+
+from snapcraft.internal import elf
+from snapcraft.internal.elf import _reader
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self.data = b"\0"
+
+    def add(self, string: str) -> int:
+        offset = len(self.data)
+        self.data += string.encode() + b"\0"
+        return offset
+
+
+def _build_elf(elfclass: int, byte_order: str, e_machine: int) -> bytes:
+    """Build a shared library with the attributes the reader looks into."""
+    is_64 = elfclass == 2
+    header_size = 64 if is_64 else 52
+    phentsize = 56 if is_64 else 32
+    shentsize = 64 if is_64 else 40
+    dyn = struct.Struct(byte_order + ("qQ" if is_64 else "iI"))
+
+    dynstr = _StringTable()
+    libc = dynstr.add("libc.so.6")
+    libfoo = dynstr.add("libfoo.so.1")
+    soname = dynstr.add("libbar.so.1")
+    glibc_old = dynstr.add("GLIBC_2.2.5")
+    glibc_new = dynstr.add("GLIBC_2.17")
+    bar_version = dynstr.add("BAR_1")
+    runpath = dynstr.add("$ORIGIN/../lib")
+
+    interp = b"/lib/ld-linux.so.2\0"
+    dynamic = b"".join(
+        dyn.pack(tag, value)
+        for tag, value in [(1, libc), (1, libfoo), (14, soname), (29, runpath)]
+    ) + dyn.pack(0, 0)
+    verneed = struct.pack(byte_order + "HHIII", 1, 2, libc, 16, 0)
+    verneed += struct.pack(byte_order + "IHHII", 0, 0, 2, glibc_old, 16)
+    verneed += struct.pack(byte_order + "IHHII", 0, 0, 3, glibc_new, 0)
+    verdef = struct.pack(byte_order + "HHHHIII", 1, 0, 1, 1, 0, 20, 0)
+    verdef += struct.pack(byte_order + "II", bar_version, 0)
+    note = struct.pack(byte_order + "III", 4, 4, 3) + b"GNU\0" + b"\x12\x34\xab\xcd"
+    debug_info = b"\0" * 8
+
+    shstrtab = _StringTable()
+    contents = [
+        (shstrtab.add(".interp"), 1, interp, 0, 0),
+        (shstrtab.add(".dynstr"), 3, dynstr.data, 0, 0),
+        (shstrtab.add(".dynamic"), 6, dynamic, 2, 0),
+        (shstrtab.add(".gnu.version_r"), 0x6FFFFFFE, verneed, 2, 1),
+        (shstrtab.add(".gnu.version_d"), 0x6FFFFFFD, verdef, 2, 1),
+        (shstrtab.add(".note.gnu.build-id"), 7, note, 0, 0),
+        (shstrtab.add(".debug_info"), 1, debug_info, 0, 0),
+    ]
+    contents.append((shstrtab.add(".shstrtab"), 3, shstrtab.data, 0, 0))
+
+    data = b""
+    phoff = header_size
+    offset = phoff + 2 * phentsize
+    section_headers = [b"\0" * shentsize]
+    for name, sh_type, section_data, link, info in contents:
+        if is_64:
+            fields = "IIQQQQIIQQ"
+        else:
+            fields = "IIIIIIIIII"
+        section_headers.append(
+            struct.pack(
+                byte_order + fields,
+                name,
+                sh_type,
+                0,
+                0,
+                offset + len(data),
+                len(section_data),
+                link,
+                info,
+                8,
+                dyn.size if sh_type == 6 else 0,
+            )
+        )
+        data += section_data + b"\0" * (-len(section_data) % 8)
+    shoff = offset + len(data)
+
+    if is_64:
+        program_headers = struct.pack(
+            byte_order + "IIQQQQQQ", 3, 4, offset, 0, 0, len(interp), len(interp), 1
+        )
+        program_headers += struct.pack(byte_order + "IIQQQQQQ", 0x6474E551, 7, *[0] * 6)
+        header_fields = "HHIQQQIHHHHHH"
+    else:
+        program_headers = struct.pack(
+            byte_order + "IIIIIIII", 3, offset, 0, 0, len(interp), len(interp), 4, 1
+        )
+        program_headers += struct.pack(
+            byte_order + "IIIIIIII", 0x6474E551, 0, 0, 0, 0, 0, 7, 0
+        )
+        header_fields = "HHIIIIIHHHHHH"
+
+    e_ident = b"\x7fELF" + bytes([elfclass, 1 if byte_order == "<" else 2, 1])
+    header = e_ident + b"\0" * 9
+    header += struct.pack(
+        byte_order + header_fields,
+        3,
+        e_machine,
+        1,
+        0,
+        phoff,
+        shoff,
+        0,
+        header_size,
+        phentsize,
+        2,
+        shentsize,
+        len(section_headers),
+        len(section_headers) - 1,
+    )
+
+    return header + program_headers + data + b"".join(section_headers)
+
+
+def _get_attributes(elf_file):
+    return (
+        elf_file.arch,
+        elf_file.interp,
+        elf_file.soname,
+        elf_file.rpath,
+        elf_file.runpath,
+        elf_file.versions,
+        {name: library.versions for name, library in elf_file.needed.items()},
+        elf_file.execstack_set,
+        elf_file.execstack_offset,
+        elf_file.build_id,
+        elf_file.has_debug_info,
+        elf_file.elf_type,
+    )
+
+
+@pytest.fixture
+def pyelftools_elf_file():
+    def read(path):
+        with mock.patch(
+            "snapcraft.internal.elf._reader.read_attributes",
+            side_effect=_reader.UnsupportedLayout(),
+        ):
+            return elf.ElfFile(path=path)
+
+    return read
+
+
+@pytest.mark.parametrize(
+    "elfclass,byte_order,e_machine,machine_name",
+    [
+        (2, "<", 62, "EM_X86_64"),
+        (2, ">", 21, "EM_PPC64"),
+        (1, "<", 40, "EM_ARM"),
+        (1, ">", 20, "EM_PPC"),
+    ],
+)
+def test_read_attributes(
+    tmp_path, pyelftools_elf_file, elfclass, byte_order, e_machine, machine_name
+):
+    path = tmp_path / "libbar.so.1"
+    path.write_bytes(_build_elf(elfclass, byte_order, e_machine))
+
+    attributes = _reader.read_attributes(str(path))
+
+    assert attributes.arch == (
+        "ELFCLASS64" if elfclass == 2 else "ELFCLASS32",
+        "ELFDATA2LSB" if byte_order == "<" else "ELFDATA2MSB",
+        machine_name,
+    )
+    assert attributes.interp == "/lib/ld-linux.so.2"
+    assert attributes.soname == "libbar.so.1"
+    assert attributes.rpath == ""
+    assert attributes.runpath == "$ORIGIN/../lib"
+    assert attributes.versions == {"BAR_1"}
+    assert attributes.needed == {
+        "libc.so.6": {"GLIBC_2.2.5", "GLIBC_2.17"},
+        "libfoo.so.1": set(),
+    }
+    assert attributes.execstack_set is True
+    assert attributes.build_id == "1234abcd"
+    assert attributes.has_debug_info is True
+    assert attributes.elf_type == "ET_DYN"
+
+    assert _get_attributes(elf.ElfFile(path=str(path))) == _get_attributes(
+        pyelftools_elf_file(str(path))
+    )
+
+
+def test_read_attributes_same_as_pyelftools(pyelftools_elf_file):
+    assert _get_attributes(elf.ElfFile(path=sys.executable)) == _get_attributes(
+        pyelftools_elf_file(sys.executable)
+    )
+
+
+@pytest.mark.parametrize(
+    "elfclass,byte_order", [(2, "<"), (2, ">"), (1, "<"), (1, ">")]
+)
+def test_clear_execstack(tmp_path, elfclass, byte_order):
+    path = tmp_path / "libbar.so.1"
+    path.write_bytes(_build_elf(elfclass, byte_order, 62))
+    attributes = _reader.read_attributes(str(path))
+
+    _reader.clear_execstack(str(path), attributes.execstack_offset)
+
+    cleared_attributes = _reader.read_attributes(str(path))
+    assert cleared_attributes.execstack_set is False
+    assert cleared_attributes.execstack_offset is None
+    assert cleared_attributes.needed == attributes.needed
+    assert cleared_attributes.build_id == attributes.build_id
+
+
+def test_clear_execstack_wrong_offset(tmp_path):
+    path = tmp_path / "libbar.so.1"
+    contents = _build_elf(2, "<", 62)
+    path.write_bytes(contents)
+
+    with pytest.raises(_reader.UnsupportedLayout):
+        _reader.clear_execstack(str(path), 0)
+    with pytest.raises(_reader.UnsupportedLayout):
+        _reader.clear_execstack(str(path), len(contents))
+
+    assert path.read_bytes() == contents
+
+
+def test_elf_file_clear_execstack_breaks_hard_links(tmp_path):
+    path = tmp_path / "libbar.so.1"
+    contents = _build_elf(2, "<", 62)
+    path.write_bytes(contents)
+    path.chmod(0o444)
+    os.link(str(path), str(tmp_path / "linked"))
+    elf_file = elf.ElfFile(path=str(path))
+
+    elf_file.clear_execstack()
+
+    assert elf_file.execstack_set is False
+    assert elf.ElfFile(path=str(path)).execstack_set is False
+    assert path.stat().st_mode & 0o777 == 0o444
+    assert (tmp_path / "linked").read_bytes() == contents
+
+
+@pytest.mark.parametrize("size", [4, 20, 100, 400])
+def test_read_attributes_truncated(tmp_path, size):
+    path = tmp_path / "libbar.so.1"
+    path.write_bytes(_build_elf(2, "<", 62)[:size])
+
+    with pytest.raises(_reader.UnsupportedLayout):
+        _reader.read_attributes(str(path))
+
+
+def test_read_attributes_empty(tmp_path):
+    (tmp_path / "empty").touch()
+
+    with pytest.raises(_reader.UnsupportedLayout):
+        _reader.read_attributes(str(tmp_path / "empty"))
+
+
+def test_elf_file_falls_back_to_pyelftools(tmp_path):
+    path = tmp_path / "libbar.so.1"
+    path.write_bytes(_build_elf(2, "<", 62)[:400])
+
+    with mock.patch(
+        "snapcraft.internal.elf.ElfFile._extract_attributes_with_pyelftools"
+    ) as pyelftools_mock:
+        elf.ElfFile(path=str(path))
+
+    pyelftools_mock.assert_called_once_with()
@@ -0,0 +1,172 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import mock
+
+import pytest
+
+from snapcraft.internal.elf import _resolver
+
+_ARCH = ("ELFCLASS64", "ELFDATA2LSB", "EM_X86_64")
+
+
+class _FakeElfFile:
+    def __init__(self, path, *, needed=(), rpath="", runpath="", arch=_ARCH):
+        self.path = str(path)
+        self.needed = {name: None for name in needed}
+        self.rpath = rpath
+        self.runpath = runpath
+        self.arch = arch
+
+
+@pytest.fixture
+def fake_libraries(tmp_path):
+    elf_files = dict()
+
+    def add(path, **kwargs):
+        path = tmp_path / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        elf_files[str(path)] = _FakeElfFile(path, **kwargs)
+        return elf_files[str(path)]
+
+    add.elf_files = elf_files
+    return add
+
+
+@pytest.fixture
+def resolver(tmp_path, fake_libraries):
+    def create(ld_library_paths=()):
+        return _resolver.LibraryResolver(
+            ld_library_paths=[str(tmp_path / p) for p in ld_library_paths],
+            arch_triplet="x86_64-linux-gnu",
+            load=fake_libraries.elf_files.get,
+            ld_so_conf_path=str(tmp_path / "ld.so.conf"),
+        )
+
+    return create
+
+
+def test_resolve_ld_library_paths(tmp_path, fake_libraries, resolver):
+    elf_file = fake_libraries("bin/foo", needed=["libfoo.so.1", "libmissing.so.1"])
+    fake_libraries("lib1/libfoo.so.1")
+    fake_libraries("lib2/libfoo.so.1")
+
+    libraries = resolver(["lib0", "lib1", "lib2"]).resolve(elf_file)
+
+    assert libraries == {
+        "libfoo.so.1": str(tmp_path / "lib1/libfoo.so.1"),
+        "libmissing.so.1": "libmissing.so.1",
+    }
+
+
+def test_resolve_dependencies_of_libraries(tmp_path, fake_libraries, resolver):
+    elf_file = fake_libraries(
+        "bin/foo", needed=["libfoo.so.1"], rpath="$ORIGIN/../rpath"
+    )
+    fake_libraries("lib/libfoo.so.1", needed=["libbar.so.1", "libfoo.so.1"])
+    fake_libraries("lib/libbar.so.1")
+    fake_libraries("rpath/libbar.so.1")
+
+    libraries = resolver(["lib"]).resolve(elf_file)
+
+    # The DT_RPATH of foo applies to the libraries loaded by libfoo.
+    assert libraries == {
+        "libfoo.so.1": str(tmp_path / "lib/libfoo.so.1"),
+        "libbar.so.1": str(tmp_path / "rpath/libbar.so.1"),
+    }
+
+
+def test_resolve_rpath_before_ld_library_paths(tmp_path, fake_libraries, resolver):
+    elf_file = fake_libraries("bin/foo", needed=["libfoo.so.1"], rpath="${ORIGIN}")
+    fake_libraries("bin/libfoo.so.1")
+    fake_libraries("lib/libfoo.so.1")
+
+    libraries = resolver(["lib"]).resolve(elf_file)
+
+    assert libraries == {"libfoo.so.1": str(tmp_path / "bin/libfoo.so.1")}
+
+
+def test_resolve_runpath_after_ld_library_paths(tmp_path, fake_libraries, resolver):
+    elf_file = fake_libraries(
+        "bin/foo",
+        needed=["libfoo.so.1", "libbar.so.1"],
+        rpath=str(tmp_path / "rpath"),
+        runpath="$ORIGIN/../runpath",
+    )
+    fake_libraries("lib/libfoo.so.1")
+    fake_libraries("rpath/libbar.so.1")
+    fake_libraries("runpath/libfoo.so.1")
+    fake_libraries("runpath/libbar.so.1")
+
+    libraries = resolver(["lib"]).resolve(elf_file)
+
+    # The DT_RPATH is ignored when there is a DT_RUNPATH.
+    assert libraries == {
+        "libfoo.so.1": str(tmp_path / "lib/libfoo.so.1"),
+        "libbar.so.1": str(tmp_path / "runpath/libbar.so.1"),
+    }
+
+
+def test_resolve_ld_so_conf(tmp_path, fake_libraries, resolver):
+    (tmp_path / "ld.so.conf.d").mkdir()
+    (tmp_path / "ld.so.conf").write_text("include ld.so.conf.d/*.conf\n")
+    (tmp_path / "ld.so.conf.d" / "foo.conf").write_text(
+        "# foo libraries\n{}\n".format(tmp_path / "conf")
+    )
+    elf_file = fake_libraries("bin/foo", needed=["libfoo.so.1"])
+    fake_libraries("conf/libfoo.so.1")
+
+    libraries = resolver().resolve(elf_file)
+
+    assert libraries == {"libfoo.so.1": str(tmp_path / "conf/libfoo.so.1")}
+
+
+def test_resolve_skips_other_architectures(tmp_path, fake_libraries, resolver):
+    elf_file = fake_libraries("bin/foo", needed=["libfoo.so.1"])
+    fake_libraries("lib1/libfoo.so.1", arch=("ELFCLASS32", "ELFDATA2LSB", "EM_ARM"))
+    fake_libraries("lib2/libfoo.so.1")
+
+    libraries = resolver(["lib1", "lib2"]).resolve(elf_file)
+
+    assert libraries == {"libfoo.so.1": str(tmp_path / "lib2/libfoo.so.1")}
+
+
+def test_resolve_skips_dynamic_linker(fake_libraries, resolver):
+    elf_file = fake_libraries(
+        "bin/foo", needed=["ld-linux-x86-64.so.2", "ld64.so.2", "ld.so.1"]
+    )
+
+    assert resolver().resolve(elf_file) == dict()
+
+
+def test_resolve_loads_libraries_once(tmp_path, fake_libraries, resolver):
+    elf_files = [
+        fake_libraries("bin/foo", needed=["libfoo.so.1"]),
+        fake_libraries("bin/bar", needed=["libfoo.so.1"]),
+    ]
+    fake_libraries("lib/libfoo.so.1")
+    library_resolver = resolver(["lib"])
+
+    with mock.patch.object(
+        library_resolver, "_load", wraps=fake_libraries.elf_files.get
+    ) as load_mock:
+        for elf_file in elf_files:
+            assert library_resolver.resolve(elf_file) == {
+                "libfoo.so.1": str(tmp_path / "lib/libfoo.so.1")
+            }
+
+    load_mock.assert_called_once_with(str(tmp_path / "lib/libfoo.so.1"))
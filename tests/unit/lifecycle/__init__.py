@@ -58,11 +58,11 @@ class LifecycleTestBase(unit.TestCase):
             )
         )
 
-    def make_snapcraft_project(self, parts, snap_type=""):
+    def make_snapcraft_project(self, parts, snap_type="", base="core18"):
         yaml = textwrap.dedent(
             """\
             name: test
-            base: core18
+            base: {base}
             version: "1.0"
             summary: test
             description: test
@@ -75,7 +75,7 @@ class LifecycleTestBase(unit.TestCase):
         )
 
         self.snapcraft_yaml_file_path = self.make_snapcraft_yaml(
-            yaml.format(parts=parts, type=snap_type)
+            yaml.format(parts=parts, type=snap_type, base=base)
         )
         project = snapcraft.project.Project(
             snapcraft_yaml_file_path=self.snapcraft_yaml_file_path
@@ -114,6 +114,32 @@ class ExecutionTestCase(LifecycleTestBase):
         self.assertThat(self.fake_logger.output, Contains("Pulling part2"))
         self.assertThat(self.fake_logger.output, Not(Contains("Pulling part1")))
 
+    @mock.patch("snapcraft.repo.snaps.install_snaps")
+    def test_requested_step_not_run_again(self, mock_install_build_snaps):
+        project_config = self.make_snapcraft_project(
+            textwrap.dedent(
+                """\
+                parts:
+                  part1:
+                    plugin: nil
+                """
+            )
+        )
+        lifecycle.execute(steps.PULL, project_config, part_names=["part1"])
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+
+        lifecycle.execute(
+            steps.PULL,
+            project_config,
+            part_names=["part1"],
+            rerun_requested_step=False,
+        )
+
+        self.assertThat(
+            self.fake_logger.output, Equals("Skipping pull part1 (already ran)\n")
+        )
+
     def test_dirty_stage_part_with_built_dependent_raises(self):
         # Set the option to error on dirty/outdated steps
         with snapcraft.config.CLIConfig() as cli_config:
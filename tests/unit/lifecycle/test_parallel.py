@@ -0,0 +1,130 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import textwrap
+from unittest import mock
+
+import fixtures
+from testtools.matchers import Contains, FileExists, LessThan, Not
+
+from snapcraft.internal import lifecycle, pluginhandler, steps
+
+from . import LifecycleTestBase
+
+
+class ParallelExecutionTestCase(LifecycleTestBase):
+    def setUp(self):
+        super().setUp()
+
+        self.useFixture(fixtures.MockPatch("snapcraft.repo.snaps.install_snaps"))
+        # Do not query the store for the grade of the base.
+        self.useFixture(
+            fixtures.MockPatch(
+                "snapcraft.internal.lifecycle._runner._get_required_grade",
+                return_value="stable",
+            )
+        )
+
+    def make_core20_project(self):
+        return self.make_snapcraft_project(
+            textwrap.dedent(
+                """\
+                parts:
+                  part1:
+                    plugin: nil
+                  part2:
+                    plugin: nil
+                    after: [part1]
+                  part3:
+                    plugin: nil
+                """
+            ),
+            base="core20",
+        )
+
+    def test_all_parts_are_primed(self):
+        project_config = self.make_core20_project()
+
+        lifecycle.execute(steps.PRIME, project_config, parallel_parts=2)
+
+        for part_name in ("part1", "part2", "part3"):
+            self.assertThat(
+                os.path.join(self.parts_dir, part_name, "state", "prime"), FileExists()
+            )
+
+    def test_dependency_is_staged_before_dependent_is_pulled(self):
+        project_config = self.make_core20_project()
+
+        lifecycle.execute(steps.PULL, project_config, parallel_parts=2)
+
+        output = self.fake_logger.output
+        self.assertThat(
+            output.index("Staging part1"), LessThan(output.index("Pulling part2"))
+        )
+        self.assertThat(output, Not(Contains("Staging part3")))
+
+    def test_dependency_not_requested_is_staged(self):
+        project_config = self.make_core20_project()
+
+        lifecycle.execute(
+            steps.BUILD, project_config, part_names=["part2"], parallel_parts=2
+        )
+
+        self.assertThat(self.fake_logger.output, Contains("Staging part1"))
+        self.assertThat(self.fake_logger.output, Not(Contains("Pulling part3")))
+
+    def test_collisions_are_checked(self):
+        project_config = self.make_core20_project()
+
+        with mock.patch.object(pluginhandler, "check_for_collisions") as check:
+            lifecycle.execute(steps.STAGE, project_config, parallel_parts=2)
+
+        check.assert_called()
+
+    def test_parallel_parts_from_environment(self):
+        self.useFixture(fixtures.EnvironmentVariable("SNAPCRAFT_PARALLEL_PARTS", "2"))
+        project_config = self.make_core20_project()
+
+        lifecycle.execute(steps.PRIME, project_config)
+
+        self.assertThat(
+            self.fake_logger.output,
+            Not(Contains("Parts using legacy plugins cannot be run in parallel")),
+        )
+
+    def test_legacy_plugins_run_serially(self):
+        project_config = self.make_snapcraft_project(
+            textwrap.dedent(
+                """\
+                parts:
+                  part1:
+                    plugin: nil
+                  part2:
+                    plugin: nil
+                """
+            )
+        )
+
+        lifecycle.execute(steps.PRIME, project_config, parallel_parts=2)
+
+        self.assertThat(
+            self.fake_logger.output,
+            Contains("Parts using legacy plugins cannot be run in parallel"),
+        )
+        self.assertThat(
+            os.path.join(self.parts_dir, "part2", "state", "prime"), FileExists()
+        )
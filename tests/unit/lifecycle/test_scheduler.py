@@ -0,0 +1,162 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+import pytest
+
+from snapcraft.internal.lifecycle._scheduler import Scheduler
+
+
+def _recorder(events, key):
+    def _run():
+        events.append(key)
+
+    return _run
+
+
+def test_serial_order_is_kept_with_one_worker():
+    events = []
+    scheduler = Scheduler(max_workers=1)
+    scheduler.add_task("a", _recorder(events, "a"))
+    scheduler.add_task("b", _recorder(events, "b"))
+    scheduler.add_task("c", _recorder(events, "c"), after=["a"])
+
+    scheduler.run()
+
+    assert events == ["a", "b", "c"]
+
+
+def test_prerequisites_run_first():
+    events = []
+    scheduler = Scheduler(max_workers=4)
+    scheduler.add_task("pull", _recorder(events, "pull"))
+    scheduler.add_task("build", _recorder(events, "build"), after=["pull"])
+    scheduler.add_task("stage", _recorder(events, "stage"), after=["build"])
+
+    scheduler.run()
+
+    assert events == ["pull", "build", "stage"]
+
+
+def test_independent_tasks_run_concurrently():
+    # Both tasks can only complete if they are running at the same time.
+    barrier = threading.Barrier(2, timeout=10)
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", barrier.wait)
+    scheduler.add_task("b", barrier.wait)
+
+    scheduler.run()
+
+
+def test_inline_tasks_run_on_calling_thread():
+    threads = []
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", lambda: threads.append(threading.current_thread()))
+    scheduler.add_task(
+        "b", lambda: threads.append(threading.current_thread()), inline=True
+    )
+
+    scheduler.run()
+
+    assert threads[0] is not threading.current_thread()
+    assert threads[1] is threading.current_thread()
+
+
+def test_running():
+    running = []
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", lambda: None)
+    scheduler.add_task(
+        "b", lambda: running.append(scheduler.running), after=["a"], inline=True
+    )
+
+    scheduler.run()
+
+    assert running == [{"b"}]
+
+
+def test_error_stops_scheduling():
+    events = []
+
+    def _fail():
+        raise RuntimeError("failed")
+
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", _fail)
+    scheduler.add_task("b", _recorder(events, "b"), after=["a"])
+
+    with pytest.raises(RuntimeError, match="failed"):
+        scheduler.run()
+
+    assert events == []
+
+
+def test_error_in_inline_task():
+    def _fail():
+        raise RuntimeError("failed")
+
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", _fail, inline=True)
+
+    with pytest.raises(RuntimeError, match="failed"):
+        scheduler.run()
+
+
+def test_prerequisite_added_later():
+    calls = []
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", lambda: calls.append("a"), after=["b"])
+    scheduler.add_task("b", lambda: calls.append("b"))
+
+    scheduler.run()
+
+    assert calls == ["b", "a"]
+
+
+def test_unknown_prerequisite():
+    calls = []
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", lambda: calls.append("a"), after=["b"])
+
+    with pytest.raises(ValueError):
+        scheduler.run()
+    assert calls == []
+
+
+def test_cyclic_prerequisites():
+    calls = []
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", lambda: calls.append("a"), after=["b"])
+    scheduler.add_task("b", lambda: calls.append("b"), after=["a"])
+    scheduler.add_task("c", lambda: calls.append("c"))
+
+    with pytest.raises(ValueError):
+        scheduler.run()
+    assert calls == ["c"]
+
+
+def test_duplicate_task():
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_task("a", lambda: None)
+
+    with pytest.raises(ValueError):
+        scheduler.add_task("a", lambda: None)
+
+
+def test_invalid_max_workers():
+    with pytest.raises(ValueError):
+        Scheduler(max_workers=0)
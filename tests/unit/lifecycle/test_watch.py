@@ -0,0 +1,162 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+import pytest
+
+from snapcraft.internal.lifecycle import _watch
+from snapcraft.internal.project_loader._dependency_graph import DependencyGraph
+
+
+@pytest.fixture
+def inotify(tmp_path):
+    excluded = str(tmp_path / "parts")
+    inotify = _watch._Inotify(exclude=lambda p: p.startswith(excluded))
+    yield inotify
+    inotify.close()
+
+
+def _read_all(inotify):
+    paths = []
+    new_paths = inotify.read(1)
+    while new_paths:
+        paths.extend(new_paths)
+        new_paths = inotify.read(0.1)
+    return paths
+
+
+def test_inotify_file_modified(tmp_path, inotify):
+    (tmp_path / "dir").mkdir()
+    inotify.add_tree(str(tmp_path))
+
+    (tmp_path / "dir" / "file").write_text("1")
+
+    assert str(tmp_path / "dir" / "file") in _read_all(inotify)
+
+
+def test_inotify_new_directories_watched(tmp_path, inotify):
+    inotify.add_tree(str(tmp_path))
+
+    (tmp_path / "dir").mkdir()
+    _read_all(inotify)
+    (tmp_path / "dir" / "file").write_text("1")
+
+    assert str(tmp_path / "dir" / "file") in _read_all(inotify)
+
+
+def test_inotify_excluded_directories_not_watched(tmp_path, inotify):
+    (tmp_path / "parts").mkdir()
+    inotify.add_tree(str(tmp_path))
+
+    (tmp_path / "parts" / "file").write_text("1")
+
+    assert _read_all(inotify) == []
+
+
+def test_inotify_no_events(tmp_path, inotify):
+    inotify.add_tree(str(tmp_path))
+
+    assert inotify.read(0) == []
+
+
+@pytest.fixture
+def project_config():
+    project_config = mock.Mock()
+    project_config.parts.dependency_graph = DependencyGraph(
+        {"p1": [], "p2": ["p1"], "p3": ["p2"], "p4": []}
+    )
+    return project_config
+
+
+@pytest.mark.parametrize(
+    "changed_parts,part_names,expected",
+    [
+        ({"p4"}, [], ["p4"]),
+        ({"p1"}, [], ["p1", "p2", "p3"]),
+        ({"p2", "p4"}, [], ["p2", "p3", "p4"]),
+        ({"p1"}, ["p2"], ["p2"]),
+        ({"p4"}, ["p2"], []),
+        (None, [], ["p1", "p2", "p3", "p4"]),
+        (None, ["p3", "p4"], ["p3", "p4"]),
+    ],
+)
+def test_get_run_part_names(project_config, changed_parts, part_names, expected):
+    assert (
+        _watch._get_run_part_names(project_config, changed_parts, part_names)
+        == expected
+    )
+
+
+def test_watch_reruns_changed_parts(project_config):
+    watcher = mock.Mock(spec=_watch._ProjectWatcher)
+    watcher.wait.side_effect = [{"p2"}, KeyboardInterrupt()]
+
+    with mock.patch(
+        "snapcraft.internal.lifecycle._watch._ProjectWatcher", return_value=watcher
+    ), mock.patch("snapcraft.internal.lifecycle._watch.execute") as execute_mock:
+        _watch.watch(mock.sentinel.step, lambda: project_config, [])
+
+    # The requested parts run again, without forcing them to.
+    assert execute_mock.mock_calls == [
+        mock.call(mock.sentinel.step, project_config, []),
+        mock.call(mock.sentinel.step, project_config, [], rerun_requested_step=False),
+    ]
+    watcher.close.assert_called_once_with()
+
+
+def test_watch_skips_unrelated_changes(project_config):
+    watcher = mock.Mock(spec=_watch._ProjectWatcher)
+    watcher.wait.side_effect = [{"p4"}, KeyboardInterrupt()]
+
+    with mock.patch(
+        "snapcraft.internal.lifecycle._watch._ProjectWatcher", return_value=watcher
+    ), mock.patch("snapcraft.internal.lifecycle._watch.execute") as execute_mock:
+        _watch.watch(mock.sentinel.step, lambda: project_config, ["p2"])
+
+    assert execute_mock.mock_calls == [
+        mock.call(mock.sentinel.step, project_config, ["p2"])
+    ]
+
+
+def test_watch_keeps_watching_after_errors(project_config):
+    watcher = mock.Mock(spec=_watch._ProjectWatcher)
+    watcher.wait.side_effect = [{"p1"}, {"p4"}, KeyboardInterrupt()]
+
+    with mock.patch(
+        "snapcraft.internal.lifecycle._watch._ProjectWatcher", return_value=watcher
+    ), mock.patch("snapcraft.internal.lifecycle._watch.execute") as execute_mock:
+        execute_mock.side_effect = [
+            None,
+            _watch.errors.SnapcraftEnvironmentError("failed"),
+            None,
+        ]
+        _watch.watch(mock.sentinel.step, lambda: project_config, [])
+
+    assert execute_mock.call_count == 3
+
+
+def test_project_watcher_ignores_packed_snaps(tmp_path):
+    watcher = _watch._ProjectWatcher()
+    watcher._source_dirs = {str(tmp_path): {"p1"}}
+
+    try:
+        assert watcher._is_relevant(os.path.join(str(tmp_path), "src", "main.c"))
+        assert not watcher._is_relevant(os.path.join(str(tmp_path), "foo.snap"))
+        assert not watcher._is_relevant("/elsewhere/main.c")
+    finally:
+        watcher.close()
@@ -0,0 +1,138 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from snapcraft import file_utils
+from snapcraft.internal.pluginhandler._collisions import CollisionIndex, FileDigests
+
+
+def _write(path, contents, *, age=60):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+    timestamp = time.time() - age
+    os.utime(str(path), (timestamp, timestamp))
+
+
+@pytest.fixture
+def calculate_hash():
+    with mock.patch(
+        "snapcraft.file_utils.calculate_hash", wraps=file_utils.calculate_hash
+    ) as calculate_hash_mock:
+        yield calculate_hash_mock
+
+
+def test_file_digests_cached(tmp_path, calculate_hash):
+    _write(tmp_path / "file", "contents")
+    file_stat = os.stat(str(tmp_path / "file"))
+
+    digests = FileDigests()
+    digest = digests.get("file", str(tmp_path / "file"), file_stat)
+    recorded = FileDigests(digests.marshal(["file", "other"]))
+
+    assert recorded.get("file", str(tmp_path / "file"), file_stat) == digest
+    assert calculate_hash.call_count == 1
+    assert list(digests.marshal(["file", "other"])) == ["file"]
+
+
+def test_file_digests_changed_file(tmp_path):
+    _write(tmp_path / "file", "contents")
+    digests = FileDigests()
+    digest = digests.get(
+        "file", str(tmp_path / "file"), os.stat(str(tmp_path / "file"))
+    )
+
+    _write(tmp_path / "file", "modified", age=30)
+
+    assert (
+        digests.get("file", str(tmp_path / "file"), os.stat(str(tmp_path / "file")))
+        != digest
+    )
+
+
+def test_file_digests_recent_files_not_cached(tmp_path):
+    _write(tmp_path / "file", "contents", age=0)
+    digests = FileDigests()
+    digests.get("file", str(tmp_path / "file"), os.stat(str(tmp_path / "file")))
+
+    assert digests.marshal(["file"]) == {}
+
+
+def _add(index, tmp_path, part_name, digests=None):
+    install_dir = tmp_path / part_name
+    paths = {
+        os.path.relpath(os.path.join(root, name), str(install_dir))
+        for root, dirs, files in os.walk(str(install_dir))
+        for name in dirs + files
+    }
+    return index.add(part_name, str(install_dir), paths, digests or FileDigests())
+
+
+def test_collision_index(tmp_path):
+    _write(tmp_path / "part1" / "same", "same")
+    _write(tmp_path / "part1" / "different", "1")
+    _write(tmp_path / "part1" / "size", "1")
+    (tmp_path / "part1" / "dir").mkdir()
+    _write(tmp_path / "part2" / "same", "same")
+    _write(tmp_path / "part2" / "different", "2")
+    _write(tmp_path / "part2" / "size", "22")
+    _write(tmp_path / "part2" / "dir", "not a dir")
+    _write(tmp_path / "part3" / "different", "3")
+    index = CollisionIndex()
+
+    assert _add(index, tmp_path, "part1") == {}
+    conflicts = _add(index, tmp_path, "part2")
+    assert {k: sorted(v) for k, v in conflicts.items()} == {
+        "part1": ["different", "dir", "size"]
+    }
+    assert _add(index, tmp_path, "part3") == {
+        "part1": ["different"],
+        "part2": ["different"],
+    }
+
+
+def test_collision_index_different_sizes_not_read(tmp_path, calculate_hash):
+    _write(tmp_path / "part1" / "file", "1")
+    _write(tmp_path / "part2" / "file", "22")
+    index = CollisionIndex()
+
+    _add(index, tmp_path, "part1")
+    assert _add(index, tmp_path, "part2") == {"part1": ["file"]}
+
+    calculate_hash.assert_not_called()
+
+
+def test_collision_index_uses_recorded_digests(tmp_path, calculate_hash):
+    _write(tmp_path / "part1" / "file", "1")
+    _write(tmp_path / "part2" / "file", "1")
+    digests = FileDigests()
+    index = CollisionIndex()
+    _add(index, tmp_path, "part1", digests)
+    _add(index, tmp_path, "part2")
+    calculate_hash.reset_mock()
+
+    index = CollisionIndex()
+    _add(index, tmp_path, "part1", FileDigests(digests.marshal(["file"])))
+    assert _add(index, tmp_path, "part2") == {}
+
+    # Only the file of part2 is read again.
+    calculate_hash.assert_called_once_with(
+        str(tmp_path / "part2" / "file"), algorithm="sha256"
+    )
@@ -0,0 +1,143 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import pytest
+
+from snapcraft.internal.pluginhandler._fileset import (
+    FilesetMatcher,
+    get_fileset_matcher,
+)
+
+
+@pytest.fixture
+def install_dir(tmp_path):
+    install_dir = tmp_path / "install"
+    (install_dir / "usr" / "lib" / "x86_64-linux-gnu").mkdir(parents=True)
+    (install_dir / "usr" / "lib" / "x86_64-linux-gnu" / "libfoo.so").touch()
+    (install_dir / "usr" / "lib" / "x86_64-linux-gnu" / "libfoo.a").touch()
+    (install_dir / "usr" / "share" / "doc").mkdir(parents=True)
+    (install_dir / "usr" / "share" / "doc" / "README").touch()
+    (install_dir / "usr" / ".hidden").touch()
+    (install_dir / ".hidden").touch()
+    (install_dir / "lib").symlink_to("usr/lib")
+    return str(install_dir)
+
+
+@pytest.mark.parametrize(
+    "includes,excludes,files,dirs",
+    [
+        (
+            ["*"],
+            [],
+            {
+                "usr/lib/x86_64-linux-gnu/libfoo.so",
+                "usr/lib/x86_64-linux-gnu/libfoo.a",
+                "usr/share/doc/README",
+                "usr/.hidden",
+                "lib",
+            },
+            {
+                "usr",
+                "usr/lib",
+                "usr/lib/x86_64-linux-gnu",
+                "usr/share",
+                "usr/share/doc",
+            },
+        ),
+        (
+            ["usr/lib"],
+            ["**/*.a"],
+            {"usr/lib/x86_64-linux-gnu/libfoo.so"},
+            {"usr", "usr/lib", "usr/lib/x86_64-linux-gnu"},
+        ),
+        (
+            ["usr"],
+            ["usr/share", "usr/.*"],
+            {
+                "usr/lib/x86_64-linux-gnu/libfoo.so",
+                "usr/lib/x86_64-linux-gnu/libfoo.a",
+            },
+            {"usr", "usr/lib", "usr/lib/x86_64-linux-gnu"},
+        ),
+        (
+            ["**/*.so"],
+            [],
+            {"usr/lib/x86_64-linux-gnu/libfoo.so"},
+            {"usr", "usr/lib", "usr/lib/x86_64-linux-gnu"},
+        ),
+        (
+            ["usr/*/"],
+            ["usr/lib"],
+            {"usr/share/doc/README"},
+            {"usr", "usr/share", "usr/share/doc"},
+        ),
+        (
+            ["usr/share/doc/README", "does/not/exist"],
+            [],
+            {"usr/share/doc/README", "does/not/exist"},
+            {"usr", "usr/share", "usr/share/doc", "does", "does/not"},
+        ),
+    ],
+)
+def test_match(install_dir, includes, excludes, files, dirs):
+    assert FilesetMatcher(includes, excludes).match(install_dir) == (files, dirs)
+
+
+def test_match_hidden_files_in_included_directories(install_dir):
+    files, dirs = FilesetMatcher(["usr/*"], []).match(install_dir)
+
+    assert "usr/.hidden" not in files
+
+    files, dirs = FilesetMatcher(["usr"], []).match(install_dir)
+
+    assert "usr/.hidden" in files
+
+
+def test_match_through_symlinks_resolved(install_dir):
+    files, dirs = FilesetMatcher(["lib/*/*.so"], []).match(install_dir)
+
+    assert files == {"usr/lib/x86_64-linux-gnu/libfoo.so"}
+    assert dirs == {"usr", "usr/lib", "usr/lib/x86_64-linux-gnu"}
+
+
+def test_match_excluded_symlinked_directory(install_dir):
+    files, dirs = FilesetMatcher(["lib/*/*"], ["lib/*"]).match(install_dir)
+
+    assert files == set()
+
+
+def test_match_recursive_symlink_loop(install_dir):
+    os.symlink("..", os.path.join(install_dir, "usr", "share", "up"))
+
+    files, dirs = FilesetMatcher(["**/README"], []).match(install_dir)
+
+    assert "usr/share/doc/README" in files
+
+
+def test_match_relative_directory(install_dir, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(install_dir))
+
+    files, dirs = FilesetMatcher(["usr/lib/*/*.so"], []).match("install")
+
+    assert files == {"usr/lib/x86_64-linux-gnu/libfoo.so"}
+
+
+def test_get_fileset_matcher_is_shared():
+    assert get_fileset_matcher(("*",), ("usr",)) is get_fileset_matcher(
+        ("*",), ("usr",)
+    )
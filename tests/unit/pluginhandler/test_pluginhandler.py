@@ -1413,6 +1413,40 @@ class CollisionTestCase(unit.TestCase):
         self.assertThat(raised.part_name, Equals("part4"))
         self.assertThat(raised.file_paths, Equals("    file.pc"))
 
+    def test_collisions_between_many_parts(self):
+        raised = self.assertRaises(
+            errors.SnapcraftPartConflictsError,
+            pluginhandler.check_for_collisions,
+            [self.part1, self.part2, self.part3, self.part4],
+        )
+
+        self.assertThat(
+            raised.conflicts,
+            Equals(
+                "Parts 'part2' and 'part3':\n"
+                "    1\n"
+                "    a/2\n"
+                "Parts 'part1' and 'part4':\n"
+                "    file.pc\n"
+                "Parts 'part2' and 'part4':\n"
+                "    file.pc"
+            ),
+        )
+
+    def test_no_collisions_hard_links_not_read(self):
+        part7 = self.load_part("part7")
+        part7.part_install_dir = self.part2.part_install_dir + "7"
+        os.makedirs(part7.part_install_dir)
+        os.link(
+            os.path.join(self.part2.part_install_dir, "1"),
+            os.path.join(part7.part_install_dir, "1"),
+        )
+
+        with patch("snapcraft.file_utils.calculate_hash") as hash_mock:
+            pluginhandler.check_for_collisions([self.part2, part7])
+
+        hash_mock.assert_not_called()
+
     def test_collision_with_part_not_built(self):
         part_built = self.load_part(
             "part_built", part_properties={"stage": ["collision"]}
@@ -756,11 +756,16 @@ class StateTestCase(StateBaseTestCase):
         self.assertTrue(type(state.project_options) is OrderedDict)
         self.assertThat(len(state.project_options), Equals(0))
 
+    @patch("snapcraft.internal.elf._determine_libraries", return_value=dict())
     @patch("snapcraft.internal.elf.ElfFile._extract_attributes")
     @patch("snapcraft.internal.elf.ElfFile.load_dependencies")
     @patch("snapcraft.internal.pluginhandler._migrate_files")
     def test_prime_state_with_dependencies(
-        self, mock_migrate_files, mock_load_dependencies, mock_get_symbols
+        self,
+        mock_migrate_files,
+        mock_load_dependencies,
+        mock_get_symbols,
+        mock_determine_libraries,
     ):
         mock_load_dependencies.return_value = {
             "/foo/bar/baz",
@@ -827,11 +832,16 @@ class StateTestCase(StateBaseTestCase):
         self.assertTrue(type(state.project_options) is OrderedDict)
         self.assertThat(len(state.project_options), Equals(0))
 
+    @patch("snapcraft.internal.elf._determine_libraries", return_value=dict())
     @patch("snapcraft.internal.elf.ElfFile._extract_attributes")
     @patch("snapcraft.internal.elf.ElfFile.load_dependencies")
     @patch("snapcraft.internal.pluginhandler._migrate_files")
     def test_prime_state_missing_libraries(
-        self, mock_migrate_files, mock_load_dependencies, mock_get_symbols
+        self,
+        mock_migrate_files,
+        mock_load_dependencies,
+        mock_get_symbols,
+        mock_determine_libraries,
     ):
         self.handler = self.load_part("test_part")
 
@@ -885,11 +895,16 @@ class StateTestCase(StateBaseTestCase):
         # The rest should be considered missing.
         self.assertThat(state.dependency_paths, Equals({"lib3"}))
 
+    @patch("snapcraft.internal.elf._determine_libraries", return_value=dict())
     @patch("snapcraft.internal.elf.ElfFile._extract_attributes")
     @patch("snapcraft.internal.elf.ElfFile.load_dependencies")
     @patch("snapcraft.internal.pluginhandler._migrate_files")
     def test_prime_state_with_shadowed_dependencies(
-        self, mock_migrate_files, mock_load_dependencies, mock_get_symbols
+        self,
+        mock_migrate_files,
+        mock_load_dependencies,
+        mock_get_symbols,
+        mock_determine_libraries,
     ):
         self.get_elf_files_mock.return_value = frozenset([elf.ElfFile(path="bin/1")])
         mock_load_dependencies.return_value = {
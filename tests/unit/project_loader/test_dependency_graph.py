@@ -0,0 +1,98 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from snapcraft.internal.project_loader import errors
+from snapcraft.internal.project_loader._dependency_graph import DependencyGraph
+
+
+@pytest.fixture
+def graph():
+    return DependencyGraph(
+        {
+            "nested-dependent": ["dependent"],
+            "dependent": ["main"],
+            "main": [],
+            "other": [],
+        }
+    )
+
+
+def test_order(graph):
+    assert graph.order == ["main", "dependent", "nested-dependent", "other"]
+
+
+@pytest.mark.parametrize(
+    "dependencies,expected_order",
+    [
+        ({"part1": [], "part2": []}, ["part1", "part2"]),
+        ({"part2": [], "part1": []}, ["part1", "part2"]),
+        (
+            {"part2": ["part3"], "part1": [], "part3": []},
+            ["part1", "part3", "part2"],
+        ),
+        (
+            {"part2": ["part3"], "part1": ["part3"], "part3": []},
+            ["part3", "part1", "part2"],
+        ),
+    ],
+)
+def test_order_consistency(dependencies, expected_order):
+    assert DependencyGraph(dependencies).order == expected_order
+
+
+def test_get_dependencies(graph):
+    assert graph.get_dependencies("main") == set()
+    assert graph.get_dependencies("dependent") == {"main"}
+    assert graph.get_dependencies("nested-dependent") == {"dependent"}
+
+
+def test_get_dependencies_recursive(graph):
+    assert graph.get_dependencies("main", recursive=True) == set()
+    assert graph.get_dependencies("nested-dependent", recursive=True) == {
+        "main",
+        "dependent",
+    }
+
+
+def test_get_reverse_dependencies(graph):
+    assert graph.get_reverse_dependencies("nested-dependent") == set()
+    assert graph.get_reverse_dependencies("main") == {"dependent"}
+
+
+def test_get_reverse_dependencies_recursive(graph):
+    assert graph.get_reverse_dependencies("other", recursive=True) == set()
+    assert graph.get_reverse_dependencies("main", recursive=True) == {
+        "dependent",
+        "nested-dependent",
+    }
+
+
+def test_unknown_part(graph):
+    assert graph.get_dependencies("unknown", recursive=True) == set()
+    assert graph.get_reverse_dependencies("unknown") == set()
+
+
+@pytest.mark.parametrize(
+    "dependencies",
+    [{"p1": ["p2"], "p2": ["p1"]}, {"p1": ["p1"]}],
+)
+def test_dependency_loop(dependencies):
+    with pytest.raises(errors.SnapcraftLogicError) as raised:
+        DependencyGraph(dependencies)
+
+    assert raised.value.message == "circular dependency chain found in parts definition"
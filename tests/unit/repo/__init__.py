@@ -14,7 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import logging
+import tarfile
 import tempfile
 
 import fixtures
@@ -30,3 +32,52 @@ class RepoBaseTestCase(unit.TestCase):
         tempdirObj = tempfile.TemporaryDirectory()
         self.addCleanup(tempdirObj.cleanup)
         self.tempdir = tempdirObj.name
+
+
+def make_tar_member(name, *, data=b"", mode=0o644, **kwargs):
+    """Return a tar member for make_deb, with its contents."""
+    member = tarfile.TarInfo(name)
+    member.mode = mode
+    member.mtime = 1000000000
+    for attribute, value in kwargs.items():
+        setattr(member, attribute, value)
+    if member.isreg():
+        member.size = len(data)
+    return member, io.BytesIO(data)
+
+
+def _make_tar(members, compression):
+    tar_data = io.BytesIO()
+    with tarfile.open(fileobj=tar_data, mode="w:" + compression) as tar:
+        for member, data in members:
+            tar.addfile(member, data)
+    return tar_data.getvalue()
+
+
+def make_deb(path, name, version, members, compression="xz"):
+    """Write a deb package with the tar members, as returned by make_tar_member."""
+    control = "Package: {}\nVersion: {}\nArchitecture: all\n".format(name, version)
+    ar_members = [
+        ("debian-binary", b"2.0\n"),
+        (
+            "control.tar.gz",
+            _make_tar([make_tar_member("./control", data=control.encode())], "gz"),
+        ),
+        (
+            "data.tar" + ("." + compression if compression else ""),
+            _make_tar(members, compression),
+        ),
+    ]
+
+    with path.open("wb") as deb_file:
+        deb_file.write(b"!<arch>\n")
+        for member_name, data in ar_members:
+            deb_file.write(
+                "{:<16}{:<12}{:<6}{:<6}{:<8}{:<10}`\n".format(
+                    member_name, 0, 0, 0, 100644, len(data)
+                ).encode()
+            )
+            deb_file.write(data)
+            if len(data) % 2:
+                deb_file.write(b"\n")
+    return path
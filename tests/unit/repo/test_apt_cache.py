@@ -14,15 +14,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import os
 import unittest
 from pathlib import Path
+from unittest import mock
 from unittest.mock import call
 
 import fixtures
 from testtools.matchers import Equals
 
-from snapcraft.internal.repo.apt_cache import AptCache
+from snapcraft.internal.repo import errors
+from snapcraft.internal.repo.apt_cache import AptCache, get_sources_digest
 from tests import unit
 
 
@@ -90,7 +93,7 @@ class TestMockedApt(unit.TestCase):
                     call.apt_pkg.config.set("Dir::State", "/var/lib/apt"),
                     call.apt_pkg.config.clear("APT::Update::Post-Invoke-Success"),
                     call.progress.text.AcquireProgress(),
-                    call.Cache(memonly=True, rootdir=str(stage_cache)),
+                    call.Cache(rootdir=str(stage_cache)),
                     call.Cache().close(),
                 ]
             ),
@@ -147,7 +150,65 @@ class TestMockedApt(unit.TestCase):
                     call.apt_pkg.config.set("Dir::State", "/var/lib/apt"),
                     call.apt_pkg.config.clear("APT::Update::Post-Invoke-Success"),
                     call.progress.text.AcquireProgress(),
-                    call.Cache(memonly=True, rootdir=str(stage_cache)),
+                    call.Cache(rootdir=str(stage_cache)),
+                    call.Cache().close(),
+                ]
+            ),
+        )
+
+    def test_stage_cache_configured_once(self):
+        self.fake_apt = self.useFixture(
+            fixtures.MockPatch("snapcraft.internal.repo.apt_cache.apt")
+        ).mock
+        stage_cache = Path(self.path, "cache")
+        cache_etc_apt_path = stage_cache / "etc" / "apt"
+        pkgcache_path = stage_cache / "var" / "cache" / "apt" / "pkgcache.bin"
+        pkgcache_path.parent.mkdir(parents=True)
+
+        inodes = set()
+        for _ in range(2):
+            pkgcache_path.write_text("pkgcache")
+            with AptCache(stage_cache=stage_cache, stage_cache_arch="amd64"):
+                inodes.add(cache_etc_apt_path.stat().st_ino)
+
+        # The configuration was not copied again, nor the binary caches
+        # removed.
+        self.assertThat(len(inodes), Equals(1))
+        self.assertThat(pkgcache_path.exists(), Equals(True))
+        self.assertThat(
+            (cache_etc_apt_path / "apt.conf.d" / "00default-arch").read_text(),
+            Equals('APT::Architecture "amd64";\n'),
+        )
+
+        # Configured again for another architecture.
+        with AptCache(stage_cache=stage_cache, stage_cache_arch="arm64"):
+            inodes.add(cache_etc_apt_path.stat().st_ino)
+
+        self.assertThat(len(inodes), Equals(2))
+        self.assertThat(pkgcache_path.exists(), Equals(False))
+        self.assertThat(
+            (cache_etc_apt_path / "apt.conf.d" / "00default-arch").read_text(),
+            Equals('APT::Architecture "arm64";\n'),
+        )
+
+    def test_keep_open(self):
+        self.fake_apt = self.useFixture(
+            fixtures.MockPatch("snapcraft.internal.repo.apt_cache.apt")
+        ).mock
+
+        apt_cache = AptCache(keep_open=True)
+        for _ in range(2):
+            with apt_cache:
+                pass
+        apt_cache.close()
+
+        self.assertThat(
+            self.fake_apt.mock_calls,
+            Equals(
+                [
+                    call.Cache(),
+                    call.Cache().clear(),
+                    call.Cache().clear(),
                     call.Cache().close(),
                 ]
             ),
@@ -165,6 +226,171 @@ class TestMockedApt(unit.TestCase):
             self.fake_apt.mock_calls, Equals([call.Cache(), call.Cache().close()])
         )
 
+    def test_fetch_archives(self):
+        self.fake_apt = self.useFixture(
+            fixtures.MockPatch("snapcraft.internal.repo.apt_cache.apt")
+        ).mock
+        fake_acquire_file = self.fake_apt.apt_pkg.AcquireFile.return_value
+        fake_acquire_file.status = fake_acquire_file.STAT_DONE
+
+        download_path = Path(self.path, "debs")
+        download_path.mkdir()
+        # An archive fetched before, which is not downloaded again.
+        (download_path / "bar_2.0_amd64.deb").write_bytes(b"bar")
+        packages = [
+            mock.Mock(candidate=mock.Mock(version=version, size=3, sha256=sha256))
+            for version, sha256 in [
+                ("1.0", "foo-hash"),
+                ("2.0", hashlib.sha256(b"bar").hexdigest()),
+            ]
+        ]
+        for package, name in zip(packages, ["foo", "bar"]):
+            package.name = name
+            package.candidate.filename = (
+                f"pool/{name}_{package.candidate.version}_amd64.deb"
+            )
+            package.candidate._cand.file_list = [(mock.sentinel.package_file, 0)]
+            package.candidate._records.filename = package.candidate.filename
+
+        apt_cache = AptCache()
+        apt_cache.cache = mock.Mock(**{"get_changes.return_value": packages})
+        apt_cache.progress = mock.sentinel.progress
+        self.fake_apt.apt_pkg.config.find_b.return_value = False
+        index = apt_cache.cache._list.find_index.return_value
+        index.is_trusted = True
+        index.archive_uri.side_effect = lambda path: f"http://archive/{path}"
+
+        self.assertThat(
+            apt_cache.fetch_archives(download_path),
+            Equals(
+                [
+                    ("foo", "1.0", download_path / "foo_1.0_amd64.deb"),
+                    ("bar", "2.0", download_path / "bar_2.0_amd64.deb"),
+                ]
+            ),
+        )
+        self.fake_apt.apt_pkg.Acquire.assert_called_once_with(mock.sentinel.progress)
+        self.fake_apt.apt_pkg.AcquireFile.assert_called_once_with(
+            self.fake_apt.apt_pkg.Acquire.return_value,
+            uri="http://archive/pool/foo_1.0_amd64.deb",
+            hash=packages[0].candidate._records.hashes,
+            size=3,
+            descr="foo_1.0_amd64.deb",
+            short_descr="foo",
+            destfile=str(download_path / "foo_1.0_amd64.deb"),
+        )
+        self.fake_apt.apt_pkg.Acquire.return_value.run.assert_called_once_with()
+
+    def _get_fetch_archives_cache(self, *, is_trusted=True, hashes_usable=True):
+        self.fake_apt = self.useFixture(
+            fixtures.MockPatch("snapcraft.internal.repo.apt_cache.apt")
+        ).mock
+        self.fake_apt.apt_pkg.config.find_b.return_value = False
+
+        package = mock.Mock(candidate=mock.Mock(version="1.0", sha256="foo-hash"))
+        package.candidate.filename = "pool/foo_1.0_amd64.deb"
+        package.candidate._cand.file_list = [(mock.sentinel.package_file, 0)]
+        package.candidate._records.hashes.usable = hashes_usable
+
+        apt_cache = AptCache()
+        apt_cache.cache = mock.Mock(**{"get_changes.return_value": [package]})
+        apt_cache.cache._list.find_index.return_value.is_trusted = is_trusted
+        apt_cache.progress = mock.sentinel.progress
+        return apt_cache
+
+    def test_fetch_archives_error(self):
+        apt_cache = self._get_fetch_archives_cache()
+        fake_acquire_file = self.fake_apt.apt_pkg.AcquireFile.return_value
+        fake_acquire_file.destfile = "foo_1.0_amd64.deb"
+        fake_acquire_file.error_text = "Hash Sum mismatch"
+
+        raised = self.assertRaises(
+            errors.PackageFetchError, apt_cache.fetch_archives, Path(self.path)
+        )
+        self.assertThat(
+            str(raised),
+            Equals(
+                "Package fetch error: The item 'foo_1.0_amd64.deb' could not be "
+                "fetched: Hash Sum mismatch"
+            ),
+        )
+
+    def test_fetch_archives_untrusted(self):
+        apt_cache = self._get_fetch_archives_cache(is_trusted=False)
+
+        raised = self.assertRaises(
+            errors.PackageFetchError, apt_cache.fetch_archives, Path(self.path)
+        )
+        self.assertThat(
+            str(raised),
+            Equals(
+                "Package fetch error: The item 'foo_1.0_amd64.deb' could not be "
+                "fetched: The source is not trusted."
+            ),
+        )
+        self.fake_apt.apt_pkg.AcquireFile.assert_not_called()
+
+    def test_fetch_archives_no_hash(self):
+        apt_cache = self._get_fetch_archives_cache(hashes_usable=False)
+
+        raised = self.assertRaises(
+            errors.PackageFetchError, apt_cache.fetch_archives, Path(self.path)
+        )
+        self.assertThat(
+            str(raised),
+            Equals(
+                "Package fetch error: The item 'foo_1.0_amd64.deb' could not be "
+                "fetched: No trusted hash found."
+            ),
+        )
+        self.fake_apt.apt_pkg.AcquireFile.assert_not_called()
+
+    def test_fetch_archives_allow_unauthenticated(self):
+        apt_cache = self._get_fetch_archives_cache(
+            is_trusted=False, hashes_usable=False
+        )
+        self.fake_apt.apt_pkg.config.find_b.return_value = True
+        fake_acquire_file = self.fake_apt.apt_pkg.AcquireFile.return_value
+        fake_acquire_file.status = fake_acquire_file.STAT_DONE
+
+        apt_cache.fetch_archives(Path(self.path))
+
+        self.fake_apt.apt_pkg.AcquireFile.assert_called_once()
+
+
+class TestGetSourcesDigest(unit.TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.apt_dir = Path(self.path, "etc", "apt")
+        (self.apt_dir / "sources.list.d").mkdir(parents=True)
+        (self.apt_dir / "sources.list").write_text("deb http://archive main")
+        self.lists_dir = Path(self.path, "lists")
+        (self.lists_dir / "partial").mkdir(parents=True)
+        (self.lists_dir / "archive_Packages").write_text("Package: foo")
+
+    def _get_digest(self):
+        return get_sources_digest(str(self.apt_dir), str(self.lists_dir))
+
+    def test_unchanged(self):
+        digest = self._get_digest()
+        (self.lists_dir / "lock").write_text("")
+        (self.lists_dir / "partial" / "archive_Packages").write_text("Pack")
+
+        self.assertThat(self._get_digest(), Equals(digest))
+
+    def test_source_added(self):
+        digest = self._get_digest()
+        (self.apt_dir / "sources.list.d" / "ppa.list").write_text("deb http://ppa")
+
+        self.assertThat(self._get_digest() == digest, Equals(False))
+
+    def test_lists_updated(self):
+        digest = self._get_digest()
+        (self.lists_dir / "archive_Packages").write_text("Package: foo-updated")
+
+        self.assertThat(self._get_digest() == digest, Equals(False))
+
 
 class TestAptReadonlyHostCache(unit.TestCase):
     def test_host_is_package_valid(self):
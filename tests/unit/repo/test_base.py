@@ -182,6 +182,15 @@ class FixShebangTestCase(RepoBaseTestCase):
                 self.expectThat(fd.read(), Equals(data["expected"]))
 
 
+class NormalizeTestCase(RepoBaseTestCase):
+    def test_normalize_returns_fixer_timings(self):
+        timings = BaseRepo.normalize(self.tempdir)
+
+        self.assertThat(
+            list(timings), Equals(["symlinks", "filemode", "pkg-config", "shebangs"])
+        )
+
+
 class RemoveUselessFilesTestCase(RepoBaseTestCase):
     def create(self, file_path):
         path = os.path.join("root", file_path)
@@ -14,7 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import contextlib
+import os
 import textwrap
 from pathlib import Path
 from subprocess import CalledProcessError
@@ -24,7 +24,7 @@ from unittest.mock import call
 import fixtures
 import pytest
 import testtools
-from testtools.matchers import Equals
+from testtools.matchers import Equals, FileExists
 
 from snapcraft.internal import repo
 from snapcraft.internal.repo import errors
@@ -57,19 +57,6 @@ class TestPackages(unit.TestCase):
         repo._deb._DEB_CACHE_DIR = self.debs_path
         repo._deb._STAGE_CACHE_DIR = self.stage_cache_path
 
-        @contextlib.contextmanager
-        def fake_tempdir(*, suffix: str, **kwargs):
-            temp_dir = Path(self.path, suffix)
-            temp_dir.mkdir(exist_ok=True, parents=True)
-            yield str(temp_dir)
-
-        self.fake_tmp_mock = self.useFixture(
-            fixtures.MockPatch(
-                "snapcraft.internal.repo._deb.tempfile.TemporaryDirectory",
-                new=fake_tempdir,
-            )
-        ).mock
-
         self.stage_packages_path = Path(self.path)
 
     @mock.patch(
@@ -178,6 +165,106 @@ class TestPackages(unit.TestCase):
             Equals(sorted(["fake-package=1.0", "fake-package-dep=2.0"])),
         )
 
+    def test_fetch_stage_packages_locked(self):
+        fake_package = self.debs_path / "fake-package_1.0_all.deb"
+        fake_package.write_text("fake-package")
+        self.fake_apt_cache.return_value.__enter__.return_value.fetch_archives.return_value = [
+            ("fake-package", "1.0", fake_package)
+        ]
+
+        for _ in range(2):
+            fetched_packages = repo.Ubuntu.fetch_stage_packages(
+                package_names=["fake-package"],
+                stage_packages_path=self.stage_packages_path,
+                base="core18",
+                target_arch="amd64",
+            )
+            self.assertThat(fetched_packages, Equals(["fake-package=1.0"]))
+
+        # Packages are only resolved once.
+        self.fake_apt_cache.assert_called_once_with(
+            stage_cache=self.stage_cache_path, stage_cache_arch="amd64"
+        )
+        self.assertThat(
+            str(self.stage_packages_path / "fake-package_1.0_all.deb"), FileExists()
+        )
+
+    def test_fetch_stage_packages_lock_not_matching(self):
+        fake_package = self.debs_path / "fake-package_1.0_all.deb"
+        fake_package.write_text("fake-package")
+        self.fake_apt_cache.return_value.__enter__.return_value.fetch_archives.return_value = [
+            ("fake-package", "1.0", fake_package)
+        ]
+
+        for package_names in [["fake-package"], ["fake-package", "other-package"]]:
+            repo.Ubuntu.fetch_stage_packages(
+                package_names=package_names,
+                stage_packages_path=self.stage_packages_path,
+                base="core18",
+                target_arch="amd64",
+            )
+        # A fetched package changed.
+        fake_package.write_text("changed")
+        repo.Ubuntu.fetch_stage_packages(
+            package_names=["fake-package", "other-package"],
+            stage_packages_path=self.stage_packages_path,
+            base="core18",
+            target_arch="amd64",
+        )
+
+        self.assertThat(self.fake_apt_cache.call_count, Equals(3))
+
+    def test_fetch_stage_packages_lock_filtered_packages_changed(self):
+        fake_package = self.debs_path / "fake-package_1.0_all.deb"
+        fake_package.write_text("fake-package")
+        self.fake_apt_cache.return_value.__enter__.return_value.fetch_archives.return_value = [
+            ("fake-package", "1.0", fake_package)
+        ]
+
+        # The base is the same, the packages it provides are not.
+        for filtered_packages in [{"filtered-pkg-1"}, {"filtered-pkg-2"}]:
+            with mock.patch(
+                "snapcraft.internal.repo._deb._DEFAULT_FILTERED_STAGE_PACKAGES",
+                filtered_packages,
+            ):
+                repo.Ubuntu.fetch_stage_packages(
+                    package_names=["fake-package"],
+                    stage_packages_path=self.stage_packages_path,
+                    base="core18",
+                    target_arch="amd64",
+                )
+
+        self.assertThat(self.fake_apt_cache.call_count, Equals(2))
+
+    def test_fetch_stage_packages_in_session(self):
+        fake_package = self.debs_path / "fake-package_1.0_all.deb"
+        fake_package.write_text("fake-package")
+        self.fake_apt_cache.return_value.__enter__.return_value.fetch_archives.return_value = [
+            ("fake-package", "1.0", fake_package)
+        ]
+
+        with repo.Ubuntu.session():
+            with repo.Ubuntu.session():
+                for package_names in [["fake-package"], ["fake-package", "other"]]:
+                    repo.Ubuntu.fetch_stage_packages(
+                        package_names=package_names,
+                        stage_packages_path=self.stage_packages_path,
+                        base="core18",
+                        target_arch="amd64",
+                    )
+            self.fake_apt_cache.return_value.close.assert_not_called()
+
+        # The cache is shared by the session, and closed when it ends.
+        self.fake_apt_cache.assert_called_once_with(
+            stage_cache=self.stage_cache_path,
+            stage_cache_arch="amd64",
+            keep_open=True,
+        )
+        self.assertThat(
+            self.fake_apt_cache.return_value.__enter__.call_count, Equals(2)
+        )
+        self.fake_apt_cache.return_value.close.assert_called_once_with()
+
     def test_get_package_fetch_error(self):
         self.fake_apt_cache.return_value.__enter__.return_value.fetch_archives.side_effect = errors.PackageFetchError(
             "foo"
@@ -208,6 +295,34 @@ class TestPackages(unit.TestCase):
 
         mock_normalize.assert_not_called()
 
+    @mock.patch.object(repo._deb.Ubuntu, "normalize")
+    @mock.patch("snapcraft.internal.repo._deb._EXTRACTED_DEB_CACHE")
+    def test_unpack_stage_packages_marks_origins(self, mock_cache, mock_normalize):
+        packages_path = Path(self.path, "pkg")
+        install_path = Path(self.path, "install")
+        packages_path.mkdir()
+        install_path.mkdir()
+        (packages_path / "fake-package_1.0_all.deb").touch()
+        (packages_path / "another-package_1.0_all.deb").touch()
+        origins = {
+            os.path.join(str(install_path), "usr", "bin", "foo"): "fake-package=1.0"
+        }
+        mock_cache.install.return_value = origins
+
+        repo.Ubuntu.unpack_stage_packages(
+            stage_packages_path=packages_path, install_path=install_path
+        )
+
+        mock_cache.install.assert_called_once_with(
+            [
+                packages_path / "another-package_1.0_all.deb",
+                packages_path / "fake-package_1.0_all.deb",
+            ],
+            str(install_path),
+            workers=mock.ANY,
+        )
+        mock_normalize.assert_called_once_with(str(install_path), origins=origins)
+
 
 class BuildPackagesTestCase(unit.TestCase):
     def setUp(self):
@@ -216,6 +331,12 @@ class BuildPackagesTestCase(unit.TestCase):
         self.fake_apt_cache = self.useFixture(
             fixtures.MockPatch("snapcraft.internal.repo._deb.AptCache")
         ).mock
+        self.useFixture(
+            fixtures.MockPatch(
+                "snapcraft.internal.repo._deb._APT_CACHE_SESSION",
+                new=repo._deb._AptCacheSession(),
+            )
+        )
 
         self.fake_run = self.useFixture(
             fixtures.MockPatch("subprocess.check_call")
@@ -302,6 +423,48 @@ class BuildPackagesTestCase(unit.TestCase):
             ),
         )
 
+    def test_host_cache_shared(self):
+        self.fake_apt_cache.return_value.__enter__.return_value.get_packages_marked_for_installation.return_value = [
+            ("package-installed", "1.0")
+        ]
+
+        repo.Ubuntu.install_build_packages(["package-installed"])
+        repo.Ubuntu.build_package_is_valid("package")
+        repo.Ubuntu.is_package_installed("package")
+
+        self.fake_apt_cache.assert_called_once_with(keep_open=True)
+        self.assertThat(
+            self.fake_apt_cache.return_value.__enter__.call_count, Equals(4)
+        )
+        self.fake_apt_cache.return_value.close.assert_not_called()
+
+    def test_install_build_package_invalidates_host_cache(self):
+        self.fake_apt_cache.return_value.__enter__.return_value.get_packages_marked_for_installation.return_value = [
+            ("package", "1.0")
+        ]
+
+        repo.Ubuntu.install_build_packages(["package"])
+
+        # Closed after updating the package lists and after installing.
+        self.assertThat(
+            self.fake_apt_cache.return_value.mock_calls,
+            Equals(
+                [
+                    call.__enter__(),
+                    call.__enter__().get_installed_version(
+                        "package", resolve_virtual_packages=True
+                    ),
+                    call.__exit__(None, None, None),
+                    call.close(),
+                    call.__enter__(),
+                    call.__enter__().mark_packages({"package"}),
+                    call.__enter__().get_packages_marked_for_installation(),
+                    call.__exit__(None, None, None),
+                    call.close(),
+                ]
+            ),
+        )
+
     def test_already_installed_no_specified_version(self):
         self.fake_apt_cache.return_value.__enter__.return_value.get_packages_marked_for_installation.return_value = [
             ("package-installed", "1.0")
@@ -504,24 +667,17 @@ class PackageForFileTest(unit.TestCase):
     def setUp(self):
         super().setUp()
 
-        def fake_dpkg_query(*args, **kwargs):
-            # dpkg-query -S file_path
-            if args[0][2] == "/bin/bash":
-                return "bash: /bin/bash\n".encode()
-            elif args[0][2] == "/bin/sh":
-                return (
-                    "diversion by dash from: /bin/sh\n"
-                    "diversion by dash to: /bin/sh.distrib\n"
-                    "dash: /bin/sh\n"
-                ).encode()
-            else:
-                raise CalledProcessError(
-                    1,
-                    "dpkg-query: no path found matching pattern {}".format(args[0][2]),
-                )
-
+        admin_dir = Path(self.path, "dpkg")
+        (admin_dir / "info").mkdir(parents=True)
+        (admin_dir / "status").touch()
+        (admin_dir / "info" / "bash.list").write_text("/.\n/bin\n/bin/bash\n")
+        # dash diverts the /bin/sh of bash.
+        (admin_dir / "info" / "dash.list").write_text("/.\n/bin\n/bin/sh\n")
         self.useFixture(
-            fixtures.MockPatch("subprocess.check_output", side_effect=fake_dpkg_query)
+            fixtures.MockPatch(
+                "snapcraft.internal.repo._deb._DPKG_DATABASE",
+                new=repo._dpkg.DpkgDatabase(str(admin_dir)),
+            )
         )
 
     def test_get_package_for_file(self):
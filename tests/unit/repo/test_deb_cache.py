@@ -0,0 +1,145 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tarfile
+from unittest import mock
+
+import pytest
+
+from snapcraft.internal.repo import _deb_cache, _debfile, errors
+
+from . import make_deb, make_tar_member
+
+
+@pytest.fixture
+def deb_paths(tmp_path):
+    return [
+        make_deb(
+            tmp_path / "foo.deb",
+            "foo",
+            "1.0",
+            [
+                make_tar_member("./usr/", type=tarfile.DIRTYPE, mode=0o755),
+                make_tar_member("./usr/bin/", type=tarfile.DIRTYPE, mode=0o755),
+                make_tar_member("./usr/bin/foo", data=b"foo", mode=0o755),
+                make_tar_member("./usr/bin/bar", type=tarfile.SYMTYPE, linkname="foo"),
+                make_tar_member("./usr/shared", data=b"foo"),
+            ],
+        ),
+        make_deb(
+            tmp_path / "qux.deb",
+            "qux",
+            "2.0",
+            [
+                make_tar_member("./usr/", type=tarfile.DIRTYPE, mode=0o700),
+                make_tar_member("./usr/shared", data=b"qux"),
+            ],
+        ),
+    ]
+
+
+@pytest.fixture
+def extracted_deb_cache(tmp_path):
+    return _deb_cache.ExtractedDebCache(str(tmp_path / "cache"))
+
+
+def _install(extracted_deb_cache, deb_paths, install_dir):
+    install_dir.mkdir()
+    return extracted_deb_cache.install(deb_paths, str(install_dir), workers=2)
+
+
+def test_install(tmp_path, extracted_deb_cache, deb_paths):
+    install_dir = tmp_path / "install"
+
+    origins = _install(extracted_deb_cache, deb_paths, install_dir)
+
+    assert (install_dir / "usr" / "bin" / "foo").read_text() == "foo"
+    assert (install_dir / "usr" / "bin" / "foo").stat().st_mode & 0o7777 == 0o755
+    assert os.readlink(str(install_dir / "usr" / "bin" / "bar")) == "foo"
+    # The last package wins.
+    assert (install_dir / "usr" / "shared").read_text() == "qux"
+    assert (install_dir / "usr").stat().st_mode & 0o7777 == 0o700
+    assert origins == {
+        str(install_dir / "usr" / "bin" / "foo"): "foo=1.0",
+        str(install_dir / "usr" / "bin" / "bar"): "foo=1.0",
+        str(install_dir / "usr" / "shared"): "qux=2.0",
+    }
+
+
+def test_install_copies_from_cache(tmp_path, extracted_deb_cache, deb_paths):
+    _install(extracted_deb_cache, deb_paths, tmp_path / "first")
+
+    with mock.patch.object(
+        _debfile, "extract_debs", wraps=_debfile.extract_debs
+    ) as extract_mock:
+        origins = _install(extracted_deb_cache, deb_paths, tmp_path / "second")
+
+    extract_mock.assert_not_called()
+    assert (tmp_path / "second" / "usr" / "bin" / "foo").read_text() == "foo"
+    assert not os.path.samefile(
+        str(tmp_path / "first" / "usr" / "bin" / "foo"),
+        str(tmp_path / "second" / "usr" / "bin" / "foo"),
+    )
+    assert origins[str(tmp_path / "second" / "usr" / "shared")] == "qux=2.0"
+
+
+def test_install_changed_in_place(tmp_path, extracted_deb_cache, deb_paths):
+    _install(extracted_deb_cache, deb_paths, tmp_path / "first")
+    _install(extracted_deb_cache, deb_paths, tmp_path / "second")
+
+    # As plugins rewriting files (e.g. with file_utils.replace_in_file) do.
+    with (tmp_path / "first" / "usr" / "bin" / "foo").open("w") as foo_file:
+        foo_file.write("changed")
+
+    assert (tmp_path / "second" / "usr" / "bin" / "foo").read_text() == "foo"
+    cached_paths = list((tmp_path / "cache").glob("v1/*/tree/usr/bin/foo"))
+    assert [p.read_text() for p in cached_paths] == ["foo"]
+
+    with mock.patch.object(
+        _debfile, "extract_debs", wraps=_debfile.extract_debs
+    ) as extract_mock:
+        _install(extracted_deb_cache, deb_paths, tmp_path / "third")
+
+    extract_mock.assert_not_called()
+    assert (tmp_path / "third" / "usr" / "bin" / "foo").read_text() == "foo"
+
+
+def test_install_extracts_changed_packages_again(
+    tmp_path, extracted_deb_cache, deb_paths
+):
+    _install(extracted_deb_cache, deb_paths, tmp_path / "first")
+    (cached_path,) = (tmp_path / "cache").glob("v1/*/tree/usr/bin/foo")
+    with cached_path.open("a") as foo_file:
+        foo_file.write("changed")
+
+    with mock.patch.object(
+        _debfile, "extract_debs", wraps=_debfile.extract_debs
+    ) as extract_mock:
+        _install(extracted_deb_cache, deb_paths, tmp_path / "second")
+
+    extract_mock.assert_called_once_with([deb_paths[0]], mock.ANY, workers=1)
+    assert (tmp_path / "second" / "usr" / "bin" / "foo").read_text() == "foo"
+
+
+def test_install_corrupted_package(tmp_path, extracted_deb_cache):
+    deb_path = tmp_path / "corrupted.deb"
+    deb_path.write_text("not a deb")
+
+    with pytest.raises(errors.UnpackError):
+        _install(extracted_deb_cache, [deb_path], tmp_path / "install")
+
+    assert os.listdir(str(tmp_path / "cache" / "v1")) == []
@@ -0,0 +1,131 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tarfile
+
+import pytest
+
+from snapcraft.internal.repo import _debfile, errors
+
+from . import make_deb, make_tar_member
+
+
+@pytest.fixture
+def members():
+    return [
+        make_tar_member("./", type=tarfile.DIRTYPE, mode=0o755),
+        make_tar_member("./usr/", type=tarfile.DIRTYPE, mode=0o755),
+        make_tar_member("./usr/bin/", type=tarfile.DIRTYPE, mode=0o755),
+        make_tar_member("./usr/bin/foo", data=b"foo", mode=0o755),
+        make_tar_member("./usr/bin/bar", type=tarfile.SYMTYPE, linkname="foo"),
+        make_tar_member(
+            "./usr/bin/baz", type=tarfile.LNKTYPE, linkname="./usr/bin/foo"
+        ),
+    ]
+
+
+@pytest.mark.parametrize("compression", ["", "gz", "xz", "bz2"])
+def test_deb_file(tmp_path, members, compression):
+    deb_file = _debfile.DebFile(
+        make_deb(tmp_path / "foo.deb", "foo", "1.0", members, compression)
+    )
+
+    assert deb_file.get_name_version() == "foo=1.0"
+    with deb_file.open_data() as data_tar:
+        assert [m.name for m in data_tar] == [
+            ".",
+            "./usr",
+            "./usr/bin",
+            "./usr/bin/foo",
+            "./usr/bin/bar",
+            "./usr/bin/baz",
+        ]
+
+
+def test_deb_file_not_a_deb(tmp_path):
+    (tmp_path / "foo.deb").write_text("not a deb")
+
+    with pytest.raises(errors.UnpackError):
+        _debfile.DebFile(tmp_path / "foo.deb")
+
+
+def test_extract_debs(tmp_path, members):
+    deb_path = make_deb(tmp_path / "foo.deb", "foo", "1.0", members)
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+
+    origins = _debfile.extract_debs([deb_path], str(install_dir), workers=2)
+
+    foo_path = install_dir / "usr" / "bin" / "foo"
+    assert foo_path.read_bytes() == b"foo"
+    assert foo_path.stat().st_mode & 0o7777 == 0o755
+    assert foo_path.stat().st_nlink == 2
+    assert os.readlink(str(install_dir / "usr" / "bin" / "bar")) == "foo"
+    assert (install_dir / "usr" / "bin").stat().st_mtime == 1000000000
+    assert origins == {
+        str(install_dir / "usr" / "bin" / name): "foo=1.0"
+        for name in ["foo", "bar", "baz"]
+    }
+    assert sorted(os.listdir(str(install_dir / "usr" / "bin"))) == [
+        "bar",
+        "baz",
+        "foo",
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_extract_debs_last_package_wins(tmp_path, workers):
+    deb_paths = [
+        make_deb(
+            tmp_path / "package{}.deb".format(index),
+            "package{}".format(index),
+            "1.0",
+            [make_tar_member("./shared", data="package{}".format(index).encode())],
+        )
+        for index in range(8)
+    ]
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+
+    origins = _debfile.extract_debs(deb_paths, str(install_dir), workers=workers)
+
+    assert (install_dir / "shared").read_text() == "package7"
+    assert origins == {str(install_dir / "shared"): "package7=1.0"}
+
+
+def test_extract_debs_outside_of_install_dir(tmp_path):
+    deb_path = make_deb(
+        tmp_path / "foo.deb", "foo", "1.0", [make_tar_member("../escape", data=b"foo")]
+    )
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+
+    with pytest.raises(errors.UnpackError):
+        _debfile.extract_debs([deb_path], str(install_dir), workers=1)
+
+    assert not (tmp_path / "escape").exists()
+
+
+def test_extract_debs_corrupted_data(tmp_path, members):
+    deb_path = make_deb(tmp_path / "foo.deb", "foo", "1.0", members)
+    contents = deb_path.read_bytes()
+    deb_path.write_bytes(contents[: len(contents) - 100])
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+
+    with pytest.raises(errors.UnpackError):
+        _debfile.extract_debs([deb_path], str(install_dir), workers=1)
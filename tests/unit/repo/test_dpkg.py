@@ -0,0 +1,153 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import textwrap
+
+import pytest
+
+from snapcraft.internal.repo import _dpkg, errors
+
+
+@pytest.fixture
+def admin_dir(tmp_path):
+    admin_dir = tmp_path / "dpkg"
+    (admin_dir / "info").mkdir(parents=True)
+    (admin_dir / "status").write_text(
+        textwrap.dedent(
+            """\
+            Package: dpkg
+            Status: install ok installed
+            Architecture: amd64
+            Version: 1.19.7ubuntu3
+            Description: Debian package management system
+             This package provides the low-level infrastructure.
+
+            Package: libc6
+            Status: install ok installed
+            Architecture: amd64
+            Multi-Arch: same
+            Version: 2.31-0ubuntu9.2
+
+            Package: libc6
+            Status: install ok installed
+            Architecture: i386
+            Multi-Arch: same
+            Version: 2.31-0ubuntu9.2
+
+            Package: bash
+            Status: install ok installed
+            Architecture: amd64
+            Version: 5.0-6ubuntu1.1
+
+            Package: tzdata
+            Status: install ok installed
+            Architecture: all
+            Version: 2021a-0ubuntu0.20.04
+
+            Package: removed
+            Status: deinstall ok config-files
+            Architecture: amd64
+            Version: 1.0
+            """
+        )
+    )
+    (admin_dir / "info" / "dpkg.list").write_text("/.\n/usr\n/usr/bin\n")
+    (admin_dir / "info" / "bash.list").write_text("/.\n/bin\n/bin/bash\n/usr\n")
+    (admin_dir / "info" / "libc6:amd64.list").write_text(
+        "/.\n/lib\n{}\n{}\n".format(tmp_path / "lib" / "libc.so.6", tmp_path / "bin")
+    )
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "libc.so.6").touch()
+    return admin_dir
+
+
+def test_get_package_for_file(admin_dir):
+    dpkg_database = _dpkg.DpkgDatabase(str(admin_dir))
+
+    assert dpkg_database.get_package_for_file("/bin/bash") == "bash"
+    assert dpkg_database.get_package_for_file("bin/bash") == "bash"
+    assert dpkg_database.get_package_for_file("/usr") == "bash, dpkg"
+    with pytest.raises(errors.FileProviderNotFound):
+        dpkg_database.get_package_for_file("/bin/not-found")
+
+
+def test_get_package_libraries(tmp_path, admin_dir):
+    dpkg_database = _dpkg.DpkgDatabase(str(admin_dir))
+
+    assert dpkg_database.get_package_libraries("libc6") == {
+        str(tmp_path / "lib" / "libc.so.6")
+    }
+    with pytest.raises(errors.PackageNotFoundError):
+        dpkg_database.get_package_libraries("not-installed")
+
+
+def test_get_installed_packages(admin_dir):
+    dpkg_database = _dpkg.DpkgDatabase(str(admin_dir))
+
+    assert dpkg_database.get_installed_packages() == {
+        "dpkg": "1.19.7ubuntu3",
+        "libc6": "2.31-0ubuntu9.2",
+        "libc6:i386": "2.31-0ubuntu9.2",
+        "bash": "5.0-6ubuntu1.1",
+        "tzdata": "2021a-0ubuntu0.20.04",
+    }
+
+
+def test_index_rebuilt_when_status_changes(admin_dir):
+    dpkg_database = _dpkg.DpkgDatabase(str(admin_dir))
+    assert dpkg_database.get_package_for_file("/bin/bash") == "bash"
+
+    (admin_dir / "info" / "bash.list").unlink()
+    # The index is kept until dpkg changes its status.
+    assert dpkg_database.get_package_for_file("/bin/bash") == "bash"
+
+    with (admin_dir / "status").open("a") as status_file:
+        status_file.write("\n")
+    with pytest.raises(errors.FileProviderNotFound):
+        dpkg_database.get_package_for_file("/bin/bash")
+
+
+def test_no_database(tmp_path):
+    dpkg_database = _dpkg.DpkgDatabase(str(tmp_path / "missing"))
+
+    assert dpkg_database.get_installed_packages() == dict()
+    with pytest.raises(errors.FileProviderNotFound):
+        dpkg_database.get_package_for_file("/bin/bash")
+
+
+def test_read_dpkg_list(tmp_path):
+    dpkg_list_path = tmp_path / "dpkg.list"
+    dpkg_list_path.write_text(
+        textwrap.dedent(
+            """\
+            Desired=Unknown/Install/Remove/Purge/Hold
+            ||/ Name    Version      Architecture Description
+            +++-=======-============-============-=====================
+            ii  adduser 3.118ubuntu2 all          add and remove users
+            rc  removed 1.0          amd64        removed package
+            """
+        )
+    )
+
+    assert _dpkg.read_dpkg_list(str(dpkg_list_path)) == ["adduser"]
+
+    dpkg_list_path.write_text("ii  apt 2.0.2 amd64 commandline package manager\n")
+    os.utime(str(dpkg_list_path), ns=(0, 0))
+    assert _dpkg.read_dpkg_list(str(dpkg_list_path)) == ["apt"]
+
+    with pytest.raises(FileNotFoundError):
+        _dpkg.read_dpkg_list(str(tmp_path / "missing"))
@@ -0,0 +1,129 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import os
+from unittest import mock
+
+import pytest
+
+from snapcraft.internal.repo import _normalize
+
+
+class _RecordingFixer(_normalize.Fixer):
+    name = "recording"
+
+    def __init__(self):
+        self.visited = collections.Counter()
+
+    def fix(self, entry):
+        self.visited[entry.path] += 1
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "root"
+    (root / "usr" / "lib").mkdir(parents=True)
+    for index in range(300):
+        (root / "usr" / "lib" / "file{}".format(index)).touch()
+    (root / "usr" / "bin").mkdir()
+    (root / "usr" / "bin" / "foo").touch()
+    (root / "usr" / "bin" / "link").symlink_to("foo")
+    (root / "lib").symlink_to("usr/lib")
+    return root
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_normalize_tree_visits_entries_once(tree, workers):
+    fixer = _RecordingFixer()
+
+    timings = _normalize.normalize_tree(str(tree), [fixer], workers=workers)
+
+    expected = [
+        os.path.join(directory, name)
+        for directory, directories, files in os.walk(str(tree))
+        for name in directories + files
+    ]
+    assert sorted(fixer.visited) == sorted(expected)
+    assert set(fixer.visited.values()) == {1}
+    assert list(timings) == ["recording"]
+
+
+def test_normalize_tree_applies_fixers_in_order(tree):
+    calls = []
+
+    class Fixer(_normalize.Fixer):
+        def __init__(self, name):
+            self.name = name
+
+        def fix(self, entry):
+            if entry.name == "foo":
+                calls.append(self.name)
+
+    timings = _normalize.normalize_tree(
+        str(tree), [Fixer("first"), Fixer("second")], workers=2
+    )
+
+    assert calls == ["first", "second"]
+    assert list(timings) == ["first", "second"]
+
+
+def test_normalize_tree_raises_fixer_errors(tree):
+    class Fixer(_normalize.Fixer):
+        name = "failing"
+
+        def fix(self, entry):
+            if entry.name == "file42":
+                raise OSError("failed")
+
+    with pytest.raises(OSError):
+        _normalize.normalize_tree(str(tree), [Fixer()], workers=2)
+
+
+def test_origin_fixer(tree):
+    foo_path = str(tree / "usr" / "bin" / "foo")
+    link_path = str(tree / "usr" / "bin" / "link")
+    fixer = _normalize.OriginFixer({foo_path: "foo=1.0", link_path: "foo=1.0"})
+
+    with mock.patch(
+        "snapcraft.internal.xattrs.write_origin_stage_package"
+    ) as write_mock:
+        _normalize.normalize_tree(str(tree), [fixer], workers=2)
+
+    write_mock.assert_called_once_with(foo_path, "foo=1.0")
+
+
+def test_file_mode_fixer_sgid_directory(tree):
+    directory = tree / "usr" / "share"
+    (directory / "doc").mkdir(parents=True)
+    directory.chmod(0o2775)
+
+    _normalize.normalize_tree(str(tree), [_normalize.FileModeFixer()], workers=2)
+
+    assert directory.stat().st_mode & 0o7777 == 0o0775
+    assert (directory / "doc").is_dir()
+
+
+def test_file_mode_fixer_breaks_hard_links(tree):
+    foo_path = tree / "usr" / "bin" / "foo"
+    link_path = tree.parent / "foo-link"
+    os.link(str(foo_path), str(link_path))
+    foo_path.chmod(0o4755)
+
+    _normalize.normalize_tree(str(tree), [_normalize.FileModeFixer()], workers=2)
+
+    assert foo_path.stat().st_mode & 0o7777 == 0o0755
+    assert link_path.stat().st_mode & 0o7777 == 0o4755
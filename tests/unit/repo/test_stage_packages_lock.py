@@ -0,0 +1,103 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+import pytest
+
+from snapcraft.internal.repo import _stage_packages_lock
+
+
+def _get_lock(lock_path, **kwargs):
+    key = dict(
+        sources_digest="digest",
+        target_arch="amd64",
+        filtered_names={"libc6", "libssl1.1"},
+        package_names=["foo", "bar"],
+    )
+    key.update(kwargs)
+    return _stage_packages_lock.StagePackagesLock(lock_path, **key)
+
+
+@pytest.fixture
+def fetched_packages(tmp_path):
+    download_path = tmp_path / "download"
+    download_path.mkdir()
+    (download_path / "foo_1.0_all.deb").write_text("foo")
+    (download_path / "libfoo_2.0_amd64.deb").write_text("libfoo")
+    return [
+        ("foo", "1.0", download_path / "foo_1.0_all.deb"),
+        ("libfoo", "2.0", download_path / "libfoo_2.0_amd64.deb"),
+    ]
+
+
+def test_get_fetched_packages(tmp_path, fetched_packages):
+    lock_path = tmp_path / "stage-packages.lock"
+    _get_lock(lock_path).write(fetched_packages)
+
+    lock = _get_lock(lock_path, package_names=["bar", "foo"])
+
+    assert lock.get_fetched_packages(tmp_path / "download") == fetched_packages
+    assert json.loads(lock_path.read_text())["packages"][0] == {
+        "name": "foo",
+        "version": "1.0",
+        "filename": "foo_1.0_all.deb",
+        "sha256": "2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae",
+    }
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        dict(sources_digest="other-digest"),
+        dict(target_arch="arm64"),
+        dict(filtered_names={"libc6"}),
+        dict(package_names=["foo"]),
+    ],
+)
+def test_get_fetched_packages_other_key(tmp_path, fetched_packages, key):
+    lock_path = tmp_path / "stage-packages.lock"
+    _get_lock(lock_path).write(fetched_packages)
+
+    lock = _get_lock(lock_path, **key)
+
+    assert lock.get_fetched_packages(tmp_path / "download") is None
+
+
+def test_get_fetched_packages_changed_package(tmp_path, fetched_packages):
+    lock_path = tmp_path / "stage-packages.lock"
+    lock = _get_lock(lock_path)
+    lock.write(fetched_packages)
+
+    fetched_packages[1][2].write_text("changed")
+
+    assert lock.get_fetched_packages(tmp_path / "download") is None
+
+
+def test_get_fetched_packages_missing_package(tmp_path, fetched_packages):
+    lock_path = tmp_path / "stage-packages.lock"
+    lock = _get_lock(lock_path)
+    lock.write(fetched_packages)
+
+    fetched_packages[1][2].unlink()
+
+    assert lock.get_fetched_packages(tmp_path / "download") is None
+
+
+def test_get_fetched_packages_no_lock(tmp_path):
+    lock = _get_lock(tmp_path / "stage-packages.lock")
+
+    assert lock.get_fetched_packages(tmp_path / "download") is None
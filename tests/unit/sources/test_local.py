@@ -21,6 +21,7 @@ from unittest import mock
 
 from testtools.matchers import DirExists, Equals, FileContains, FileExists, Not
 
+from snapcraft import file_utils
 from snapcraft.internal import common, errors, sources
 from tests import unit
 
@@ -386,3 +387,68 @@ class TestLocalUpdateSnapcraftYaml:
         os.utime(snapcraft_source_path, (access_time, modify_time + 1))
 
         assert not local.check("reference")
+
+
+class TestLocalUpdateDirState(unit.TestCase):
+    """Verify that the local source only reports files with new contents."""
+
+    def setUp(self):
+        super().setUp()
+
+        os.makedirs(os.path.join("source", "dir"))
+        with open(os.path.join("source", "dir", "file"), "w") as f:
+            f.write("1")
+
+        open("reference", "w").close()
+        self.local = sources.Local(
+            "source", "destination", copy_function=file_utils.copy
+        )
+        self.local.pull()
+
+    def touch(self, path):
+        modify_time = os.stat("reference").st_mtime + 10
+        os.utime(path, (modify_time, modify_time))
+
+    def test_file_touched(self):
+        self.touch(os.path.join("source", "dir", "file"))
+        self.touch(os.path.join("source", "dir"))
+
+        self.assertFalse(self.local.check("reference"))
+
+    def test_file_touched_and_copy_replaced(self):
+        os.remove(os.path.join("destination", "dir", "file"))
+        with open(os.path.join("destination", "dir", "file"), "w") as f:
+            f.write("2")
+        self.touch(os.path.join("source", "dir", "file"))
+
+        self.assertTrue(self.local.check("reference"))
+
+        self.local.update()
+        self.assertThat(os.path.join("destination", "dir", "file"), FileContains("1"))
+
+    def test_file_modified(self):
+        with open(os.path.join("source", "dir", "file"), "w") as f:
+            f.write("2")
+        self.touch(os.path.join("source", "dir", "file"))
+
+        self.assertTrue(self.local.check("reference"))
+
+        self.local.update()
+        self.assertThat(os.path.join("destination", "dir", "file"), FileContains("2"))
+        self.assertFalse(self.local.check("reference"))
+
+    def test_directory_added(self):
+        os.mkdir(os.path.join("source", "new-dir"))
+        open(os.path.join("source", "new-dir", "file"), "w").close()
+
+        self.assertTrue(self.local.check("reference"))
+
+        self.local.update()
+        self.assertThat(os.path.join("destination", "new-dir", "file"), FileExists())
+        self.assertFalse(self.local.check("reference"))
+
+    def test_without_dirstate_timestamps_are_compared(self):
+        os.remove(os.path.join(self.path, ".destination.dirstate"))
+        self.touch(os.path.join("source", "dir", "file"))
+
+        self.assertTrue(self.local.check("reference"))
@@ -0,0 +1,121 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import time
+from unittest import mock
+
+import pytest
+
+from snapcraft import yaml_utils
+from snapcraft.internal import states, steps
+
+
+@pytest.fixture
+def state_dir(tmp_path):
+    state_dir = tmp_path / "parts" / "part1" / "state"
+    state_dir.mkdir(parents=True)
+    return str(state_dir)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return states.StateIndex(str(tmp_path / "parts"))
+
+
+def _write_state(state_dir, step, state, *, age=60):
+    state_file = states.get_step_state_file(state_dir, step)
+    with open(state_file, "w") as f:
+        f.write(yaml_utils.dump(state))
+
+    timestamp = time.time() - age
+    os.utime(state_file, (timestamp, timestamp))
+
+
+@pytest.mark.parametrize(
+    "step,fixture",
+    [
+        (steps.PULL, "pull_state"),
+        (steps.BUILD, "build_state"),
+        (steps.STAGE, "stage_state"),
+        (steps.PRIME, "prime_state"),
+    ],
+)
+def test_get_state_from_index(request, index, state_dir, step, fixture):
+    state = request.getfixturevalue(fixture)
+    _write_state(state_dir, step, state)
+
+    expected_state = states.get_state(state_dir, step)
+    assert index.get_state(state_dir, step) == expected_state
+
+    with mock.patch("snapcraft.yaml_utils.load") as load_mock:
+        assert index.get_state(state_dir, step) == expected_state
+    load_mock.assert_not_called()
+
+
+def test_get_state_not_run(index, state_dir):
+    assert index.get_state(state_dir, steps.PULL) is None
+
+
+def test_get_state_changed_file(index, state_dir, pull_state):
+    _write_state(state_dir, steps.PULL, pull_state)
+    index.get_state(state_dir, steps.PULL)
+
+    pull_state.assets["stage-packages"] = ["new-package"]
+    _write_state(state_dir, steps.PULL, pull_state, age=30)
+
+    assert index.get_state(state_dir, steps.PULL) == states.get_state(
+        state_dir, steps.PULL
+    )
+
+
+def test_get_state_recent_file_not_indexed(index, state_dir, pull_state):
+    _write_state(state_dir, steps.PULL, pull_state, age=0)
+    index.get_state(state_dir, steps.PULL)
+
+    with mock.patch("snapcraft.yaml_utils.load", wraps=yaml_utils.load) as load_mock:
+        assert index.get_state(state_dir, steps.PULL) == pull_state
+    load_mock.assert_called_once_with(mock.ANY)
+
+
+def test_forget(index, state_dir, pull_state):
+    _write_state(state_dir, steps.PULL, pull_state)
+    index.get_state(state_dir, steps.PULL)
+
+    os.remove(states.get_step_state_file(state_dir, steps.PULL))
+    index.forget(state_dir, steps.PULL)
+
+    assert index.get_state(state_dir, steps.PULL) is None
+
+
+def test_parts_dir_recreated(tmp_path, index, state_dir, pull_state):
+    _write_state(state_dir, steps.PULL, pull_state)
+    index.get_state(state_dir, steps.PULL)
+
+    shutil.rmtree(tmp_path / "parts")
+    assert index.get_state(state_dir, steps.PULL) is None
+
+    os.makedirs(state_dir)
+    _write_state(state_dir, steps.PULL, pull_state)
+    assert index.get_state(state_dir, steps.PULL) == pull_state
+    assert (tmp_path / "parts" / "state.db").exists()
+
+
+def test_get_state_index_is_shared(tmp_path):
+    assert states.get_state_index(str(tmp_path)) is states.get_state_index(
+        os.path.join(str(tmp_path), "parts", "..")
+    )
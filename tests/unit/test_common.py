@@ -38,6 +38,64 @@ def test_isurl():
     assert common.isurl("/foo:o") is False
 
 
+def test_get_parallel_parts_count_default(monkeypatch):
+    monkeypatch.delenv("SNAPCRAFT_PARALLEL_PARTS", raising=False)
+
+    assert common.get_parallel_parts_count() == 1
+
+
+def test_get_parallel_parts_count(monkeypatch):
+    monkeypatch.setenv("SNAPCRAFT_PARALLEL_PARTS", "4")
+
+    assert common.get_parallel_parts_count() == 4
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "many"])
+def test_get_parallel_parts_count_invalid(monkeypatch, value):
+    monkeypatch.setenv("SNAPCRAFT_PARALLEL_PARTS", value)
+
+    with pytest.raises(errors.SnapcraftEnvironmentError):
+        common.get_parallel_parts_count()
+
+
+def test_get_elf_workers_count_default(monkeypatch):
+    monkeypatch.delenv("SNAPCRAFT_ELF_WORKERS", raising=False)
+
+    assert common.get_elf_workers_count() == (os.cpu_count() or 1)
+
+
+def test_get_elf_workers_count(monkeypatch):
+    monkeypatch.setenv("SNAPCRAFT_ELF_WORKERS", "3")
+
+    assert common.get_elf_workers_count() == 3
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "many"])
+def test_get_elf_workers_count_invalid(monkeypatch, value):
+    monkeypatch.setenv("SNAPCRAFT_ELF_WORKERS", value)
+
+    with pytest.raises(errors.SnapcraftEnvironmentError):
+        common.get_elf_workers_count()
+
+
+def test_get_file_workers_count(monkeypatch):
+    monkeypatch.delenv("SNAPCRAFT_FILE_WORKERS", raising=False)
+    assert common.get_file_workers_count() == (os.cpu_count() or 1)
+
+    monkeypatch.setenv("SNAPCRAFT_FILE_WORKERS", "2")
+    assert common.get_file_workers_count() == 2
+
+
+@pytest.mark.parametrize("value,enabled", [(None, False), ("n", False), ("y", True)])
+def test_is_elf_ldd_verification_enabled(monkeypatch, value, enabled):
+    if value is None:
+        monkeypatch.delenv("SNAPCRAFT_ELF_VERIFY_LDD", raising=False)
+    else:
+        monkeypatch.setenv("SNAPCRAFT_ELF_VERIFY_LDD", value)
+
+    assert common.is_elf_ldd_verification_enabled() is enabled
+
+
 class CommonMigratedTestCase(unit.TestCase):
     def test_parallel_build_count_migration_message(self):
         raised = self.assertRaises(
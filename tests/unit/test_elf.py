@@ -16,8 +16,10 @@
 
 import logging
 import os
+import shutil
 import sys
 import tempfile
+import time
 from unittest import mock
 
 import fixtures
@@ -123,6 +125,12 @@ class TestInvalidElf(unit.TestCase):
 
 
 class TestMissingLibraries(TestElfBase):
+    def setUp(self):
+        super().setUp()
+
+        # The fake ELF files cannot be resolved, leave it to the fake ldd.
+        self.useFixture(fixtures.EnvironmentVariable("SNAPCRAFT_ELF_VERIFY_LDD", "y"))
+
     def test_get_libraries_missing_libs(self):
         elf_file = self.fake_elf["fake_elf-with-missing-libs"]
         libs = elf_file.load_dependencies(
@@ -143,6 +151,8 @@ class TestGetLibraries(TestElfBase):
         super().setUp()
 
         self.useFixture(fixtures.MockPatch("os.path.exists", return_value=True))
+        # The fake ELF files cannot be resolved, leave it to the fake ldd.
+        self.useFixture(fixtures.EnvironmentVariable("SNAPCRAFT_ELF_VERIFY_LDD", "y"))
 
     def test_get_libraries(self):
         elf_file = self.fake_elf["fake_elf-2.23"]
@@ -273,6 +283,67 @@ class TestGetLibraries(TestElfBase):
         self.assertThat(libs, Equals({self.fake_elf.root_libraries["moo.so.2"]}))
 
 
+class TestLoadDependencies(TestElfBase):
+    def test_load_dependencies(self):
+        self.useFixture(fixtures.MockPatch("os.path.exists", return_value=True))
+        self.useFixture(fixtures.EnvironmentVariable("SNAPCRAFT_ELF_VERIFY_LDD", "y"))
+        elf_files = [
+            self.fake_elf["fake_elf-with-missing-libs"],
+            self.fake_elf["fake_elf-2.23"],
+        ]
+
+        for workers in (1, 2):
+            libs = elf.load_dependencies(
+                elf_files,
+                root_path=self.fake_elf.root_path,
+                core_base_path=self.fake_elf.core_base_path,
+                content_dirs=self.content_dirs,
+                arch_triplet=self.arch_triplet,
+                soname_cache=elf.SonameCache(),
+                workers=workers,
+            )
+
+            self.assertThat(
+                libs,
+                Equals(
+                    {
+                        self.fake_elf.root_libraries["foo.so.1"],
+                        "/usr/lib/bar.so.2",
+                        "missing.so.2",
+                    }
+                ),
+            )
+
+    def test_load_dependencies_ordered_by_path(self):
+        load_dependencies_mock = self.useFixture(
+            fixtures.MockPatch(
+                "snapcraft.internal.elf.ElfFile.load_dependencies",
+                autospec=True,
+                return_value=set(),
+            )
+        ).mock
+        elf_files = [
+            self.fake_elf["fake_elf-2.26"],
+            self.fake_elf["fake_elf-1.1"],
+            self.fake_elf["fake_elf-2.23"],
+        ]
+
+        elf.load_dependencies(
+            elf_files,
+            root_path=self.fake_elf.root_path,
+            core_base_path=self.fake_elf.core_base_path,
+            content_dirs=self.content_dirs,
+            arch_triplet=self.arch_triplet,
+            soname_cache=elf.SonameCache(),
+            workers=2,
+        )
+
+        self.assertThat(
+            [c[0][0] for c in load_dependencies_mock.call_args_list],
+            Equals(sorted(elf_files, key=lambda e: e.path)),
+        )
+
+
 class TestLibrary(TestElfBase):
     def test_is_valid_elf_ignores_corrupt_files(self):
         soname = "libssl.so.1.0.0"
@@ -358,6 +429,41 @@ class TestGetElfFiles(TestElfBase):
         self.assertThat(elf_files, Equals(set()))
 
 
+def test_get_elf_files_with_workers(xdg_dirs, tmp_path):
+    shutil.copy(sys.executable, str(tmp_path / "python"))
+    file_list = {"python"}
+    for i in range(elf._ELF_PROCESSES_THRESHOLD * 2):
+        os.link(str(tmp_path / "python"), str(tmp_path / f"python-{i}"))
+        file_list.add(f"python-{i}")
+
+    elf_files = elf.get_elf_files(str(tmp_path), file_list, workers=2)
+
+    assert sorted(e.path for e in elf_files) == sorted(
+        str(tmp_path / f) for f in file_list
+    )
+    for elf_file in elf_files:
+        assert elf_file.needed.keys() == elf.ElfFile(path=sys.executable).needed.keys()
+
+
+def test_get_elf_files_reuses_cached_attributes(xdg_dirs, tmp_path):
+    shutil.copy(sys.executable, str(tmp_path / "python"))
+    timestamp = time.time() - 60
+    os.utime(str(tmp_path / "python"), (timestamp, timestamp))
+
+    with mock.patch(
+        "snapcraft.internal.elf._reader.read_attributes",
+        wraps=elf._reader.read_attributes,
+    ) as read_mock:
+        elf_files = elf.get_elf_files(str(tmp_path), {"python"})
+        cached_elf_files = elf.get_elf_files(str(tmp_path), {"python"})
+
+    read_mock.assert_called_once_with(str(tmp_path / "python"))
+    (elf_file,) = elf_files
+    (cached_elf_file,) = cached_elf_files
+    assert cached_elf_file.needed.keys() == elf_file.needed.keys()
+    assert cached_elf_file.arch == elf_file.arch
+
+
 class TestGetRequiredGLIBC(TestElfBase):
     def setUp(self):
         super().setUp()
@@ -429,6 +535,54 @@ class TestPatcher(TestElfBase):
         elf_patcher = elf.Patcher(dynamic_linker="/lib/fake-ld", root_path="/fake")
         elf_patcher.patch(elf_file=elf_file)
 
+    def test_patch_skips_already_patched(self):
+        elf_file = self.fake_elf["fake_elf-2.23"]
+        elf_patcher = elf.Patcher(dynamic_linker="/lib/fake-ld", root_path="/fake")
+
+        self.assertThat(elf_patcher.patch(elf_file=elf_file), Equals(True))
+        self.assertThat(elf_file.interp, Equals("/lib/fake-ld"))
+        self.assertThat(elf_patcher.patch(elf_file=elf_file), Equals(False))
+
+    def test_get_patchelf_calls(self):
+        elf_file = self.fake_elf["fake_elf-2.23"]
+        elf_file.dependencies = {
+            mock.Mock(
+                path=os.path.join(self.fake_elf.root_path, "lib", "foo.so.1"),
+                in_base_snap=False,
+            )
+        }
+        elf_patcher = elf.Patcher(
+            dynamic_linker="/lib/fake-ld", root_path=self.fake_elf.root_path
+        )
+
+        self.assertThat(
+            elf_patcher.get_patchelf_calls(elf_file=elf_file),
+            Equals(
+                [
+                    [
+                        "--set-interpreter",
+                        "/lib/fake-ld",
+                        "--force-rpath",
+                        "--set-rpath",
+                        "$ORIGIN/lib",
+                    ]
+                ]
+            ),
+        )
+
+        elf_file.interp = "/lib/fake-ld"
+        elf_file.runpath = "/usr/lib"
+        self.assertThat(
+            elf_patcher.get_patchelf_calls(elf_file=elf_file),
+            Equals(
+                [["--remove-rpath"], ["--force-rpath", "--set-rpath", "$ORIGIN/lib"]]
+            ),
+        )
+
+        elf_file.rpath = "$ORIGIN/lib"
+        elf_file.runpath = ""
+        self.assertThat(elf_patcher.get_patchelf_calls(elf_file=elf_file), Equals([]))
+
 
 class TestPatcherErrors(TestElfBase):
     def test_patch_fails_raises_patcherror_exception(self):
@@ -684,3 +838,80 @@ def test_ld_trace_os_error_for_wrong_arch(monkeypatch, fake_process, tmp_path):
     libraries = elf._determine_libraries(path="/bin/foo", ld_library_paths=[])
 
     assert libraries == {}
+
+
+def test_find_libraries_same_as_ldd(xdg_dirs):
+    elf_file = elf.ElfFile(path=sys.executable)
+
+    (libraries,) = elf._find_libraries(
+        [elf_file], ld_library_paths=[], arch_triplet=ProjectOptions().arch_triplet
+    )
+
+    assert libraries == elf._determine_libraries(
+        path=sys.executable, ld_library_paths=[]
+    )
+
+
+def test_find_libraries_verified_with_ldd(xdg_dirs, monkeypatch, caplog):
+    monkeypatch.setenv("SNAPCRAFT_ELF_VERIFY_LDD", "y")
+    monkeypatch.setattr(
+        elf,
+        "_determine_libraries",
+        lambda path, ld_library_paths: {"libfoo.so.1": "/lib/libfoo.so.1"},
+    )
+    elf_file = elf.ElfFile(path=sys.executable)
+
+    (libraries,) = elf._find_libraries(
+        [elf_file], ld_library_paths=[], arch_triplet=ProjectOptions().arch_triplet
+    )
+
+    assert libraries == {"libfoo.so.1": "/lib/libfoo.so.1"}
+    assert (
+        "Libraries found for {!r} differ from ldd".format(sys.executable) in caplog.text
+    )
+    assert "libfoo.so.1: None instead of '/lib/libfoo.so.1'" in caplog.text
+
+
+@pytest.fixture
+def fake_snap(tmp_path, monkeypatch):
+    """Install a fake core20 snap, with an ELF file as libfoo.so.1."""
+    monkeypatch.setattr(elf, "_SNAP_MOUNT_DIR", str(tmp_path / "snap"))
+    monkeypatch.setattr(elf, "_soname_indexes", dict())
+
+    revision_path = tmp_path / "snap" / "core20" / "1234"
+    (revision_path / "lib").mkdir(parents=True)
+    shutil.copy(sys.executable, str(revision_path / "lib" / "libfoo.so.1"))
+    (tmp_path / "snap" / "core20" / "current").symlink_to("1234")
+    return tmp_path / "snap" / "core20" / "current"
+
+
+def test_get_snap_revision(fake_snap):
+    assert elf._get_snap_revision(str(fake_snap)) == ("core20", "1234", "")
+    assert elf._get_snap_revision(str(fake_snap / "lib")) == ("core20", "1234", "lib")
+    assert elf._get_snap_revision(str(fake_snap.parent / "1234")) is None
+    assert elf._get_snap_revision(str(fake_snap.parent.parent)) is None
+    assert elf._get_snap_revision("/usr/lib") is None
+
+
+def test_library_found_in_soname_index(xdg_dirs, fake_snap, monkeypatch):
+    arch = elf.ElfFile(path=sys.executable).arch
+
+    def find_library():
+        return elf.Library(
+            soname="libfoo.so.1",
+            soname_path="libfoo.so.1",
+            search_paths=[str(fake_snap)],
+            core_base_path=str(fake_snap),
+            arch=arch,
+            soname_cache=elf.SonameCache(),
+        )
+
+    library = find_library()
+
+    assert library.path == str(fake_snap / "lib" / "libfoo.so.1")
+    assert library.in_base_snap is True
+
+    # The index is kept for the next runs.
+    monkeypatch.setattr(elf, "_soname_indexes", dict())
+    with mock.patch("os.walk", side_effect=AssertionError("walked")):
+        assert find_library().path == library.path
@@ -178,6 +178,38 @@ class TestErrorFormatting:
                 ),
             },
         ),
+        (
+            "SnapcraftPartConflictsError",
+            {
+                "exception_class": errors.SnapcraftPartConflictsError,
+                "kwargs": {
+                    "conflicts": [
+                        ("part1", "part2", ("test-file2", "test-file1")),
+                        ("part1", "part3", ("test-file3",)),
+                    ]
+                },
+                "expected_message": (
+                    "Failed to stage: "
+                    "The following parts have files in common, but with "
+                    "different contents:\n"
+                    "Parts 'part1' and 'part2':\n"
+                    "    test-file1\n"
+                    "    test-file2\n"
+                    "Parts 'part1' and 'part3':\n"
+                    "    test-file3\n"
+                    "\n"
+                    "Snapcraft offers some capabilities to solve this by use of "
+                    "the following keywords:\n"
+                    "    - `filesets`\n"
+                    "    - `stage`\n"
+                    "    - `snap`\n"
+                    "    - `organize`\n"
+                    "\n"
+                    "To learn more about these part keywords, run "
+                    "`snapcraft help plugins`."
+                ),
+            },
+        ),
         (
             "InvalidWikiEntryError",
             {
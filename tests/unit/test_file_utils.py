@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import errno
 import os
 import pathlib
 import re
@@ -135,6 +136,68 @@ class TestLinkOrCopyTree(unit.TestCase):
         # Verify that the symlink remains a symlink
         self.assertThat(os.path.join("qux", "bar-link"), unit.LinkExists("bar"))
 
+    def test_link_hard_links_files(self):
+        file_utils.link_or_copy_tree("foo", "qux")
+
+        self.assertTrue(
+            os.path.samefile(
+                os.path.join("foo", "bar", "3"), os.path.join("qux", "bar", "3")
+            )
+        )
+
+    def test_link_ignore(self):
+        os.symlink("bar", os.path.join("foo", "bar-link"))
+        ignore = mock.Mock(return_value=["baz", "3"])
+
+        file_utils.link_or_copy_tree("foo", "qux", ignore=ignore)
+
+        ignore.assert_any_call("foo", ["bar", "bar-link", "2"])
+        self.assertTrue(os.path.isfile(os.path.join("qux", "2")))
+        self.assertFalse(os.path.exists(os.path.join("qux", "bar", "3")))
+        self.assertFalse(os.path.exists(os.path.join("qux", "bar", "baz")))
+
+    def test_link_into_subdirectory(self):
+        file_utils.link_or_copy_tree(".", "qux")
+
+        self.assertTrue(os.path.isfile(os.path.join("qux", "foo", "bar", "3")))
+        self.assertFalse(os.path.exists(os.path.join("qux", "qux")))
+
+    def test_link_directory_permissions(self):
+        os.chmod(os.path.join("foo", "bar"), 0o750)
+
+        file_utils.link_or_copy_tree("foo", "qux")
+
+        self.assertThat(
+            os.stat(os.path.join("qux", "bar")).st_mode & 0o777, Equals(0o750)
+        )
+
+    def test_link_many_files(self):
+        for i in range(1000):
+            open(os.path.join("foo", "bar", "many-{}".format(i)), "w").close()
+        copy_function = mock.Mock(wraps=file_utils.copy)
+
+        file_utils.link_or_copy_tree("foo", "qux", copy_function=copy_function)
+
+        self.assertThat(copy_function.call_count, Equals(1003))
+        self.assertTrue(os.path.isfile(os.path.join("qux", "bar", "many-999")))
+
+    def test_link_copy_function_errors_raised(self):
+        for i in range(1000):
+            open(os.path.join("foo", "many-{}".format(i)), "w").close()
+
+        def copy_function(source, destination):
+            if source.endswith("many-500"):
+                raise OSError("failed")
+            file_utils.copy(source, destination)
+
+        self.assertRaises(
+            OSError,
+            file_utils.link_or_copy_tree,
+            "foo",
+            "qux",
+            copy_function=copy_function,
+        )
+
 
 class TestLinkOrCopy(unit.TestCase):
     def setUp(self):
@@ -162,6 +225,126 @@ class TestLinkOrCopy(unit.TestCase):
         self.assertTrue(os.path.isfile("foo2/bar/baz/4"))
 
 
+@pytest.fixture
+def copy_methods(monkeypatch):
+    """Forget the copy methods detected by other tests."""
+    monkeypatch.setattr(file_utils, "_supported_copy_methods", dict())
+    monkeypatch.delenv("SNAPCRAFT_COPY_METHOD", raising=False)
+
+
+@pytest.mark.parametrize("method", ["copy_file_range", "sendfile", "buffered"])
+def test_copy_file_data(tmp_work_path, copy_methods, monkeypatch, method):
+    monkeypatch.setenv("SNAPCRAFT_COPY_METHOD", method)
+    contents = os.urandom(3 * 2 ** 20)
+    pathlib.Path("source").write_bytes(contents)
+
+    file_utils.copy_file_data("source", "destination")
+
+    assert pathlib.Path("destination").read_bytes() == contents
+
+
+def test_copy_file_data_falls_back(tmp_work_path, copy_methods):
+    pathlib.Path("source").write_text("contents")
+    unsupported = OSError(errno.EOPNOTSUPP, "not supported")
+
+    with mock.patch.dict(
+        file_utils._COPY_METHODS,
+        {
+            "reflink": mock.Mock(side_effect=unsupported),
+            "copy_file_range": mock.Mock(side_effect=unsupported),
+        },
+    ):
+        file_utils.copy_file_data("source", "destination")
+        file_utils.copy_file_data("source", "destination")
+
+        # Unsupported methods are only tried once.
+        file_utils._COPY_METHODS["reflink"].assert_called_once_with(mock.ANY, mock.ANY)
+
+    assert pathlib.Path("destination").read_text() == "contents"
+
+
+def test_copy_file_data_errors_are_raised(tmp_work_path, copy_methods):
+    pathlib.Path("source").write_text("contents")
+
+    with mock.patch.dict(
+        file_utils._COPY_METHODS,
+        {"reflink": mock.Mock(side_effect=OSError(errno.ENOSPC, "no space"))},
+    ):
+        with pytest.raises(OSError):
+            file_utils.copy_file_data("source", "destination")
+
+
+def test_copy_file_data_empty_files_copied_buffered(tmp_work_path, copy_methods):
+    pathlib.Path("source").touch()
+
+    with mock.patch.dict(
+        file_utils._COPY_METHODS, {"reflink": mock.Mock(), "buffered": mock.Mock()}
+    ):
+        file_utils.copy_file_data("source", "destination")
+
+        file_utils._COPY_METHODS["reflink"].assert_not_called()
+        file_utils._COPY_METHODS["buffered"].assert_called_once_with(mock.ANY, mock.ANY)
+
+
+def test_copy_file_data_invalid_method(tmp_work_path, copy_methods, monkeypatch):
+    monkeypatch.setenv("SNAPCRAFT_COPY_METHOD", "carrier-pigeon")
+    pathlib.Path("source").write_text("contents")
+
+    with pytest.raises(errors.SnapcraftEnvironmentError):
+        file_utils.copy_file_data("source", "destination")
+
+
+def test_copy_keeps_metadata(tmp_work_path, copy_methods):
+    pathlib.Path("source").write_text("contents")
+    os.chmod("source", 0o751)
+    os.utime("source", (1, 1))
+
+    file_utils.copy("source", "destination")
+
+    assert pathlib.Path("destination").read_text() == "contents"
+    assert os.stat("destination").st_mode & 0o777 == 0o751
+    assert os.stat("destination").st_mtime == 1
+
+
+def test_copy_symlink(tmp_work_path, copy_methods):
+    pathlib.Path("source").write_text("contents")
+    os.symlink("source", "link")
+
+    file_utils.copy("link", "destination")
+
+    assert os.readlink("destination") == "source"
+
+
+def test_break_hard_link(tmp_work_path):
+    pathlib.Path("source").write_text("contents")
+    os.chmod("source", 0o751)
+    os.link("source", "link")
+
+    file_utils.break_hard_link("link")
+    pathlib.Path("link").write_text("changed")
+
+    assert pathlib.Path("source").read_text() == "contents"
+    assert os.stat("source").st_nlink == 1
+    assert os.stat("link").st_mode & 0o777 == 0o751
+
+
+def test_break_hard_link_not_linked(tmp_work_path):
+    pathlib.Path("source").write_text("contents")
+    inode = os.stat("source").st_ino
+
+    file_utils.break_hard_link("source")
+
+    assert os.stat("source").st_ino == inode
+
+
+def test_break_hard_link_directory(tmp_work_path):
+    pathlib.Path("source", "sub").mkdir(parents=True)
+
+    file_utils.break_hard_link("source")
+
+    assert pathlib.Path("source", "sub").is_dir()
+
+
 class RequiresCommandSuccessTestCase(unit.TestCase):
     @mock.patch("subprocess.check_call")
     def test_requires_command_works(self, mock_check_call):
@@ -16,10 +16,11 @@
 
 import os
 import textwrap
+from unittest import mock
 
-from testtools.matchers import FileContains, FileExists, Not
+from testtools.matchers import Equals, FileContains
 
-from snapcraft.internal import mangling
+from snapcraft.internal import elf, errors, mangling
 from tests import fixture_setup, unit
 
 
@@ -153,6 +154,42 @@ class ManglingPythonShebangTestCase(unit.TestCase):
             ),
         )
 
+    def test_binary_contents_after_shebang(self):
+        os.makedirs("test-dir")
+        file_path = os.path.join("test-dir", "file")
+        with open(file_path, "wb") as f:
+            f.write(b"#!/usr/bin/python3\nPK\x03\x04\xff\x00")
+
+        mangling.rewrite_python_shebangs(os.path.dirname(file_path))
+
+        with open(file_path, "rb") as f:
+            self.assertThat(
+                f.read(), Equals(b"#!/usr/bin/env python3\nPK\x03\x04\xff\x00")
+            )
+
+    def test_no_shebang_not_rewritten(self):
+        file_path = _create_file("file", "# /usr/bin/python3\n")
+
+        self.assertThat(mangling.rewrite_python_shebang(file_path), Equals(False))
+        self.assertThat(file_path, FileContains("# /usr/bin/python3\n"))
+
+    def test_symlinks_not_followed(self):
+        file_path = _create_file("file", "#!/usr/bin/python3")
+        os.makedirs("other-dir")
+        os.symlink(os.path.abspath(file_path), os.path.join("other-dir", "link"))
+
+        mangling.rewrite_python_shebangs("other-dir")
+
+        self.assertThat(file_path, FileContains("#!/usr/bin/python3"))
+
+    def test_hard_links_not_rewritten(self):
+        file_path = _create_file("file", "#!/usr/bin/python3\n")
+        os.link(file_path, "link")
+
+        self.assertThat(mangling.rewrite_python_shebang(file_path), Equals(True))
+        self.assertThat(file_path, FileContains("#!/usr/bin/env python3\n"))
+        self.assertThat("link", FileContains("#!/usr/bin/python3\n"))
+
 
 class TestClearExecstack(unit.TestCase):
     def setUp(self):
@@ -164,20 +201,29 @@ class TestClearExecstack(unit.TestCase):
     def test_execstack_clears(self):
         elf_files = [self.fake_elf["fake_elf-with-execstack"]]
 
-        mangling.clear_execstack(elf_files=elf_files)
+        with mock.patch.object(elf.ElfFile, "clear_execstack") as clear_mock:
+            mangling.clear_execstack(elf_files=elf_files)
 
-        self.assertThat("{}.execstack".format(elf_files[0].path), FileExists())
+        clear_mock.assert_called_once_with()
 
     def test_bad_execstack_does_not_blow_up(self):
         elf_files = [self.fake_elf["fake_elf-with-bad-execstack"]]
 
-        mangling.clear_execstack(elf_files=elf_files)
+        with mock.patch.object(
+            elf.ElfFile,
+            "clear_execstack",
+            side_effect=errors.CorruptedElfFileError(
+                elf_files[0].path, Exception("bad program header")
+            ),
+        ) as clear_mock:
+            mangling.clear_execstack(elf_files=elf_files)
 
-        self.assertThat("{}.execstack".format(elf_files[0].path), Not(FileExists()))
+        clear_mock.assert_called_once_with()
 
     def test_no_execstack_does_nothing(self):
         elf_files = [self.fake_elf["fake_elf-2.23"]]
 
-        mangling.clear_execstack(elf_files=elf_files)
+        with mock.patch.object(elf.ElfFile, "clear_execstack") as clear_mock:
+            mangling.clear_execstack(elf_files=elf_files)
 
-        self.assertThat("{}.execstack".format(elf_files[0].path), Not(FileExists()))
+        clear_mock.assert_not_called()
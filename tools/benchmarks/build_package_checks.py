@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare build package checks with and without the shared host apt cache.
+
+Usage: build_package_checks.py [--parts N] [PACKAGE...]
+
+Every package is checked with Repo.build_package_is_valid and
+Repo.is_package_installed once per part, as loading a project does for the
+build packages of each part. Requires python-apt, on a Debian based host.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from snapcraft.internal.repo import _deb  # noqa: E402
+from snapcraft.internal.repo.apt_cache import AptCache  # noqa: E402
+
+
+def check_with_fresh_caches(packages):
+    """The checks as done before the host cache was shared."""
+    for package in packages:
+        with AptCache() as apt_cache:
+            apt_cache.is_package_valid(package)
+        with AptCache() as apt_cache:
+            apt_cache.get_installed_version(package)
+
+
+def check_with_shared_cache(packages):
+    for package in packages:
+        _deb.Ubuntu.build_package_is_valid(package)
+        _deb.Ubuntu.is_package_installed(package)
+
+
+def run(name, function, packages, parts):
+    start = time.monotonic()
+    for _ in range(parts):
+        function(packages)
+    elapsed = time.monotonic() - start
+    checks = 2 * len(packages) * parts
+    print(
+        "{:<8} {:8.2f}s {:10.2f}ms/check".format(name, elapsed, elapsed / checks * 1000)
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parts", type=int, default=10)
+    parser.add_argument("packages", nargs="*", default=["gcc", "make", "git"])
+    args = parser.parse_args()
+
+    before = run("fresh", check_with_fresh_caches, args.packages, args.parts)
+    after = run("shared", check_with_shared_cache, args.packages, args.parts)
+    print("Speedup: {:.1f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
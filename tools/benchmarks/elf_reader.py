@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the ELF reader of ElfFile with pyelftools.
+
+Usage: elf_reader.py [--repeat N] [DIR...]
+
+The ELF files found in DIR (the system library directories by default) are
+read with each implementation, checking they extract the same attributes.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from snapcraft.internal import elf  # noqa: E402
+from snapcraft.internal.elf import _reader  # noqa: E402
+
+
+def find_elf_files(directories):
+    paths = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                if not os.path.islink(path) and elf.ElfFile.is_elf(path):
+                    paths.append(path)
+    return paths
+
+
+def get_attributes(elf_file):
+    return (
+        elf_file.arch,
+        elf_file.interp,
+        elf_file.soname,
+        elf_file.rpath,
+        elf_file.runpath,
+        elf_file.versions,
+        {name: library.versions for name, library in elf_file.needed.items()},
+        elf_file.execstack_set,
+        elf_file.execstack_offset,
+        elf_file.build_id,
+        elf_file.has_debug_info,
+        elf_file.elf_type,
+    )
+
+
+def extract(path, method):
+    # Skip ElfFile.__init__, to time the extraction alone.
+    elf_file = elf.ElfFile.__new__(elf.ElfFile)
+    elf_file.path = path
+    elf_file.arch = None
+    elf_file.interp = ""
+    elf_file.soname = ""
+    elf_file.rpath = ""
+    elf_file.runpath = ""
+    elf_file.versions = set()
+    elf_file.needed = dict()
+    elf_file.execstack_set = False
+    elf_file.execstack_offset = None
+    elf_file.build_id = ""
+    elf_file.has_debug_info = False
+    elf_file.elf_type = "ET_NONE"
+    try:
+        getattr(elf_file, method)()
+    except Exception as error:
+        return type(error)
+    return get_attributes(elf_file)
+
+
+def run(name, paths, method, repeat):
+    start = time.monotonic()
+    for _ in range(repeat):
+        results = [extract(path, method) for path in paths]
+    elapsed = (time.monotonic() - start) / repeat
+    print(
+        "{:<12} {:8.3f}s {:8.1f}us/file".format(
+            name, elapsed, elapsed / max(len(paths), 1) * 10 ** 6
+        )
+    )
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "directories", nargs="*", default=["/lib", "/usr/lib", "/usr/bin"]
+    )
+    args = parser.parse_args()
+
+    paths = find_elf_files(args.directories)
+    unsupported = 0
+    for path in paths:
+        try:
+            _reader.read_attributes(path)
+        except _reader.UnsupportedLayout:
+            unsupported += 1
+    print(
+        "Reading {} ELF files ({} left to pyelftools)...".format(
+            len(paths), unsupported
+        )
+    )
+
+    before, expected = run(
+        "pyelftools", paths, "_extract_attributes_with_pyelftools", args.repeat
+    )
+    after, results = run("reader", paths, "_read_attributes", args.repeat)
+    print("Speedup: {:.1f}x".format(before / after))
+
+    mismatches = [p for p, e, r in zip(paths, expected, results) if e != r]
+    for path in mismatches:
+        print("Different attributes: {}".format(path))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
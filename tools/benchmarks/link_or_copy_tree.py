@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2021 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare file_utils.link_or_copy_tree with the os.walk based version.
+
+Usage: link_or_copy_tree.py [--files N] [--files-per-dir N] [--copy] [DIR]
+
+A tree of empty files is generated in DIR (a temporary directory by
+default), then linked (or copied, with --copy) with each implementation.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from snapcraft import file_utils  # noqa: E402
+
+
+def os_walk_link_or_copy_tree(source_tree, destination_tree, copy_function):
+    """The implementation link_or_copy_tree had before using os.scandir."""
+    file_utils.create_similar_directory(source_tree, destination_tree)
+    destination_basename = os.path.basename(destination_tree)
+
+    for root, directories, files in os.walk(source_tree, topdown=True):
+        if os.path.relpath(destination_tree, root) == destination_basename:
+            directories[:] = [d for d in directories if d != destination_basename]
+
+        for directory in directories:
+            source = os.path.join(root, directory)
+            if os.path.islink(source):
+                files.append(directory)
+                continue
+            destination = os.path.join(
+                destination_tree, os.path.relpath(source, source_tree)
+            )
+            file_utils.create_similar_directory(source, destination)
+
+        for file_name in files:
+            source = os.path.join(root, file_name)
+            destination = os.path.join(
+                destination_tree, os.path.relpath(source, source_tree)
+            )
+            copy_function(source, destination)
+
+
+def generate_tree(root, files, files_per_dir):
+    for i in range(files):
+        directory = os.path.join(
+            root,
+            "d{}".format(i // files_per_dir // 10),
+            "d{}".format(i // files_per_dir),
+        )
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, "f{}".format(i)), "w").close()
+
+
+def run(name, function, source, destination, copy_function):
+    shutil.rmtree(destination, ignore_errors=True)
+    start = time.monotonic()
+    function(source, destination, copy_function=copy_function)
+    elapsed = time.monotonic() - start
+    print("{:<12} {:8.2f}s".format(name, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--copy", action="store_true")
+    parser.add_argument("directory", nargs="?")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        source = os.path.join(work_dir, "source")
+        destination = os.path.join(work_dir, "destination")
+        print("Generating {} files...".format(args.files))
+        generate_tree(source, args.files, args.files_per_dir)
+
+        copy_function = file_utils.copy if args.copy else file_utils.link_or_copy
+        before = run(
+            "os.walk", os_walk_link_or_copy_tree, source, destination, copy_function
+        )
+        after = run(
+            "os.scandir",
+            file_utils.link_or_copy_tree,
+            source,
+            destination,
+            copy_function,
+        )
+        print("Speedup: {:.1f}x".format(before / after))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
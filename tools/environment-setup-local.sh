@@ -5,7 +5,6 @@ SNAPCRAFT_VIRTUAL_ENV_DIR=${SNAPCRAFT_VIRTUAL_ENV_DIR:=${HOME}/.venv/snapcraft}
 
 sudo apt update
 sudo apt install --yes \
-    execstack \
     g++ \
     gcc \
     intltool \